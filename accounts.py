@@ -0,0 +1,62 @@
+from time import monotonic
+from flask import current_app
+from flask_login import UserMixin
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from extensions import db
+from models import User
+
+USER_CACHE_TTL = 60  # seconds
+
+class SessionUser(UserMixin):
+    """What a request needs to know about the logged-in user, without the User row.
+
+    Load the User itself for anything beyond identity and the admin flag.
+    """
+
+    def __init__(self, id, username, is_admin):
+        self.id = id
+        self.username = username
+        self.is_admin = bool(is_admin)
+
+    def __repr__(self):
+        return f'<SessionUser {self.username}>'
+
+# Per-process cache: {user id: (SessionUser or None, expiry)}
+_user_cache = {}
+
+def load_session_user(user_id):
+    """Identity of a logged-in user, from the cache or one primary key lookup.
+
+    Changes to a User row committed in this process drop its entry right
+    away; other worker processes see them within USER_CACHE_TTL seconds.
+    """
+    now = monotonic()
+    hit = _user_cache.get(user_id)
+    if hit and hit[1] > now:
+        return hit[0]
+    row = db.session.query(User.id, User.username, User.is_admin).filter(User.id == user_id).first()
+    user = SessionUser(*row) if row else None
+    ttl = current_app.config.get('USER_CACHE_TTL', USER_CACHE_TTL)
+    _user_cache[user_id] = (user, now + ttl)
+    return user
+
+def forget_users(*user_ids):
+    for user_id in user_ids:
+        _user_cache.pop(user_id, None)
+
+@event.listens_for(Session, 'after_flush')
+def collect_changed_users(session, flush_context):
+    changed = [obj.id for obj in list(session.dirty) + list(session.deleted) if isinstance(obj, User)]
+    if changed:
+        session.info.setdefault('users_changed', set()).update(changed)
+
+@event.listens_for(Session, 'after_commit')
+def forget_changed_users(session):
+    changed = session.info.pop('users_changed', None)
+    if changed:
+        forget_users(*changed)
+
+@event.listens_for(Session, 'after_rollback')
+def discard_changed_users(session):
+    session.info.pop('users_changed', None)
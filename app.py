@@ -1,7 +1,12 @@
 from flask import Flask
-from extensions import db, login_manager, migrate, csrf
-from flask_migrate import Migrate
-from datetime import datetime, timedelta
+from extensions import db, login_manager, migrate, csrf, cache
+from engine_profile import configure_engine_profile, install_engine_profile, log_engine_profile
+from instrumentation import install_instrumentation
+from metrics import install_metrics
+from http_cache import install_http_cache
+from compression import install_compression
+from template_cache import install_template_cache
+from datetime import datetime
 import os
 from dotenv import load_dotenv
 import logging
@@ -17,64 +22,84 @@ logger = logging.getLogger(__name__)
 # Load environment variables
 load_dotenv()
 
-def create_app():
+def create_app(config_class=None):
+    if config_class is None:
+        # Imported here so values from .env are already in the environment
+        from config import Config as config_class
+    
     app = Flask(__name__)
     
-    # Configuration
-    app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev')
-    app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(minutes=60)
-    app.config['SESSION_COOKIE_SECURE'] = True
-    app.config['SESSION_COOKIE_HTTPONLY'] = True
-    app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
-    app.config['WTF_CSRF_TIME_LIMIT'] = 3600  # 1 hour
-    app.config['WTF_CSRF_SSL_STRICT'] = False  # Added for testing
+    # Configuration, including SQLALCHEMY_DATABASE_URI / DATABASE_URL
+    app.config.from_object(config_class)
+    
+    # Engine options for the selected database profile
+    configure_engine_profile(app)
     
-    # Database configuration
-    db_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'pharmacy.db')
-    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
-    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    # Request, pool and cache metrics; picks the pool class, so before the engine exists
+    install_metrics(app)
     
     # Initialize extensions
     db.init_app(app)
     login_manager.init_app(app)
     csrf.init_app(app)
+    cache.init_app(app)
     
-    # Initialize Flask-Migrate
-    migrate.init_app(app, db)
+    # Initialize Flask-Migrate; batch mode lets SQLite migrations alter columns
+    migrate.init_app(app, db, render_as_batch=True)
     
-    with app.app_context():
-        # Import models to ensure they're known to Flask-SQLAlchemy
-        from models import User
-        
-        # Import routes here to avoid circular imports
-        from routes.main import main as main_blueprint
-        from routes.auth import auth as auth_blueprint
-        
-        # Register blueprints
-        app.register_blueprint(main_blueprint)
-        app.register_blueprint(auth_blueprint)
-        
-        # Ensure database exists
-        if not os.path.exists('instance'):
-            os.makedirs('instance')
-            
-        # Create database and tables
-        db.create_all()
-            
-        # Create admin user if it doesn't exist
-        admin = User.query.filter_by(username='admin').first()
-        if not admin:
-            admin = User(
-                username='admin',
-                email='admin@pharmacy.com',
-                is_admin=True
-            )
-            admin.set_password('admin123')
-            db.session.add(admin)
-            db.session.commit()
-            logger.info("Admin user created")
-        else:
-            logger.info("Admin user already exists")
+    # Per-connection settings and fork safety for the engine
+    install_engine_profile(app)
+    
+    # Request timings; before the routes so its after_request hook runs after theirs
+    install_instrumentation(app)
+    
+    # Import models so they're known to Flask-SQLAlchemy, then the CLI
+    # groups and routes. Nothing here touches the database or the disk:
+    # schema, admin user and directories are set up by `flask bootstrap`.
+    import models
+    from bootstrap import bootstrap_cli
+    from search import search_cli
+    from counters import counters_cli
+    from ledger import stock_cli
+    from rollups import reports_cli
+    from reorder import reorder_cli
+    from expiry import expiry_cli
+    from catalog_import import import_cli
+    from exports import export_cli
+    from datagen import data_cli
+    from jobs import jobs_cli
+    
+    # Import routes here to avoid circular imports
+    from routes.main import main as main_blueprint
+    from routes.auth import auth as auth_blueprint
+    from routes.api import api as api_blueprint
+    from routes.api_v1 import api_v1 as api_v1_blueprint
+    from routes.reports import reports as reports_blueprint
+    from routes.metrics import metrics as metrics_blueprint
+    
+    # Register blueprints
+    app.register_blueprint(main_blueprint)
+    app.register_blueprint(auth_blueprint)
+    app.register_blueprint(api_blueprint)
+    app.register_blueprint(api_v1_blueprint)
+    app.register_blueprint(reports_blueprint)
+    app.register_blueprint(metrics_blueprint)
+    
+    # Register CLI command groups
+    app.cli.add_command(bootstrap_cli)
+    app.cli.add_command(search_cli)
+    app.cli.add_command(counters_cli)
+    app.cli.add_command(stock_cli)
+    app.cli.add_command(reports_cli)
+    app.cli.add_command(reorder_cli)
+    app.cli.add_command(expiry_cli)
+    app.cli.add_command(import_cli)
+    app.cli.add_command(export_cli)
+    app.cli.add_command(data_cli)
+    app.cli.add_command(jobs_cli)
+    
+    # Bytecode cache for compiled templates and helpers for {% cache %} fragments
+    install_template_cache(app)
     
     # Template filters
     @app.template_filter('current_year')
@@ -87,9 +112,8 @@ def create_app():
             return datetime.now()
         return dict(now=now)
     
-    if not app.debug:
-        if not os.path.exists('logs'):
-            os.mkdir('logs')
+    # The log directory is created by `flask bootstrap dirs`
+    if not app.debug and os.path.isdir('logs'):
         file_handler = RotatingFileHandler('logs/pharmacy.log', maxBytes=10240, backupCount=10)
         file_handler.setFormatter(logging.Formatter(
             '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'
@@ -99,20 +123,29 @@ def create_app():
         app.logger.setLevel(logging.INFO)
         app.logger.info('Pharmacy startup')
     
+    # Fingerprinted static URLs; pages opt into ETags with http_cache.render_conditional
+    install_http_cache(app)
+    
     @app.after_request
     def after_request(response):
-        response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
-        response.headers["Pragma"] = "no-cache"
-        response.headers["Expires"] = "0"
+        # Responses without a policy of their own (static files and ETag'd
+        # pages have one) are never stored
+        if 'Cache-Control' not in response.headers:
+            response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
+            response.headers["Pragma"] = "no-cache"
+            response.headers["Expires"] = "0"
         response.headers['X-Content-Type-Options'] = 'nosniff'
         response.headers['X-Frame-Options'] = 'SAMEORIGIN'
         response.headers['X-XSS-Protection'] = '1; mode=block'
         return response
     
+    # gzip/brotli around the whole app, so it sees the final headers
+    install_compression(app)
+    
     return app
 
-# Create the application instance
-app = create_app()
-
 if __name__ == '__main__':
-    app.run() 
\ No newline at end of file
+    app = create_app()
+    with app.app_context():
+        log_engine_profile(app)
+    app.run()
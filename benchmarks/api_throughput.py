@@ -0,0 +1,138 @@
+"""Throughput of the /api/v1 JSON API against the HTML routes POS clients scrape.
+
+Generates --rows of synthetic data and times each task --iterations
+times both ways through the test client: list pages against the API's
+cursor pages, looking up --batch medicines one edit form at a time
+against a single ?ids= request, and recording --batch checkout sales
+one form post at a time against a single bulk submission. Reports
+tasks per second, response bytes per task and the speed-up.
+
+    python benchmarks/api_throughput.py --rows 20000 --iterations 200 --batch 10
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from bootstrap import create_schema, seed_admin
+from config import Config
+from datagen import generate
+from extensions import db
+from models import Customer, Employee, Medicine
+
+def make_app(db_path):
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{db_path}'
+        DEBUG = False
+        WTF_CSRF_ENABLED = False
+        SESSION_COOKIE_SECURE = False
+        COMPRESSION = False  # bytes are compared before encoding
+    return create_app(BenchConfig)
+
+def gets(*paths):
+    def run(client, rng, ctx):
+        size = 0
+        for path in paths:
+            response = client.get(path(rng, ctx) if callable(path) else path)
+            assert response.status_code == 200, (path, response.status_code)
+            size += len(response.data)
+        return size
+    return run
+
+def lookup_pages(rng, ctx):
+    return [f'/medicines/{medicine_id}/edit' for medicine_id in rng.sample(ctx['medicines'], ctx['batch'])]
+
+def html_lookups(client, rng, ctx):
+    return gets(*lookup_pages(rng, ctx))(client, rng, ctx)
+
+def api_lookup(client, rng, ctx):
+    ids = ','.join(str(i) for i in rng.sample(ctx['medicines'], ctx['batch']))
+    return gets(f'/api/v1/medicines?ids={ids}&fields=name,price,stock_quantity')(client, rng, ctx)
+
+def _basket(rng, ctx):
+    return [(medicine_id, 1) for medicine_id in rng.sample(ctx['medicines'], 3)]
+
+def html_checkouts(client, rng, ctx):
+    size = 0
+    for _ in range(ctx['batch']):
+        data = {'customer_id': rng.choice(ctx['customers']), 'employee_id': rng.choice(ctx['employees']),
+                'sale_date': date.today().isoformat()}
+        for i, (medicine_id, quantity) in enumerate(_basket(rng, ctx)):
+            data[f'lines-{i}-medicine_id'] = medicine_id
+            data[f'lines-{i}-quantity'] = quantity
+        response = client.post('/sales/checkout', data=data)
+        assert response.status_code == 302, response.status_code
+        size += len(response.data)
+    return size
+
+def api_bulk_sales(client, rng, ctx):
+    sales = [{'customer_id': rng.choice(ctx['customers']), 'employee_id': rng.choice(ctx['employees']),
+              'items': [{'medicine_id': m, 'quantity': q} for m, q in _basket(rng, ctx)]}
+             for _ in range(ctx['batch'])]
+    response = client.post('/api/v1/sales/bulk', json={'sales': sales})
+    assert response.status_code == 200 and response.get_json()['rejected'] == 0, response.get_json()
+    return len(response.data)
+
+TASKS = (
+    ('medicine list', gets('/medicines'), gets('/api/v1/medicines?limit=10')),
+    ('customer list', gets('/customers'), gets('/api/v1/customers?limit=10')),
+    ('sale list', gets('/sales'), gets('/api/v1/sales?limit=10')),
+    ('prescription list', gets('/prescriptions'), gets('/api/v1/prescriptions?limit=10')),
+    ('medicine lookups', html_lookups, api_lookup),
+    ('checkout sales', html_checkouts, api_bulk_sales),
+)
+
+def measure(client, run, iterations, ctx, seed):
+    rng = random.Random(seed)
+    run(client, rng, ctx)  # warm up
+    size = 0
+    started = time.perf_counter()
+    for _ in range(iterations):
+        size += run(client, rng, ctx)
+    elapsed = time.perf_counter() - started
+    return iterations / elapsed, size / iterations
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--batch', type=int, default=10, help='lookups and sales per task')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix='api-bench-'), 'bench.db')
+    app = make_app(db_path)
+    with app.app_context():
+        create_schema()
+        seed_admin('admin', 'admin@example.com', 'admin123')
+        generate(args.rows, args.seed)
+        # Enough stock that neither side runs out, so both record every sale
+        db.session.query(Medicine).update({Medicine.stock_quantity: 10 ** 6}, synchronize_session=False)
+        db.session.commit()
+        ctx = {
+            'batch': args.batch,
+            'medicines': [i for (i,) in db.session.query(Medicine.id)],
+            'customers': [i for (i,) in db.session.query(Customer.id)],
+            'employees': [i for (i,) in db.session.query(Employee.id)],
+        }
+        db.session.remove()
+
+    client = app.test_client()
+    response = client.post('/auth/login', data={'username': 'admin', 'password': 'admin123'})
+    assert response.status_code == 302, 'login failed'
+
+    print(f"{'task':<20} {'html/s':>9} {'api/s':>9} {'speed-up':>9} {'html bytes':>11} {'api bytes':>10}")
+    for name, html, api in TASKS:
+        html_rate, html_bytes = measure(client, html, args.iterations, ctx, args.seed)
+        api_rate, api_bytes = measure(client, api, args.iterations, ctx, args.seed)
+        print(f'{name:<20} {html_rate:>9.1f} {api_rate:>9.1f} {api_rate / html_rate:>8.1f}x '
+              f'{html_bytes:>11.0f} {api_bytes:>10.0f}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""Checkout latency for small and large baskets.
+
+Times sales.create_itemised_sale for each basket size and, for
+comparison, the same basket recorded the old way as one single-medicine
+sale (and one commit) per line. Reports latency percentiles and the
+number of SQL statements per checkout, which should not grow with the
+basket size.
+
+    python benchmarks/checkout_latency.py --sizes 1 50 --rounds 200
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from extensions import db
+from tests.queries import count_queries
+from stock_contention import make_app
+
+def setup_database(app, medicines, stock):
+    from models import Customer, Employee, Medicine
+    with app.app_context():
+        db.create_all()
+        db.session.add(Customer(name='Bench Customer', email='bench@example.com',
+                                phone='1234567890', address='n/a'))
+        db.session.add(Employee(name='Bench Clerk', email='clerk@example.com',
+                                phone='1234567890', position='Clerk', hire_date=date.today()))
+        for i in range(medicines):
+            db.session.add(Medicine(name=f'Bench Medicine {i}', manufacturer='Bench', category='Bench',
+                                    price=1.0 + i % 20, stock_quantity=stock,
+                                    expiry_date=date.today() + timedelta(days=365)))
+        db.session.commit()
+
+def checkout(lines):
+    from inventory import run_with_lock_retry
+    from sales import create_itemised_sale
+    run_with_lock_retry(lambda: create_itemised_sale(1, 1, lines))
+
+def per_line_sales(lines):
+    from models import Medicine, Sale
+    from inventory import decrement_stock, run_with_lock_retry
+    for medicine_id, quantity in lines:
+        def record_sale():
+            medicine = db.session.get(Medicine, medicine_id)
+            decrement_stock(medicine_id, quantity)
+            db.session.add(Sale(customer_id=1, medicine_id=medicine_id, employee_id=1,
+                                quantity=quantity, unit_price=medicine.price,
+                                total_amount=medicine.price * quantity, sale_date=date.today()))
+        run_with_lock_retry(record_sale)
+
+def measure(app, record, size, rounds, medicines, rng):
+    timings = []
+    statements = []
+    with app.app_context():
+        for _ in range(rounds):
+            lines = [(medicine_id, rng.randint(1, 3)) for medicine_id in rng.sample(range(1, medicines + 1), size)]
+            with count_queries() as counter:
+                started = time.perf_counter()
+                record(lines)
+                timings.append((time.perf_counter() - started) * 1000)
+            statements.append(counter.count)
+        db.session.remove()
+    timings.sort()
+    return {
+        'p50': statistics.median(timings),
+        'p95': timings[int(len(timings) * 0.95) - 1],
+        'mean': statistics.fmean(timings),
+        'statements': max(statements),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1, 50], help='basket sizes to time')
+    parser.add_argument('--rounds', type=int, default=200, help='checkouts per basket size')
+    parser.add_argument('--medicines', type=int, default=200)
+    parser.add_argument('--db', help='SQLite file to use (default: a temporary file)')
+    parser.add_argument('--profile', default='sqlite', choices=['sqlite', 'default'])
+    parser.add_argument('--skip-per-line', action='store_true', help='only time the batched checkout')
+    args = parser.parse_args()
+
+    if max(args.sizes) > args.medicines:
+        parser.error('basket sizes cannot exceed --medicines')
+
+    db_path = args.db or os.path.join(tempfile.mkdtemp(prefix='checkout-bench-'), 'checkout.db')
+    app = make_app(db_path, args.profile)
+    # Enough stock that no round is rejected
+    setup_database(app, args.medicines, stock=3 * args.rounds * len(args.sizes) * 2)
+
+    modes = [('checkout', checkout)]
+    if not args.skip_per_line:
+        modes.append(('per-line', per_line_sales))
+
+    print(f"profile={args.profile} rounds={args.rounds} medicines={args.medicines}")
+    print(f"{'mode':<10} {'items':>5} {'p50 ms':>9} {'p95 ms':>9} {'mean ms':>9} {'statements':>10}")
+    for size in args.sizes:
+        for name, record in modes:
+            result = measure(app, record, size, args.rounds, args.medicines, random.Random(size))
+            print(f"{name:<10} {size:>5} {result['p50']:>9.2f} {result['p95']:>9.2f} "
+                  f"{result['mean']:>9.2f} {result['statements']:>10}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""Bytes on the wire and CPU cost of response compression, per route.
+
+Generates --rows of synthetic data, logs in as the admin and requests
+each route with no Accept-Encoding, then with gzip and (when the brotli
+package is installed) br. Reports the body size of each, the ratio to
+the identity size and the median CPU time per request, so the last
+column is what compression adds to a worker.
+
+    python benchmarks/compression.py --rows 20000 --requests 30 --level 6
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from bootstrap import create_schema, seed_admin
+from compression import brotli
+from config import Config
+from datagen import generate
+
+ROUTES = ('/', '/medicines', '/medicines/expiry', '/customers', '/sales', '/sales/new',
+          '/prescriptions/new', '/api/medicines/search?q=a', '/reports/export/sales',
+          '/static/css/style.css')
+
+def make_app(db_path, level, quality, min_size):
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{db_path}'
+        WTF_CSRF_ENABLED = False
+        SESSION_COOKIE_SECURE = False
+        COMPRESSION = True
+        COMPRESSION_LEVEL = level
+        COMPRESSION_BROTLI_QUALITY = quality
+        COMPRESSION_MIN_SIZE = min_size
+    return create_app(BenchConfig)
+
+def measure(client, route, encoding, count):
+    headers = {'Accept-Encoding': encoding} if encoding else {}
+    cpu = []
+    for _ in range(count):
+        started = time.process_time()
+        # buffered: exports are read to the end inside the request, as a server would
+        response = client.get(route, headers=headers, buffered=True)
+        cpu.append((time.process_time() - started) * 1000)
+        assert response.status_code == 200, (route, response.status_code)
+    served = response.headers.get('Content-Encoding')
+    assert served == encoding, (route, encoding, served)
+    return len(response.data), statistics.median(cpu)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--requests', type=int, default=30, help='requests per route and encoding')
+    parser.add_argument('--level', type=int, default=6, help='gzip level')
+    parser.add_argument('--quality', type=int, default=4, help='brotli quality')
+    parser.add_argument('--min-size', type=int, default=500)
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix='compression-bench-'), 'bench.db')
+    app = make_app(db_path, args.level, args.quality, args.min_size)
+    with app.app_context():
+        create_schema()
+        seed_admin('admin', 'admin@example.com', 'admin123')
+        generate(args.rows)
+    client = app.test_client()
+    response = client.post('/auth/login', data={'username': 'admin', 'password': 'admin123'})
+    assert response.status_code == 302, 'login failed'
+
+    encodings = [None, 'gzip'] + (['br'] if brotli is not None else [])
+    print(f"{'route':<28} {'encoding':<9} {'bytes':>9} {'ratio':>6} {'cpu ms':>8} {'+cpu ms':>8}")
+    totals = {encoding: 0 for encoding in encodings}
+    for route in ROUTES:
+        measure(client, route, None, 2)  # warm templates and statement caches
+        identity_size, identity_cpu = measure(client, route, None, args.requests)
+        totals[None] += identity_size
+        print(f"{route:<28} {'identity':<9} {identity_size:>9} {1:>6.2f} {identity_cpu:>8.2f}")
+        for encoding in encodings[1:]:
+            size, cpu = measure(client, route, encoding, args.requests)
+            totals[encoding] += size
+            print(f"{'':<28} {encoding:<9} {size:>9} {size / identity_size:>6.2f} {cpu:>8.2f} "
+                  f"{cpu - identity_cpu:>+8.2f}")
+    print()
+    for encoding, size in totals.items():
+        print(f"all routes {encoding or 'identity':<9} {size:>9} bytes ({size / totals[None]:.2f})")
+    if brotli is None:
+        print('brotli is not installed; only gzip was measured')
+
+if __name__ == '__main__':
+    main()
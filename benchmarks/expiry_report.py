@@ -0,0 +1,123 @@
+"""Expiry report latency on a large catalog.
+
+Loads --rows medicines with expiry dates spread from a year ago to two
+years ahead, then times what one report page costs: the bucket
+summary plus one keyset page per bucket, first page and a deep page.
+Fails if the p95 of any case is over --budget milliseconds. Also times
+the chunked `flask expiry flag` job.
+
+    python benchmarks/expiry_report.py --rows 200000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text
+from extensions import db
+from stock_contention import make_app
+
+INSERT_BATCH = 5000
+
+def load_catalog(rows, seed):
+    from models import Medicine
+    rng = random.Random(seed)
+    today = date.today()
+    now = datetime.utcnow()
+    table = Medicine.__table__
+    batch = []
+    for i in range(rows):
+        batch.append({
+            'name': f'Bench Medicine {i}',
+            'manufacturer': f'Maker {i % 50}',
+            'category': f'Category {i % 20}',
+            'price': 1.0,
+            'stock_quantity': rng.randint(0, 200),
+            'reorder_level': 10,
+            'needs_reorder': False,
+            'expiry_date': today + timedelta(days=rng.randint(-365, 730)),
+            'created_at': now,
+            'updated_at': now,
+        })
+        if len(batch) == INSERT_BATCH:
+            db.session.execute(table.insert(), batch)
+            batch = []
+    if batch:
+        db.session.execute(table.insert(), batch)
+    db.session.commit()
+    db.session.execute(text('ANALYZE'))
+    db.session.commit()
+
+def timed(fn, rounds):
+    timings = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return statistics.median(timings), timings[max(int(len(timings) * 0.95) - 1, 0)]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--rounds', type=int, default=50)
+    parser.add_argument('--budget', type=float, default=50.0, help='p95 limit in ms per report page')
+    parser.add_argument('--db', help='SQLite file to use (default: a temporary file)')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    from expiry import (EXPIRY_BUCKETS, EXPIRY_LIST_KEYS, EXPIRY_PAGE_SIZE,
+                        expiry_summary, expiry_query, flag_expiring_stock)
+    from pagination import keyset_paginate
+
+    db_path = args.db or os.path.join(tempfile.mkdtemp(prefix='expiry-bench-'), 'expiry.db')
+    app = make_app(db_path, 'sqlite')
+    with app.app_context():
+        db.create_all()
+        started = time.perf_counter()
+        load_catalog(args.rows, args.seed)
+        print(f"loaded {args.rows} medicines in {time.perf_counter() - started:.1f}s")
+
+        summary = expiry_summary()
+        print("buckets: " + ", ".join(f"{name}={count}" for name, count in summary.items()))
+
+        plan_query = expiry_query('30').limit(EXPIRY_PAGE_SIZE + 1)
+        compiled = plan_query.statement.compile(db.engine, compile_kwargs={'literal_binds': True})
+        for row in db.session.execute(text(f'EXPLAIN QUERY PLAN {compiled}')):
+            print(f"plan: {row[-1]}")
+
+        failed = False
+        print(f"{'case':<22} {'p50 ms':>8} {'p95 ms':>8}")
+        for name, _ in EXPIRY_BUCKETS:
+            # A cursor roughly half way through the bucket
+            deep = keyset_paginate(expiry_query(name), EXPIRY_LIST_KEYS,
+                                   per_page=max(summary[name] // 2, 1))
+            for label, cursor in (('first', None), ('deep', deep.next_cursor)):
+                def report_page():
+                    expiry_summary()
+                    keyset_paginate(expiry_query(name), EXPIRY_LIST_KEYS, cursor, per_page=EXPIRY_PAGE_SIZE)
+                p50, p95 = timed(report_page, args.rounds)
+                marker = '' if p95 <= args.budget else '  <- over budget'
+                failed = failed or p95 > args.budget
+                print(f"{name + ' ' + label:<22} {p50:>8.2f} {p95:>8.2f}{marker}")
+
+        started = time.perf_counter()
+        changed = flag_expiring_stock()
+        print(f"flag job: {changed} rows changed in {time.perf_counter() - started:.2f}s")
+        started = time.perf_counter()
+        changed = flag_expiring_stock()
+        print(f"flag job rerun: {changed} rows changed in {time.perf_counter() - started:.2f}s")
+
+    if failed:
+        print(f"FAIL: report over {args.budget} ms")
+        sys.exit(1)
+    print(f"OK: every report page under {args.budget} ms at p95")
+
+if __name__ == '__main__':
+    main()
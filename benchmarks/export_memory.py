@@ -0,0 +1,131 @@
+"""Memory use of a streaming sales export.
+
+Loads --rows sales, then downloads /reports/export/sales through the
+test client, reading the response chunk by chunk the way a WSGI server
+does. Private RSS (leaving out the mmapped database file) is sampled as
+the body streams. Fails if it grows by more than --budget MB over the
+level reached after the first chunk, as it would if rows were collected
+before being written.
+
+    python benchmarks/export_memory.py --rows 2000000 --format jsonl --gzip
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text
+from extensions import db, login_manager
+from models import Customer, Employee, Medicine, Sale
+from stock_contention import make_app
+
+INSERT_BATCH = 10000
+
+def rss_mb():
+    # Resident minus shared pages: SQLite's mmap of the database file
+    # shows up as shared, and is reclaimable page cache rather than heap
+    with open('/proc/self/statm') as f:
+        resident, shared = (int(value) for value in f.read().split()[1:3])
+    return (resident - shared) * os.sysconf('SC_PAGE_SIZE') / 1e6
+
+def load_sales(rows, seed):
+    rng = random.Random(seed)
+    today = date.today()
+    now = datetime.utcnow()
+    db.session.add(Customer(name='Bench Customer', email='bench@example.com',
+                            phone='1234567890', address='n/a'))
+    db.session.add(Employee(name='Bench Clerk', email='clerk@example.com',
+                            phone='1234567890', position='Clerk', hire_date=today))
+    for i in range(100):
+        db.session.add(Medicine(name=f'Bench Medicine {i}', manufacturer='Bench', category='Bench',
+                                price=1.0 + i % 20, stock_quantity=1000,
+                                expiry_date=today + timedelta(days=365)))
+    db.session.commit()
+
+    table = Sale.__table__
+    batch = []
+    for _ in range(rows):
+        quantity = rng.randint(1, 5)
+        price = rng.randint(1, 20) + 0.5
+        batch.append({
+            'customer_id': 1,
+            'employee_id': 1,
+            'medicine_id': rng.randint(1, 100),
+            'quantity': quantity,
+            'unit_price': price,
+            'total_amount': quantity * price,
+            'sale_date': today - timedelta(days=rng.randint(0, 729)),
+            'created_at': now,
+            'updated_at': now,
+        })
+        if len(batch) == INSERT_BATCH:
+            db.session.execute(table.insert(), batch)
+            batch = []
+    if batch:
+        db.session.execute(table.insert(), batch)
+    db.session.commit()
+    db.session.execute(text('ANALYZE'))
+    db.session.commit()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=2000000)
+    parser.add_argument('--format', choices=['csv', 'jsonl'], default='csv')
+    parser.add_argument('--gzip', action='store_true')
+    parser.add_argument('--days', type=int, help='only export the last N days (date-range filter)')
+    parser.add_argument('--budget', type=float, default=20.0, help='allowed RSS growth in MB')
+    parser.add_argument('--db', help='SQLite file to reuse (default: a temporary file)')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    from routes.reports import reports
+
+    db_path = args.db or os.path.join(tempfile.mkdtemp(prefix='export-bench-'), 'export.db')
+    app = make_app(db_path, 'sqlite')
+    app.config['LOGIN_DISABLED'] = True
+    login_manager.init_app(app)
+    app.register_blueprint(reports)
+
+    with app.app_context():
+        db.create_all()
+        if not db.session.query(Sale.id).first():
+            started = time.perf_counter()
+            load_sales(args.rows, args.seed)
+            print(f'loaded {args.rows} sales in {time.perf_counter() - started:.1f}s')
+        db.session.remove()
+
+    query = {'format': args.format}
+    if args.gzip:
+        query['gzip'] = 1
+    if args.days:
+        query['start'] = (date.today() - timedelta(days=args.days - 1)).isoformat()
+
+    client = app.test_client()
+    started = time.perf_counter()
+    response = client.get('/reports/export/sales', query_string=query, buffered=False)
+    body = iter(response.response)
+    size = len(next(body))
+    baseline = peak = rss_mb()
+    for i, chunk in enumerate(body):
+        size += len(chunk)
+        if i % 100 == 0:
+            peak = max(peak, rss_mb())
+    peak = max(peak, rss_mb())
+    response.close()
+    elapsed = time.perf_counter() - started
+
+    growth = peak - baseline
+    print(f'exported {size / 1e6:.1f} MB in {elapsed:.1f}s ({args.format}{", gzip" if args.gzip else ""})')
+    print(f'RSS after first chunk {baseline:.1f} MB, peak {peak:.1f} MB, growth {growth:.1f} MB')
+    if growth > args.budget:
+        print(f'FAIL: RSS grew more than {args.budget} MB')
+        sys.exit(1)
+    print('OK: memory flat while streaming')
+
+if __name__ == '__main__':
+    main()
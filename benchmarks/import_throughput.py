@@ -0,0 +1,124 @@
+"""Bulk catalog import throughput.
+
+Writes a --rows line price list to a temporary CSV file and streams it
+through catalog_import.import_medicines, then imports it again so every
+row is an update. For comparison, --baseline-rows of the same rows are
+added the way the medicine form does it, one ORM insert and commit per
+row. Reports rows per second and the peak Python memory of each import,
+which should not grow with the file size.
+
+    python benchmarks/import_throughput.py --rows 150000
+"""
+import argparse
+import csv
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from extensions import db
+from models import Medicine
+from catalog_import import import_medicines
+from stock_contention import make_app
+
+FIELDS = ('name', 'manufacturer', 'category', 'description', 'price',
+          'stock_quantity', 'reorder_level', 'expiry_date')
+
+def write_price_list(path, rows, seed, invalid_every=0):
+    rng = random.Random(seed)
+    today = date.today()
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(FIELDS)
+        for i in range(rows):
+            price = round(rng.uniform(0.5, 200), 2)
+            if invalid_every and i % invalid_every == 0:
+                price = -1
+            writer.writerow([
+                f'Import Medicine {i}',
+                f'Wholesaler {i % 40}',
+                f'Category {i % 25}',
+                f'Tablets, pack of {rng.randint(10, 100)}',
+                price,
+                rng.randint(0, 500),
+                rng.randint(5, 50),
+                (today + timedelta(days=rng.randint(1, 900))).isoformat(),
+            ])
+
+def timed_import(app, path, chunk_size):
+    with app.app_context(), open(path, encoding='utf-8', newline='') as stream, \
+            open(os.devnull, 'w') as errors:
+        tracemalloc.start()
+        started = time.perf_counter()
+        counts = import_medicines(stream, 'csv', chunk_size, errors)
+        elapsed = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        db.session.remove()
+    return counts, elapsed, peak
+
+def per_row_baseline(app, path, rows):
+    with app.app_context(), open(path, encoding='utf-8', newline='') as stream:
+        reader = csv.DictReader(stream)
+        started = time.perf_counter()
+        added = 0
+        for row in reader:
+            if added == rows:
+                break
+            if float(row['price']) < 0:
+                continue
+            db.session.add(Medicine(
+                name=f"Form {row['name']}",
+                manufacturer=row['manufacturer'],
+                category=row['category'],
+                description=row['description'],
+                price=float(row['price']),
+                stock_quantity=int(row['stock_quantity']),
+                reorder_level=int(row['reorder_level']),
+                expiry_date=date.fromisoformat(row['expiry_date'])
+            ))
+            db.session.commit()
+            added += 1
+        elapsed = time.perf_counter() - started
+        db.session.remove()
+    return elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=150000, help='rows in the price list')
+    parser.add_argument('--chunk-size', type=int, default=1000, help='rows per transaction')
+    parser.add_argument('--baseline-rows', type=int, default=2000,
+                        help='rows to insert one commit at a time for comparison (0 to skip)')
+    parser.add_argument('--invalid-every', type=int, default=1000,
+                        help='make every Nth row invalid (0 for none)')
+    parser.add_argument('--profile', default='sqlite', help='database engine profile')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='import-bench-') as workdir:
+        app = make_app(os.path.join(workdir, 'import.db'), args.profile)
+        with app.app_context():
+            db.create_all()
+        path = os.path.join(workdir, 'price_list.csv')
+        write_price_list(path, args.rows, args.seed, args.invalid_every)
+        size_mb = os.path.getsize(path) / 1e6
+        print(f'price list: {args.rows} rows, {size_mb:.1f} MB')
+
+        print(f"{'run':<16} {'rows/s':>10} {'seconds':>9} {'peak MB':>9}  result")
+        for label in ('insert', 'update'):
+            counts, elapsed, peak = timed_import(app, path, args.chunk_size)
+            print(f"{label:<16} {counts['rows'] / elapsed:>10.0f} {elapsed:>9.2f} {peak / 1e6:>9.1f}  "
+                  f"{counts['inserted']} new, {counts['updated']} updated, {counts['failed']} rejected")
+
+        if args.baseline_rows:
+            elapsed = per_row_baseline(app, path, args.baseline_rows)
+            print(f"{'per-row commit':<16} {args.baseline_rows / elapsed:>10.0f} {elapsed:>9.2f} {'':>9}  "
+                  f"{args.baseline_rows} rows through the ORM")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""Cost of request instrumentation (instrumentation.py) on real pages.
+
+Builds the app twice on the same database, once with INSTRUMENTATION off
+and once with it on, logs in as the admin on both and requests the same
+pages in alternating rounds. Reports the median time per request for
+each and the overhead, which should stay under 2%. With it off nothing
+is installed, so that column is the baseline.
+
+    python benchmarks/instrumentation_overhead.py --rounds 40 --requests 50
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from bootstrap import create_schema, seed_admin
+from config import Config
+from extensions import db
+from models import Medicine
+
+PAGES = ('/', '/medicines', '/medicines?page=3', '/reports/')
+
+def make_app(db_path, enabled):
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{db_path}'
+        CACHE_TYPE = 'NullCache'
+        WTF_CSRF_ENABLED = False
+        SESSION_COOKIE_SECURE = False
+        INSTRUMENTATION = enabled
+    return create_app(BenchConfig)
+
+def seed(app, medicines):
+    with app.app_context():
+        create_schema()
+        seed_admin('admin', 'admin@example.com', 'admin123')
+        if not db.session.query(Medicine.id).first():
+            for i in range(medicines):
+                db.session.add(Medicine(name=f'Bench Medicine {i:05d}', manufacturer='Bench',
+                                        category=f'Category {i % 10}', price=1.0 + i % 20,
+                                        stock_quantity=100, expiry_date=date.today() + timedelta(days=365)))
+            db.session.commit()
+        db.session.remove()
+
+def logged_in_client(app):
+    client = app.test_client()
+    response = client.post('/auth/login', data={'username': 'admin', 'password': 'admin123'})
+    assert response.status_code == 302, 'login failed'
+    return client
+
+def time_requests(client, count):
+    started = time.perf_counter()
+    for i in range(count):
+        response = client.get(PAGES[i % len(PAGES)])
+        assert response.status_code == 200, response.status_code
+    return (time.perf_counter() - started) * 1000 / count
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rounds', type=int, default=40)
+    parser.add_argument('--requests', type=int, default=50, help='requests per app per round')
+    parser.add_argument('--medicines', type=int, default=500)
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix='instrumentation-bench-'), 'bench.db')
+    off, on = make_app(db_path, False), make_app(db_path, True)
+    seed(off, args.medicines)
+    clients = {'off': logged_in_client(off), 'on': logged_in_client(on)}
+    for client in clients.values():
+        time_requests(client, len(PAGES))  # warm template and statement caches
+
+    timings = {'off': [], 'on': []}
+    for round_number in range(args.rounds):
+        # Alternate which app goes first so drift affects both alike
+        order = ('off', 'on') if round_number % 2 == 0 else ('on', 'off')
+        for label in order:
+            timings[label].append(time_requests(clients[label], args.requests))
+
+    # Each round's two runs are paired, which cancels most machine noise
+    overhead = statistics.median(on / off - 1 for on, off in zip(timings['on'], timings['off']))
+    print(f"instrumentation off  {statistics.median(timings['off']):7.3f} ms/request")
+    print(f"instrumentation on   {statistics.median(timings['on']):7.3f} ms/request")
+    print(f'overhead             {overhead * 100:+6.2f}% (median of paired rounds)')
+    response = clients['on'].get('/medicines')
+    print(f"Server-Timing: {response.headers['Server-Timing']}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,602 @@
+"""Load test for every main and auth route.
+
+Fills a fresh database with datagen.generate (or reuses --db), then runs
+a scenario per route and form submission, through the Flask test client
+or, with --gunicorn, over HTTP against a real server. For each scenario
+it reports p50/p95/p99 latency, SQL statements per request (from the
+Server-Timing header, see instrumentation.py) and throughput.
+
+--save writes the results as JSON. --compare checks them against a saved
+baseline and exits with status 1 if a scenario's p95 got slower by more
+than --threshold or it issues more statements than before. Compare runs
+made with the same options; the queries column is exact, latencies are
+only comparable on the same machine.
+
+    python benchmarks/load_test.py --rows 100000 --save baseline.json
+    python benchmarks/load_test.py --rows 100000 --compare baseline.json
+    python benchmarks/load_test.py --rows 100000 --gunicorn --workers 4 --concurrency 8
+"""
+import argparse
+import http.client
+import io
+import itertools
+import json
+import logging
+import math
+import os
+import platform
+import random
+import re
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import deque, namedtuple
+from datetime import date, datetime, timedelta
+from urllib.parse import urlencode
+from uuid import uuid4
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from bootstrap import create_schema, seed_admin
+from config import Config
+from datagen import generate, plan_counts
+from extensions import db
+from models import Medicine, Customer, Employee, Prescription, Sale
+from startup_time import free_port, ROOT
+
+ADMIN = {'username': 'loadtest', 'email': 'loadtest@example.com', 'password': 'loadtest-password'}
+
+# prepare(session, ctx, rng) returns (method, path, form data, files) for the
+# timed request; anything it sends itself is not timed. after() runs untimed.
+Scenario = namedtuple('Scenario', 'name endpoint prepare ok share anonymous after',
+                      defaults=((200,), 1.0, False, None))
+
+_TOKEN = re.compile(r'(?:name="csrf_token" type="hidden" value|name="csrf-token" content)="([^"]+)"')
+_QUERIES = re.compile(r'desc="(\d+) queries"')
+_ERRORS_LINK = re.compile(r'/medicines/import/errors/[0-9a-f]{32}\.csv')
+
+class ClientSession:
+    """A Flask test client with the same interface as HTTPSession"""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+        self.token = None
+
+    def request(self, method, path, data=None, files=None):
+        if files:
+            data = dict(data or {}, **{field: (io.BytesIO(content), filename)
+                                       for field, (filename, content) in files.items()})
+        response = self.client.open(path, method=method, data=data)
+        return response.status_code, response.headers, response.get_data()
+
+class HTTPSession:
+    """One keep-alive connection with its own cookies, like a browser tab"""
+
+    def __init__(self, port):
+        self.connection = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+        self.cookies = {}
+        self.token = None
+
+    def request(self, method, path, data=None, files=None):
+        headers = {}
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f'{name}={value}' for name, value in self.cookies.items())
+        body = None
+        if files:
+            body, headers['Content-Type'] = _multipart(data or {}, files)
+        elif data is not None:
+            body = urlencode(data)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        self.connection.request(method, path, body=body, headers=headers)
+        response = self.connection.getresponse()
+        payload = response.read()
+        for cookie in response.headers.get_all('Set-Cookie') or []:
+            name, _, rest = cookie.partition('=')
+            value = rest.split(';', 1)[0]
+            if 'Max-Age=0' in cookie or not value:
+                self.cookies.pop(name, None)
+            else:
+                self.cookies[name] = value
+        return response.status, response.headers, payload
+
+def _multipart(fields, files):
+    boundary = uuid4().hex
+    parts = [f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+             for name, value in fields.items()]
+    for field, (filename, content) in files.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{field}"; '
+                     f'filename="{filename}"\r\nContent-Type: text/csv\r\n\r\n'.encode() + content + b'\r\n')
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+def csrf_token(session, path='/auth/login'):
+    """The session's CSRF token, read once from a page that renders it"""
+    if session.token is None:
+        _, _, body = session.request('GET', path)
+        match = _TOKEN.search(body.decode('utf-8'))
+        if match is None:
+            raise RuntimeError(f'No CSRF token on {path}')
+        session.token = match.group(1)
+    return session.token
+
+def log_in(session):
+    status, _, _ = session.request('POST', '/auth/login', {
+        'username': ADMIN['username'], 'password': ADMIN['password'], 'csrf_token': csrf_token(session)})
+    if status != 302:
+        raise RuntimeError(f'Login failed with status {status}')
+
+class Context:
+    """What scenarios need to know about the data, shared by all threads"""
+
+    def __init__(self, counts, stocked, disposable, today):
+        self.counts = counts
+        self.stocked = stocked
+        self.disposable = disposable
+        self.today = today
+        self.sequence = itertools.count(1)
+        self.errors_path = None
+
+    def some(self, name, rng):
+        return rng.randint(1, self.counts[name])
+
+    def stocked_medicine(self, rng):
+        # Sales of out-of-stock medicines re-render the form instead of redirecting
+        return rng.choice(self.stocked)
+
+    def unique(self):
+        return next(self.sequence)
+
+def _medicine_form(ctx, n):
+    return {
+        'name': f'Load Test Medicine {n} {uuid4().hex[:6]}',
+        'description': 'Created by the load test',
+        'manufacturer': 'Load Labs',
+        'category': 'Analgesic',
+        'price': '9.99',
+        'stock_quantity': '100',
+        'reorder_level': '10',
+        'expiry_date': (ctx.today + timedelta(days=365)).isoformat(),
+    }
+
+def _person_form(kind, n, **extra):
+    return dict({
+        'name': f'Load Test {kind.title()} {n}',
+        'email': f'load-{kind}-{n}-{uuid4().hex[:6]}@example.com',
+        'phone': '5550001234',
+    }, **extra)
+
+def _get(path):
+    return lambda session, ctx, rng: ('GET', path(ctx, rng) if callable(path) else path, None, None)
+
+def _post(path, form=None, files=None):
+    def prepare(session, ctx, rng):
+        data = dict(form(ctx, rng) if form else {}, csrf_token=csrf_token(session, '/'))
+        return 'POST', path(ctx, rng) if callable(path) else path, data, files(ctx, rng) if files else None
+    return prepare
+
+def _delete(name, prefix):
+    def path(ctx, rng):
+        try:
+            return f'/{prefix}/{ctx.disposable[name].popleft()}/delete'
+        except IndexError:
+            raise RuntimeError(f'Ran out of disposable {name} rows') from None
+    return _post(path)
+
+def _import_csv(ctx, rng, bad_row=False):
+    rows = ['name,manufacturer,category,price,stock_quantity,reorder_level,expiry_date']
+    expiry = (ctx.today + timedelta(days=400)).isoformat()
+    rows += [f'Load Import {i},Load Labs,Supplement,{1 + i % 9}.50,{50 + i},10,{expiry}' for i in range(20)]
+    if bad_row:
+        rows.append('Broken Row,Load Labs,Supplement,not-a-price,1,1,2001-01-01')
+    return {'file': ('load-test.csv', '\n'.join(rows).encode('utf-8'))}
+
+def _anonymous_login(session, ctx, rng):
+    return 'POST', '/auth/login', {'username': ADMIN['username'], 'password': ADMIN['password'],
+                                   'csrf_token': csrf_token(session)}, None
+
+def _log_out(session, ctx):
+    session.request('GET', '/auth/logout')
+
+def _logged_in_logout(session, ctx, rng):
+    log_in(session)
+    return 'GET', '/auth/logout', None, None
+
+def _registration(session, ctx, rng):
+    n = ctx.unique()
+    password = f'load-password-{n}'
+    return 'POST', '/auth/register', {
+        'username': f'load{n}{uuid4().hex[:6]}'[:20], 'email': f'load-user-{n}-{uuid4().hex[:6]}@example.com',
+        'password': password, 'password2': password, 'csrf_token': csrf_token(session, '/auth/register')}, None
+
+def scenarios():
+    today_form = lambda ctx: ctx.today.isoformat()
+    return [
+        # auth: logins and registrations hash a password on purpose, so fewer of them
+        Scenario('login_page', 'auth.login', _get('/auth/login'), anonymous=True),
+        Scenario('login', 'auth.login', _anonymous_login, ok=(302,), share=0.1, anonymous=True, after=_log_out),
+        Scenario('register_page', 'auth.register', _get('/auth/register'), anonymous=True),
+        Scenario('register', 'auth.register', _registration, ok=(302,), share=0.1, anonymous=True),
+        Scenario('logout', 'auth.logout', _logged_in_logout, ok=(302,), share=0.1, anonymous=True),
+
+        Scenario('dashboard', 'main.index', _get('/')),
+        Scenario('medicines', 'main.medicines', _get('/medicines')),
+        Scenario('medicines_search', 'main.medicines', _get('/medicines?search=amoxicillin')),
+        Scenario('medicines_category', 'main.medicines', _get('/medicines?category=Antibiotic')),
+        Scenario('reorder_queue', 'main.reorder_queue', _get('/medicines/reorder')),
+        Scenario('expiry_report', 'main.expiry_report', _get('/medicines/expiry')),
+        Scenario('medicine_new_form', 'main.new_medicine', _get('/medicines/new')),
+        Scenario('medicine_create', 'main.new_medicine',
+                 _post('/medicines/new', lambda ctx, rng: _medicine_form(ctx, ctx.unique())), ok=(302,)),
+        Scenario('medicine_edit_form', 'main.edit_medicine',
+                 _get(lambda ctx, rng: f"/medicines/{ctx.some('medicine', rng)}/edit")),
+        Scenario('medicine_update', 'main.edit_medicine',
+                 _post(lambda ctx, rng: f"/medicines/{ctx.some('medicine', rng)}/edit",
+                       lambda ctx, rng: _medicine_form(ctx, ctx.unique())), ok=(302,)),
+        Scenario('medicine_delete', 'main.delete_medicine', _delete('medicine', 'medicines'), ok=(302,)),
+        Scenario('import_form', 'main.import_medicines_upload', _get('/medicines/import')),
+        Scenario('import_upload', 'main.import_medicines_upload',
+                 _post('/medicines/import', files=_import_csv), share=0.2),
+        Scenario('import_errors', 'main.import_errors', _get(lambda ctx, rng: ctx.errors_path)),
+
+        Scenario('customers', 'main.customers', _get('/customers')),
+        Scenario('customers_search', 'main.customers', _get('/customers?search=Patel')),
+        Scenario('customer_new_form', 'main.new_customer', _get('/customers/new')),
+        Scenario('customer_create', 'main.new_customer',
+                 _post('/customers/new', lambda ctx, rng: _person_form(
+                     'customer', ctx.unique(), address='1 Load Street')), ok=(302,)),
+        Scenario('customer_edit_form', 'main.edit_customer',
+                 _get(lambda ctx, rng: f"/customers/{ctx.some('customer', rng)}/edit")),
+        Scenario('customer_update', 'main.edit_customer',
+                 _post(lambda ctx, rng: f"/customers/{ctx.some('customer', rng)}/edit",
+                       lambda ctx, rng: _person_form('customer', ctx.unique(), address='2 Load Street')),
+                 ok=(302,)),
+        Scenario('customer_delete', 'main.delete_customer', _delete('customer', 'customers'), ok=(302,)),
+
+        Scenario('employees', 'main.employees', _get('/employees')),
+        Scenario('employee_new_form', 'main.new_employee', _get('/employees/new')),
+        Scenario('employee_create', 'main.new_employee',
+                 _post('/employees/new', lambda ctx, rng: _person_form(
+                     'employee', ctx.unique(), position='Cashier', hire_date=today_form(ctx))), ok=(302,)),
+        Scenario('employee_edit_form', 'main.edit_employee',
+                 _get(lambda ctx, rng: f"/employees/{ctx.some('employee', rng)}/edit")),
+        Scenario('employee_update', 'main.edit_employee',
+                 _post(lambda ctx, rng: f"/employees/{ctx.some('employee', rng)}/edit",
+                       lambda ctx, rng: _person_form('employee', ctx.unique(), position='Pharmacist',
+                                                     hire_date=today_form(ctx))), ok=(302,)),
+        Scenario('employee_delete', 'main.delete_employee', _delete('employee', 'employees'), ok=(302,)),
+
+        Scenario('prescriptions', 'main.prescriptions', _get('/prescriptions')),
+        Scenario('prescriptions_search', 'main.prescriptions', _get('/prescriptions?search=Okafor')),
+        Scenario('prescription_new_form', 'main.new_prescription', _get('/prescriptions/new')),
+        Scenario('prescription_create', 'main.new_prescription',
+                 _post('/prescriptions/new', lambda ctx, rng: {
+                     'customer_id': ctx.some('customer', rng), 'doctor_name': 'Dr. Load',
+                     'prescription_date': today_form(ctx), 'notes': 'Load test'}), ok=(302,)),
+        Scenario('prescription_edit_form', 'main.edit_prescription',
+                 _get(lambda ctx, rng: f"/prescriptions/{ctx.some('prescription', rng)}/edit")),
+        Scenario('prescription_update', 'main.edit_prescription',
+                 _post(lambda ctx, rng: f"/prescriptions/{ctx.some('prescription', rng)}/edit",
+                       lambda ctx, rng: {'customer_id': ctx.some('customer', rng), 'doctor_name': 'Dr. Load',
+                                         'prescription_date': today_form(ctx), 'notes': 'Edited'}), ok=(302,)),
+        Scenario('prescription_view', 'main.view_prescription',
+                 _get(lambda ctx, rng: f"/prescriptions/{ctx.some('prescription', rng)}/view")),
+        Scenario('prescription_delete', 'main.delete_prescription',
+                 _delete('prescription', 'prescriptions'), ok=(302,)),
+
+        Scenario('sales', 'main.sales', _get('/sales')),
+        Scenario('sales_search', 'main.sales', _get('/sales?search=Amoxi')),
+        Scenario('sale_new_form', 'main.new_sale', _get('/sales/new')),
+        Scenario('sale_create', 'main.new_sale',
+                 _post('/sales/new', lambda ctx, rng: {
+                     'customer_id': ctx.some('customer', rng), 'medicine_id': ctx.stocked_medicine(rng),
+                     'employee_id': ctx.some('employee', rng), 'quantity': 1,
+                     'sale_date': today_form(ctx)}), ok=(302,)),
+        Scenario('checkout_form', 'main.checkout', _get('/sales/checkout')),
+        Scenario('checkout', 'main.checkout',
+                 _post('/sales/checkout', lambda ctx, rng: dict({
+                     'customer_id': ctx.some('customer', rng), 'employee_id': ctx.some('employee', rng),
+                     'sale_date': today_form(ctx)}, **{
+                     f'lines-{i}-{field}': value
+                     for i, medicine_id in enumerate(rng.sample(ctx.stocked, 3))
+                     for field, value in (('medicine_id', medicine_id), ('quantity', 1))})), ok=(302,)),
+        Scenario('sale_edit_form', 'main.edit_sale',
+                 _get(lambda ctx, rng: f"/sales/{ctx.some('sale', rng)}/edit"), ok=(200, 302)),
+        Scenario('sale_update', 'main.edit_sale',
+                 _post(lambda ctx, rng: f"/sales/{ctx.some('sale', rng)}/edit",
+                       lambda ctx, rng: {'customer_id': ctx.some('customer', rng),
+                                         'medicine_id': ctx.stocked_medicine(rng),
+                                         'employee_id': ctx.some('employee', rng), 'quantity': 1,
+                                         'sale_date': today_form(ctx)}), ok=(302,)),
+        Scenario('sale_view', 'main.view_sale', _get(lambda ctx, rng: f"/sales/{ctx.some('sale', rng)}/view")),
+        Scenario('sale_delete', 'main.delete_sale', _delete('sale', 'sales'), ok=(302,)),
+    ]
+
+def scenario_requests(scenario, requests):
+    return max(1, math.ceil(requests * scenario.share))
+
+def check_coverage(app, scenario_list):
+    """Endpoints of the main and auth blueprints that no scenario exercises"""
+    endpoints = {rule.endpoint for rule in app.url_map.iter_rules()
+                 if rule.endpoint.split('.')[0] in ('main', 'auth')}
+    return sorted(endpoints - {scenario.endpoint for scenario in scenario_list})
+
+def load_database(app, rows, seed, today):
+    with app.app_context():
+        create_schema()
+        seed_admin(ADMIN['username'], ADMIN['email'], ADMIN['password'])
+        if db.session.query(Medicine.id).first() is None:
+            started = time.perf_counter()
+            written = generate(rows, seed, today)
+            print(f'generated {sum(written.values())} rows in {time.perf_counter() - started:.1f}s')
+        db.session.remove()
+
+def make_disposable(app, needed):
+    """Rows for the delete scenarios to remove, created through the ORM so every hook runs"""
+    from inventory import decrement_stock
+    from rollups import apply_sale
+    tag = uuid4().hex[:8]
+    disposable = {}
+    with app.app_context():
+        rows = {
+            'medicine': [Medicine(name=f'Disposable {tag} {i}', manufacturer='Load Labs', category='Supplement',
+                                  price=1.0, stock_quantity=5, expiry_date=date.today() + timedelta(days=365))
+                         for i in range(needed['medicine'])],
+            'customer': [Customer(name=f'Disposable {i}', email=f'disposable-{tag}-{i}@example.com',
+                                  phone='5550001234', address='n/a') for i in range(needed['customer'])],
+            'employee': [Employee(name=f'Disposable {i}', email=f'disposable-{tag}-{i}@example.com',
+                                  phone='5550001234', position='Cashier', hire_date=date.today())
+                         for i in range(needed['employee'])],
+            'prescription': [Prescription(customer_id=1, doctor_name='Dr. Disposable',
+                                          prescription_date=date.today()) for _ in range(needed['prescription'])],
+        }
+        for objects in rows.values():
+            db.session.add_all(objects)
+        db.session.commit()
+        disposable = {name: deque(obj.id for obj in objects) for name, objects in rows.items()}
+        sales = deque()
+        for _ in range(needed['sale']):
+            medicine = db.session.query(Medicine).filter(Medicine.stock_quantity > 10).first()
+            sale = Sale(customer_id=1, employee_id=1, medicine_id=medicine.id, quantity=1,
+                        unit_price=medicine.price, total_amount=medicine.price, sale_date=date.today())
+            db.session.add(sale)
+            db.session.flush()
+            decrement_stock(medicine.id, 1, sale_id=sale.id)
+            apply_sale(sale.id)
+            sales.append(sale.id)
+        db.session.commit()
+        disposable['sale'] = sales
+        db.session.remove()
+    return disposable
+
+def run_scenario(scenario, ctx, sessions, count, seed):
+    """Run ``count`` timed requests spread over the given (user, anonymous) session pairs"""
+    results = []
+    lock = threading.Lock()
+    shares = [count // len(sessions) + (1 if i < count % len(sessions) else 0) for i in range(len(sessions))]
+
+    def worker(index):
+        user, anonymous = sessions[index]
+        session = anonymous if scenario.anonymous else user
+        rng = random.Random(f'{seed}-{scenario.name}-{index}')
+        local = []
+        for _ in range(shares[index]):
+            method, path, data, files = scenario.prepare(session, ctx, rng)
+            started = time.perf_counter()
+            status, headers, _ = session.request(method, path, data, files)
+            elapsed = time.perf_counter() - started
+            match = _QUERIES.search(headers.get('Server-Timing') or '')
+            local.append((elapsed, int(match.group(1)) if match else None, status in scenario.ok, status))
+            if scenario.after:
+                scenario.after(session, ctx)
+        with lock:
+            results.extend(local)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(len(sessions)) if shares[i]]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, time.perf_counter() - started
+
+def summarize(results, wall):
+    timings = sorted(elapsed * 1000 for elapsed, _, _, _ in results)
+    if len(timings) > 1:
+        cuts = statistics.quantiles(timings, n=100, method='inclusive')
+        p50, p95, p99 = cuts[49], cuts[94], cuts[98]
+    else:
+        p50 = p95 = p99 = timings[0]
+    queries = [q for _, q, _, _ in results if q is not None]
+    return {
+        'requests': len(results),
+        'errors': sum(1 for _, _, ok, _ in results if not ok),
+        'statuses': sorted({status for _, _, _, status in results}),
+        'p50_ms': round(p50, 3),
+        'p95_ms': round(p95, 3),
+        'p99_ms': round(p99, 3),
+        'queries': round(statistics.mean(queries), 2) if queries else None,
+        'throughput': round(len(results) / wall, 1),
+    }
+
+def compare(results, baseline, threshold):
+    """Print the change per scenario; return the names that regressed"""
+    regressions = []
+    print()
+    print(f"{'scenario':<24} {'p95 then':>9} {'p95 now':>9} {'change':>8} {'queries':>13}")
+    for name, now in results['scenarios'].items():
+        then = baseline['scenarios'].get(name)
+        if then is None:
+            print(f'{name:<24} {"(new)":>9}')
+            continue
+        change = now['p95_ms'] / then['p95_ms'] - 1 if then['p95_ms'] else 0
+        slower = change > threshold and now['p95_ms'] - then['p95_ms'] > 1.0
+        more_queries = (now['queries'] or 0) > (then['queries'] or 0) + 0.5
+        flag = '  <- regression' if slower or more_queries else ''
+        print(f"{name:<24} {then['p95_ms']:>9.2f} {now['p95_ms']:>9.2f} {change * 100:>+7.1f}% "
+              f"{then['queries']!s:>6}->{now['queries']!s:<6}{flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def start_gunicorn(db_path, workers):
+    port = free_port()
+    env = dict(os.environ, DATABASE_URL=f'sqlite:///{db_path}', SESSION_COOKIE_SECURE='false',
+               INSTRUMENTATION='true', SLOW_QUERY_MS='60000', SLOW_REQUEST_MS='60000', PYTHONPATH=ROOT)
+    server = subprocess.Popen([sys.executable, '-m', 'gunicorn', '--workers', str(workers),
+                               '--bind', f'127.0.0.1:{port}', 'wsgi:app'],
+                              cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            connection.request('GET', '/auth/login')
+            if connection.getresponse().status == 200:
+                return server, port
+        except OSError:
+            time.sleep(0.1)
+    server.send_signal(signal.SIGTERM)
+    raise RuntimeError('gunicorn did not start')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000, help='rows to generate, 10k to 5M')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--db', help='SQLite file to use, generated if it does not exist yet '
+                                     '(write scenarios change it, so reuse it only for quick runs)')
+    parser.add_argument('--requests', type=int, default=100, help='timed requests per scenario')
+    parser.add_argument('--warmup', type=int, default=3, help='untimed requests per scenario first')
+    parser.add_argument('--only', nargs='+', help='run only these scenarios')
+    parser.add_argument('--gunicorn', action='store_true', help='drive a real gunicorn server over HTTP')
+    parser.add_argument('--workers', type=int, default=4, help='gunicorn workers')
+    parser.add_argument('--concurrency', type=int, default=4, help='concurrent clients (gunicorn only)')
+    parser.add_argument('--save', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='baseline JSON file to compare against')
+    parser.add_argument('--threshold', type=float, default=0.25, help='allowed p95 slowdown, as a fraction')
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    db_path = args.db or os.path.join(tempfile.mkdtemp(prefix='load-test-'), 'load.db')
+    today = date.today()
+
+    class LoadTestConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{db_path}'
+        SESSION_COOKIE_SECURE = False
+        INSTRUMENTATION = True
+        SLOW_QUERY_MS = 60000
+        SLOW_REQUEST_MS = 60000
+
+    app = create_app(LoadTestConfig)
+    load_database(app, args.rows, args.seed, today)
+    with app.app_context():
+        counts = {name: db.session.query(model.id).order_by(model.id.desc()).limit(1).scalar()
+                  for name, model in (('medicine', Medicine), ('customer', Customer), ('employee', Employee),
+                                      ('prescription', Prescription), ('sale', Sale))}
+        # Generated rows only, so edits and views never hit rows the deletes remove
+        counts = {name: min(count, plan_counts(args.rows)[name]) for name, count in counts.items()}
+        stocked = [row.id for row in db.session.query(Medicine.id).filter(
+            Medicine.id <= counts['medicine'], Medicine.stock_quantity >= 100)]
+        db.session.remove()
+
+    scenario_list = scenarios()
+    missing = check_coverage(app, scenario_list)
+    if missing:
+        print(f"warning: no scenario for {', '.join(missing)}")
+    if args.only:
+        scenario_list = [s for s in scenario_list if s.name in args.only]
+
+    needed = {name: 0 for name in counts}
+    for scenario in scenario_list:
+        if scenario.name.endswith('_delete'):
+            needed[scenario.name[:-len('_delete')]] += scenario_requests(scenario, args.requests) + args.warmup
+    ctx = Context(counts, stocked, make_disposable(app, needed), today)
+
+    server = None
+    if args.gunicorn:
+        server, port = start_gunicorn(db_path, args.workers)
+        new_session = lambda: HTTPSession(port)
+        clients = args.concurrency
+    else:
+        new_session = lambda: ClientSession(app)
+        clients = 1
+    try:
+        sessions = [(new_session(), new_session()) for _ in range(clients)]
+        for user, _ in sessions:
+            log_in(user)
+        # One upload with a rejected row gives import_errors a file to download
+        user = sessions[0][0]
+        _, _, body = user.request('POST', '/medicines/import', {'csrf_token': csrf_token(user, '/')},
+                                  _import_csv(ctx, None, bad_row=True))
+        match = _ERRORS_LINK.search(body.decode('utf-8'))
+        ctx.errors_path = match.group(0) if match else '/medicines/import/errors/missing.csv'
+
+        results = {
+            'meta': {
+                'created': datetime.utcnow().isoformat(timespec='seconds'),
+                'revision': git_revision(),
+                'python': platform.python_version(),
+                'mode': 'gunicorn' if args.gunicorn else 'test-client',
+                'workers': args.workers if args.gunicorn else None,
+                'concurrency': clients,
+                'rows': args.rows,
+                'seed': args.seed,
+                'requests': args.requests,
+            },
+            'scenarios': {},
+        }
+        print(f"{'scenario':<24} {'reqs':>5} {'err':>4} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+              f"{'queries':>8} {'req/s':>8}")
+        total_requests = 0
+        total_wall = 0.0
+        for scenario in scenario_list:
+            if args.warmup:
+                run_scenario(scenario, ctx, sessions[:1], args.warmup, f'{args.seed}-warmup')
+            count = scenario_requests(scenario, args.requests)
+            timed, wall = run_scenario(scenario, ctx, sessions, count, args.seed)
+            summary = summarize(timed, wall)
+            results['scenarios'][scenario.name] = summary
+            total_requests += summary['requests']
+            total_wall += wall
+            print(f"{scenario.name:<24} {summary['requests']:>5} {summary['errors']:>4} {summary['p50_ms']:>8.2f} "
+                  f"{summary['p95_ms']:>8.2f} {summary['p99_ms']:>8.2f} {summary['queries']!s:>8} "
+                  f"{summary['throughput']:>8.1f}")
+            if summary['errors']:
+                print(f"    unexpected status codes: {summary['statuses']}")
+        results['total'] = {'requests': total_requests, 'throughput': round(total_requests / total_wall, 1)}
+        print(f'{total_requests} requests, {results["total"]["throughput"]} req/s overall')
+    finally:
+        if server is not None:
+            server.send_signal(signal.SIGTERM)
+            server.wait(timeout=30)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f'saved {args.save}')
+    status = 0
+    if any(summary['errors'] for summary in results['scenarios'].values()):
+        status = 1
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"FAIL: {len(regressions)} scenario(s) regressed: {', '.join(regressions)}")
+            status = 1
+        else:
+            print('OK: no regressions against the baseline')
+    sys.exit(status)
+
+if __name__ == '__main__':
+    main()
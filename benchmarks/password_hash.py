@@ -0,0 +1,82 @@
+"""Password hash cost and the per-request cost of resolving the logged-in user.
+
+Times one password check for each --iterations value, so
+PASSWORD_HASH_METHOD can be tuned to the hardware: a login should
+take long enough to slow down guessing but not so long that a few
+concurrent logins hold up a worker. Then counts the SQL statements
+and time spent loading the user for authenticated requests, with the
+per-process user cache cold and warm.
+
+    python benchmarks/password_hash.py --iterations 100000 260000 600000
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from extensions import db
+from models import User
+from tests.queries import count_queries
+from stock_contention import make_app
+
+def time_checks(method, rounds):
+    from werkzeug.security import generate_password_hash, check_password_hash
+    password_hash = generate_password_hash('correct horse battery staple', method=method)
+    timings = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        check_password_hash(password_hash, 'correct horse battery staple')
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+def time_user_loads(app, rounds):
+    import accounts
+    with app.app_context():
+        db.create_all()
+        user = User(username='bench', email='bench@example.com')
+        user.set_password('secret')
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+        db.session.remove()
+
+        results = {}
+        for label, clear in (('cold', True), ('warm', False)):
+            statements = 0
+            started = time.perf_counter()
+            for _ in range(rounds):
+                if clear:
+                    accounts.forget_users(user_id)
+                with count_queries() as counter:
+                    accounts.load_session_user(user_id)
+                statements += counter.count
+            elapsed = (time.perf_counter() - started) * 1e6 / rounds
+            results[label] = (statements / rounds, elapsed)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--iterations', type=int, nargs='+', default=[100000, 260000, 600000],
+                        help='pbkdf2 iteration counts to time')
+    parser.add_argument('--hash', default='sha256', help='pbkdf2 digest')
+    parser.add_argument('--rounds', type=int, default=10, help='checks per setting')
+    parser.add_argument('--requests', type=int, default=2000, help='user loads per cache state')
+    args = parser.parse_args()
+
+    print(f"{'method':<28} {'check ms':>9}")
+    for iterations in args.iterations:
+        method = f'pbkdf2:{args.hash}:{iterations}'
+        print(f'{method:<28} {time_checks(method, args.rounds):>9.1f}')
+
+    app = make_app(os.path.join(tempfile.mkdtemp(prefix='auth-bench-'), 'auth.db'), 'sqlite')
+    print()
+    print(f"{'user load':<12} {'queries':>8} {'us/request':>11}")
+    for label, (statements, micros) in time_user_loads(app, args.requests).items():
+        print(f'{label:<12} {statements:>8.2f} {micros:>11.1f}')
+
+if __name__ == '__main__':
+    main()
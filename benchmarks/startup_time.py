@@ -0,0 +1,137 @@
+"""Worker startup cost: cold start and time to first request.
+
+Without --preload every gunicorn worker imports wsgi.py itself, so its
+boot time is the cold start measured here. Each round starts a fresh
+interpreter that imports the app, then serves one request through the
+test client. Run `flask bootstrap all` against the database first;
+workers no longer create the schema.
+
+With --gunicorn it also starts a real server with --workers, once
+without and once with preloading (GUNICORN_PRELOAD, see gunicorn.conf.py). For each it reports how long until the
+first response, and how long until every worker has answered at least
+once (responses carry the worker pid in a header added by this
+harness's gunicorn config).
+
+    python benchmarks/startup_time.py --rounds 5 --gunicorn --workers 4
+"""
+import argparse
+import json
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = r'''
+import json, time
+started = time.perf_counter()
+from wsgi import app
+imported = time.perf_counter()
+response = app.test_client().get('/auth/login')
+served = time.perf_counter()
+print(json.dumps({"import": imported - started, "first_request": served - imported,
+                  "status": response.status_code}))
+'''
+
+# Tags each response with the worker pid so the harness can tell workers apart
+GUNICORN_CONFIG = r'''
+import os
+from gunicorn_conf_base import *
+
+def post_worker_init(worker):
+    app = worker.wsgi
+
+    def tagged(environ, start_response):
+        def start(status, headers, *args):
+            return start_response(status, headers + [('X-Worker-Pid', str(os.getpid()))], *args)
+        return app(environ, start)
+
+    worker.wsgi = tagged
+'''
+
+def environment(db_path):
+    env = dict(os.environ)
+    env['DATABASE_URL'] = f'sqlite:///{db_path}'
+    env['SESSION_COOKIE_SECURE'] = 'false'
+    env['FLASK_APP'] = 'app.py'
+    env['PYTHONPATH'] = ROOT
+    return env
+
+def probe(env):
+    result = subprocess.run([sys.executable, '-c', PROBE], cwd=ROOT, env=env,
+                            capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def serve(env, workers, preload, timeout=60):
+    port = free_port()
+    with tempfile.TemporaryDirectory() as config_dir:
+        with open(os.path.join(config_dir, 'gunicorn_conf_base.py'), 'w') as f:
+            f.write(open(os.path.join(ROOT, 'gunicorn.conf.py')).read())
+        config = os.path.join(config_dir, 'bench_conf.py')
+        with open(config, 'w') as f:
+            f.write(GUNICORN_CONFIG)
+        command = [sys.executable, '-m', 'gunicorn', '-c', config, '--workers', str(workers),
+                   '--bind', f'127.0.0.1:{port}', 'wsgi:app']
+        server_env = dict(env, PYTHONPATH=os.pathsep.join([config_dir, ROOT]),
+                          GUNICORN_PRELOAD='true' if preload else 'false')
+        started = time.perf_counter()
+        server = subprocess.Popen(command, cwd=ROOT, env=server_env,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        first = None
+        seen = set()
+        try:
+            while time.perf_counter() - started < timeout and len(seen) < workers:
+                try:
+                    with urllib.request.urlopen(f'http://127.0.0.1:{port}/auth/login', timeout=5) as response:
+                        seen.add(response.headers.get('X-Worker-Pid'))
+                        if first is None:
+                            first = time.perf_counter() - started
+                except OSError:
+                    time.sleep(0.01)
+            everyone = time.perf_counter() - started if len(seen) == workers else None
+        finally:
+            server.send_signal(signal.SIGTERM)
+            server.wait(timeout=30)
+    return first, everyone
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rounds', type=int, default=5, help='fresh interpreters to time')
+    parser.add_argument('--gunicorn', action='store_true', help='also time a real gunicorn server')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--db', help='SQLite file to use (default: a bootstrapped temporary file)')
+    args = parser.parse_args()
+
+    db_path = args.db or os.path.join(tempfile.mkdtemp(prefix='startup-bench-'), 'startup.db')
+    env = environment(db_path)
+    if not args.db:
+        subprocess.run([sys.executable, '-m', 'flask', 'bootstrap', 'all'], cwd=ROOT, env=env,
+                       check=True, capture_output=True)
+
+    results = [probe(env) for _ in range(args.rounds)]
+    for key in ('import', 'first_request'):
+        timings = [result[key] * 1000 for result in results]
+        print(f'{key:<16} median {statistics.median(timings):8.1f} ms   max {max(timings):8.1f} ms')
+    print(f"status           {sorted({result['status'] for result in results})}")
+
+    if args.gunicorn:
+        for preload in (False, True):
+            first, everyone = serve(env, args.workers, preload)
+            label = 'gunicorn --preload' if preload else 'gunicorn'
+            everyone = f'{everyone * 1000:.0f} ms' if everyone is not None else 'timed out'
+            first = f'{first * 1000:.0f} ms' if first is not None else 'timed out'
+            print(f'{label:<20} first response {first}, all {args.workers} workers answered {everyone}')
+
+if __name__ == '__main__':
+    main()
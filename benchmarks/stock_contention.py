@@ -0,0 +1,127 @@
+"""Concurrent sale stress test for the atomic stock updates in inventory.py.
+
+Several processes record sales against the same few medicines at once,
+each with its own engine, the way gunicorn workers do. Afterwards the
+remaining stock must equal the starting stock minus every quantity that
+was sold, and must never be negative.
+
+    python benchmarks/stock_contention.py --workers 8 --sales 500
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from sqlalchemy import func
+from sqlalchemy.exc import OperationalError
+from extensions import db, cache
+from engine_profile import configure_engine_profile, install_engine_profile
+
+def make_app(db_path, profile):
+    from config import Config
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
+    app.config['DATABASE_PROFILE'] = profile
+    app.config['CACHE_TYPE'] = 'NullCache'
+    configure_engine_profile(app)
+    db.init_app(app)
+    cache.init_app(app)
+    install_engine_profile(app)
+    return app
+
+def setup_database(db_path, profile, medicines, stock):
+    from models import Customer, Employee, Medicine
+    app = make_app(db_path, profile)
+    with app.app_context():
+        db.create_all()
+        db.session.add(Customer(name='Stress Customer', email='stress@example.com',
+                                phone='1234567890', address='n/a'))
+        db.session.add(Employee(name='Stress Clerk', email='clerk@example.com',
+                                phone='1234567890', position='Clerk', hire_date=date.today()))
+        for i in range(medicines):
+            db.session.add(Medicine(name=f'Stress Medicine {i}', manufacturer='Bench', category='Bench',
+                                    price=1.0, stock_quantity=stock,
+                                    expiry_date=date.today() + timedelta(days=365)))
+        db.session.commit()
+
+def run_worker(args):
+    db_path, profile, worker, sales, medicines, seed = args
+    from models import Sale
+    from inventory import decrement_stock, run_with_lock_retry, InsufficientStock
+
+    rng = random.Random(seed)
+    app = make_app(db_path, profile)
+    result = {'sold': 0, 'sales': 0, 'rejected': 0, 'errors': 0}
+    with app.app_context():
+        for _ in range(sales):
+            medicine_id = rng.randint(1, medicines)
+            quantity = rng.randint(1, 3)
+
+            def record_sale():
+                decrement_stock(medicine_id, quantity)
+                db.session.add(Sale(customer_id=1, medicine_id=medicine_id, employee_id=1,
+                                    quantity=quantity, unit_price=1.0, total_amount=float(quantity),
+                                    sale_date=date.today()))
+
+            try:
+                run_with_lock_retry(record_sale)
+                result['sold'] += quantity
+                result['sales'] += 1
+            except InsufficientStock:
+                result['rejected'] += 1
+            except OperationalError:
+                result['errors'] += 1
+        db.session.remove()
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--sales', type=int, default=500, help='sales attempted per worker')
+    parser.add_argument('--medicines', type=int, default=3)
+    parser.add_argument('--stock', type=int, default=1500, help='starting stock per medicine')
+    parser.add_argument('--db', help='SQLite file to use (default: a temporary file)')
+    parser.add_argument('--profile', default='sqlite', choices=['sqlite', 'default'],
+                        help="engine profile, 'default' runs without WAL and pragmas")
+    args = parser.parse_args()
+
+    db_path = args.db or os.path.join(tempfile.mkdtemp(prefix='stock-stress-'), 'stress.db')
+    setup_database(db_path, args.profile, args.medicines, args.stock)
+
+    jobs = [(db_path, args.profile, w, args.sales, args.medicines, w) for w in range(args.workers)]
+    started = time.perf_counter()
+    with multiprocessing.get_context('spawn').Pool(args.workers) as pool:
+        results = pool.map(run_worker, jobs)
+    elapsed = time.perf_counter() - started
+
+    totals = {key: sum(r[key] for r in results) for key in results[0]}
+    attempts = args.workers * args.sales
+
+    from models import Medicine, Sale
+    app = make_app(db_path, args.profile)
+    with app.app_context():
+        remaining = db.session.query(func.sum(Medicine.stock_quantity)).scalar()
+        negative = Medicine.query.filter(Medicine.stock_quantity < 0).count()
+        recorded = db.session.query(func.coalesce(func.sum(Sale.quantity), 0)).scalar()
+
+    expected = args.medicines * args.stock - totals['sold']
+    print(f"profile={args.profile} workers={args.workers} attempts={attempts} elapsed={elapsed:.2f}s")
+    print(f"sales={totals['sales']} rejected={totals['rejected']} errors={totals['errors']}")
+    print(f"throughput={attempts / elapsed:.1f} attempts/s, {totals['sales'] / elapsed:.1f} sales/s")
+    print(f"stock remaining={remaining} expected={expected} recorded_sold={recorded} negative_rows={negative}")
+
+    if remaining != expected or recorded != totals['sold'] or negative:
+        print("FAIL: stock drifted")
+        sys.exit(1)
+    print("OK: no stock drift")
+
+if __name__ == '__main__':
+    main()
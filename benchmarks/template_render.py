@@ -0,0 +1,103 @@
+"""Template compile and render time, before and after template caching.
+
+Compile: builds a fresh app --rounds times and times precompile_templates()
+with no bytecode cache (every template parsed and compiled, as a new
+worker used to do on its first requests) and with a warm
+TEMPLATE_BYTECODE_DIR (compiled code loaded from disk).
+
+Render: generates --rows of synthetic data, then requests the list pages
+--requests times each with fragment caching off (CACHE_TYPE=NullCache,
+so every {% cache %} block renders) and on (SimpleCache, warm). Reports
+the median template time from the Server-Timing header.
+
+    python benchmarks/template_render.py --rows 20000 --rounds 10 --requests 50
+"""
+import argparse
+import os
+import re
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from bootstrap import create_schema, seed_admin
+from config import Config
+from datagen import generate
+from template_cache import precompile_templates
+
+PAGES = ('/medicines', '/medicines?category=Antibiotic', '/sales', '/customers', '/sales/new')
+
+def make_app(db_path, bytecode_dir=None, cache_type='SimpleCache'):
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{db_path}'
+        DEBUG = False  # .env turns on debug, which reloads templates on every render
+        WTF_CSRF_ENABLED = False
+        SESSION_COOKIE_SECURE = False
+        INSTRUMENTATION = True
+        CACHE_TYPE = cache_type
+        TEMPLATE_BYTECODE_DIR = bytecode_dir
+    return create_app(BenchConfig)
+
+def compile_ms(db_path, bytecode_dir, rounds):
+    timings = []
+    for _ in range(rounds):
+        app = make_app(db_path, bytecode_dir)
+        started = time.perf_counter()
+        count = precompile_templates(app)
+        timings.append((time.perf_counter() - started) * 1000)
+    return count, statistics.median(timings)
+
+def template_ms(client, page, count):
+    timings = []
+    for _ in range(count):
+        response = client.get(page)
+        assert response.status_code == 200, (page, response.status_code)
+        timings.append(float(re.search(r'tpl;dur=([\d.]+)', response.headers['Server-Timing']).group(1)))
+    return statistics.median(timings)
+
+def logged_in_client(app):
+    client = app.test_client()
+    response = client.post('/auth/login', data={'username': 'admin', 'password': 'admin123'})
+    assert response.status_code == 302, 'login failed'
+    return client
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--rounds', type=int, default=10, help='fresh apps per compile measurement')
+    parser.add_argument('--requests', type=int, default=50, help='requests per page and mode')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='template-bench-')
+    db_path = os.path.join(directory, 'bench.db')
+    bytecode_dir = os.path.join(directory, 'jinja')
+    os.makedirs(bytecode_dir)
+
+    count, cold = compile_ms(db_path, None, args.rounds)
+    compile_ms(db_path, bytecode_dir, 1)  # fill the bytecode cache
+    _, warm = compile_ms(db_path, bytecode_dir, args.rounds)
+    print(f'compile {count} templates, no bytecode cache    {cold:8.2f} ms')
+    print(f'compile {count} templates, warm bytecode cache  {warm:8.2f} ms')
+    print()
+
+    app = make_app(db_path)
+    with app.app_context():
+        create_schema()
+        seed_admin('admin', 'admin@example.com', 'admin123')
+        generate(args.rows)
+    clients = {'off': logged_in_client(make_app(db_path, cache_type='NullCache')),
+               'on': logged_in_client(app)}
+    print(f"{'page':<32} {'fragments off':>14} {'fragments on':>13} {'change':>8}")
+    for page in PAGES:
+        results = {}
+        for label, client in clients.items():
+            template_ms(client, page, 2)  # compile, and fill the fragment cache
+            results[label] = template_ms(client, page, args.requests)
+        change = results['on'] / results['off'] - 1
+        print(f"{page:<32} {results['off']:>11.3f} ms {results['on']:>10.3f} ms {change * 100:>+7.1f}%")
+
+if __name__ == '__main__':
+    main()
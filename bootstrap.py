@@ -0,0 +1,94 @@
+import os
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from extensions import db
+from models import User
+from engine_profile import log_engine_profile
+from catalog import seed_versions
+from template_cache import bytecode_cache, precompile_templates
+
+bootstrap_cli = AppGroup('bootstrap', help='One-off setup: directories, schema, the admin user and templates.')
+
+def create_directories(app):
+    """Instance, log, cache, metrics and template directories. Returns the ones that were missing."""
+    paths = [app.instance_path, 'logs']
+    if app.config.get('CACHE_TYPE') == 'FileSystemCache' and app.config.get('CACHE_DIR'):
+        paths.append(app.config['CACHE_DIR'])
+    if app.config.get('METRICS'):
+        paths.append(app.config['METRICS_DIR'])
+    if app.config.get('TEMPLATE_BYTECODE_DIR'):
+        paths.append(app.config['TEMPLATE_BYTECODE_DIR'])
+    created = [path for path in paths if not os.path.isdir(path)]
+    for path in created:
+        os.makedirs(path, exist_ok=True)
+    return created
+
+def create_schema():
+    """Create missing tables (and the search index on SQLite) and catalog versions, then check the engine settings"""
+    db.create_all()
+    seed_versions()
+    log_engine_profile(current_app)
+
+def seed_admin(username, email, password):
+    """Create the admin user unless a user with that name exists. Returns True if created."""
+    if db.session.query(User.id).filter(User.username == username).first() is not None:
+        return False
+    admin = User(username=username, email=email, is_admin=True)
+    admin.set_password(password)
+    db.session.add(admin)
+    db.session.commit()
+    return True
+
+def _admin_options(command):
+    command = click.option('--username', default=lambda: os.environ.get('ADMIN_USERNAME', 'admin'),
+                           show_default='ADMIN_USERNAME or admin')(command)
+    command = click.option('--email', default=lambda: os.environ.get('ADMIN_EMAIL', 'admin@pharmacy.com'),
+                           show_default='ADMIN_EMAIL or admin@pharmacy.com')(command)
+    command = click.option('--password', default=lambda: os.environ.get('ADMIN_PASSWORD', 'admin123'),
+                           show_default='ADMIN_PASSWORD or admin123')(command)
+    return command
+
+@bootstrap_cli.command('dirs')
+def dirs_command():
+    """Create the instance, log and cache directories."""
+    for path in create_directories(current_app):
+        click.echo(f'Created {path}')
+
+@bootstrap_cli.command('schema')
+def schema_command():
+    """Create any missing tables."""
+    create_schema()
+    click.echo('Schema is up to date.')
+
+@bootstrap_cli.command('admin')
+@_admin_options
+def admin_command(username, email, password):
+    """Create the admin user if it does not exist."""
+    if seed_admin(username, email, password):
+        click.echo(f'Admin user {username} created.')
+    else:
+        click.echo(f'User {username} already exists.')
+
+@bootstrap_cli.command('templates')
+def templates_command():
+    """Compile every template into the bytecode cache."""
+    env = current_app.jinja_env
+    if env.bytecode_cache is None:
+        # The directory may only just have been created by `bootstrap all`
+        env.bytecode_cache = bytecode_cache(current_app)
+    count = precompile_templates(current_app)
+    if env.bytecode_cache is None:
+        click.echo(f'Compiled {count} templates; no bytecode cache, run `flask bootstrap dirs` first.')
+    else:
+        click.echo(f'Compiled {count} templates into {current_app.config["TEMPLATE_BYTECODE_DIR"]}.')
+
+@bootstrap_cli.command('all')
+@_admin_options
+@click.pass_context
+def all_command(ctx, username, email, password):
+    """Directories, schema, admin user and templates, in that order. Safe to run on every deploy."""
+    ctx.invoke(dirs_command)
+    ctx.invoke(schema_command)
+    ctx.invoke(admin_command, username=username, email=email, password=password)
+    ctx.invoke(templates_command)
@@ -0,0 +1,153 @@
+from collections import Counter
+from itertools import chain
+from flask import g, has_app_context, has_request_context
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from extensions import db, cache
+from metrics import CACHE_REQUESTS
+from models import Medicine, Customer, Employee, CatalogVersion
+
+CATALOG_TIMEOUT = 300  # seconds
+LOOKUP_TIMEOUT = 60  # seconds, lookups show live stock
+
+# Cached namespaces, invalidated whenever a row of the model is committed
+NAMESPACES = {
+    Medicine: 'medicine',
+    Customer: 'customer',
+    Employee: 'employee',
+}
+
+# Medicine stock levels, versioned apart from the rest of the medicine row:
+# every sale changes stock, and should not also throw away the categories
+# and other catalog data cached under 'medicine'
+STOCK_NAMESPACE = 'stock'
+STOCK_COLUMNS = ('stock_quantity', 'needs_reorder')
+
+ALL_NAMESPACES = tuple(sorted({*NAMESPACES.values(), STOCK_NAMESPACE}))
+
+# Per-process hit/miss counters by namespace
+cache_stats = {'hits': Counter(), 'misses': Counter()}
+
+def _read_versions():
+    return dict(db.session.query(CatalogVersion.namespace, CatalogVersion.version))
+
+def namespace_version(namespace):
+    """Current version token of a namespace.
+
+    Versions are counters in the catalog_version table, bumped in the same
+    transaction as the write, so every worker sees a commit whatever the
+    cache backend (SimpleCache is per process). They are read in one
+    query, at most once per request.
+    """
+    if not has_request_context():
+        return str(_read_versions().get(namespace, 0))
+    if 'catalog_versions' not in g:
+        g.catalog_versions = _read_versions()
+    return str(g.catalog_versions.get(namespace, 0))
+
+def seed_versions():
+    """Create the version row of every namespace that has none"""
+    existing = set(_read_versions())
+    db.session.add_all(CatalogVersion(namespace=namespace, version=0)
+                       for namespace in ALL_NAMESPACES if namespace not in existing)
+    db.session.commit()
+
+def invalidate(connection, *namespaces):
+    """Bump the versions of ``namespaces`` in the transaction of ``connection``"""
+    table = CatalogVersion.__table__
+    result = connection.execute(
+        table.update()
+        .where(table.c.namespace.in_(namespaces))
+        .values(version=table.c.version + 1)
+    )
+    if result.rowcount != len(namespaces):
+        # Rows are seeded by `flask bootstrap schema`; create any still missing
+        existing = {namespace for (namespace,) in connection.execute(
+            db.select(table.c.namespace).where(table.c.namespace.in_(namespaces)))}
+        connection.execute(table.insert(), [{'namespace': namespace, 'version': 1}
+                                            for namespace in namespaces if namespace not in existing])
+
+def cached_read(namespace, key, loader, timeout=CATALOG_TIMEOUT, depends_on=()):
+    """Read-through cache for catalog data; ``loader`` must not return None.
+
+    ``depends_on`` names further namespaces the data is built from, such
+    as 'stock' for anything showing stock levels.
+    """
+    versions = ':'.join(namespace_version(ns) for ns in (namespace, *depends_on))
+    full_key = f'catalog:{namespace}:{versions}:{key}'
+    value = cache.get(full_key)
+    if value is not None:
+        cache_stats['hits'][namespace] += 1
+        CACHE_REQUESTS.inc(namespace, 'hit')
+        return value
+    cache_stats['misses'][namespace] += 1
+    CACHE_REQUESTS.inc(namespace, 'miss')
+    value = loader()
+    cache.set(full_key, value, timeout=timeout)
+    return value
+
+def stats_snapshot():
+    snapshot = {}
+    for namespace in ALL_NAMESPACES:
+        hits = cache_stats['hits'][namespace]
+        misses = cache_stats['misses'][namespace]
+        total = hits + misses
+        snapshot[namespace] = {
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': round(hits / total, 4) if total else None,
+        }
+    return snapshot
+
+def mark_touched(session, *namespaces):
+    """Invalidate namespaces when ``session`` commits, for writes that bypass the ORM"""
+    session.info.setdefault('catalog_touched', set()).update(namespaces)
+
+def _medicine_namespaces(medicine):
+    """Namespaces an update of ``medicine`` invalidates, going by the columns it changed"""
+    state = inspect(medicine)
+    changed = {attr.key for attr in state.mapper.column_attrs if state.attrs[attr.key].history.has_changes()}
+    namespaces = set()
+    if changed & set(STOCK_COLUMNS):
+        namespaces.add(STOCK_NAMESPACE)
+    if changed - {*STOCK_COLUMNS, 'updated_at'}:
+        namespaces.add(NAMESPACES[Medicine])
+    return namespaces
+
+@event.listens_for(Session, 'after_flush')
+def collect_touched_namespaces(session, flush_context):
+    touched = session.info.setdefault('catalog_touched', set())
+    for obj in chain(session.new, session.deleted):
+        namespace = NAMESPACES.get(type(obj))
+        if namespace:
+            touched.add(namespace)
+    for obj in session.dirty:
+        if isinstance(obj, Medicine):
+            touched.update(_medicine_namespaces(obj))
+        elif type(obj) in NAMESPACES:
+            touched.add(NAMESPACES[type(obj)])
+
+@event.listens_for(Session, 'before_commit')
+def invalidate_touched_namespaces(session):
+    # Flush first so the last changes are collected; the version rows are
+    # then locked only for the rest of the commit
+    session.flush()
+    touched = session.info.pop('catalog_touched', None)
+    if touched:
+        invalidate(session.connection(), *sorted(touched))
+
+@event.listens_for(Session, 'after_commit')
+def forget_request_versions(session):
+    # g belongs to the app context, which can outlive a request
+    if has_app_context():
+        g.pop('catalog_versions', None)
+
+@event.listens_for(Session, 'after_rollback')
+def discard_touched_namespaces(session):
+    session.info.pop('catalog_touched', None)
+
+def medicine_categories():
+    return cached_read('medicine', 'categories', lambda: [
+        category for (category,) in
+        db.session.query(Medicine.category).distinct().order_by(Medicine.category)
+    ])
@@ -0,0 +1,276 @@
+import csv
+import io
+import json
+import os
+import time
+from datetime import date, datetime
+from itertools import islice
+import click
+from flask.cli import AppGroup
+from sqlalchemy import String, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+from extensions import db
+from models import Medicine
+from catalog import STOCK_NAMESPACE, mark_touched
+from counters import adjust_count
+from expiry import bucket_for
+from inventory import run_with_lock_retry
+from ledger import insert_movements
+from search import reindex_medicines
+
+IMPORT_CHUNK_SIZE = 1000
+
+IMPORT_FIELDS = ('name', 'manufacturer', 'category', 'description', 'price',
+                 'stock_quantity', 'reorder_level', 'expiry_date')
+REQUIRED_FIELDS = ('name', 'manufacturer', 'category', 'price', 'expiry_date')
+
+# Values for optional columns a row leaves out, used only when it inserts a
+# medicine. An existing medicine keeps its current value for those columns.
+INSERT_DEFAULTS = {'description': None, 'stock_quantity': 0, 'reorder_level': 10}
+
+# Columns an import always overwrites on an existing medicine, besides the
+# optional ones the row provides
+UPDATED_COLUMNS = ('category', 'price', 'expiry_date', 'needs_reorder', 'expiry_bucket', 'updated_at')
+
+# Stands in for the row in validators that compare against the current value
+_NEW_MEDICINE = Medicine()
+
+import_cli = AppGroup('import', help='Bulk data import.')
+
+def import_format(filename):
+    """'jsonl' for .jsonl/.ndjson files, 'csv' for everything else"""
+    return 'jsonl' if os.path.splitext(filename)[1].lower() in ('.jsonl', '.ndjson') else 'csv'
+
+def read_rows(stream, fmt='csv'):
+    """Yield (line number, raw dict) pairs from a text stream, one row at a time.
+
+    Lines that cannot be parsed are yielded with a ValueError in place of
+    the dict so they end up in the error file like any other bad row.
+    """
+    if fmt == 'jsonl':
+        for line_no, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield line_no, ValueError(f'Invalid JSON: {e}')
+                continue
+            yield line_no, row if isinstance(row, dict) else ValueError('Expected a JSON object')
+        return
+    reader = csv.DictReader(stream)
+    for row in reader:
+        # Header is line 1
+        yield reader.line_num, row
+
+def clean_row(raw):
+    """Validated column values for one import row, or ValueError.
+
+    Types and lengths come from the medicine table, and the values then go
+    through Medicine's @validates hooks as if assigned to a new medicine.
+    Optional columns left empty are not in the result, see INSERT_DEFAULTS.
+    """
+    if isinstance(raw, Exception):
+        raise raw
+    columns = Medicine.__table__.c
+    values = {}
+    for field in IMPORT_FIELDS:
+        value = raw.get(field)
+        if isinstance(value, str):
+            value = value.strip()
+        if value in (None, ''):
+            if field in REQUIRED_FIELDS:
+                raise ValueError(f'{field} is required')
+            continue
+        try:
+            if field == 'price':
+                value = float(value)
+            elif field in ('stock_quantity', 'reorder_level'):
+                value = int(value)
+            elif field == 'expiry_date' and not isinstance(value, date):
+                value = date.fromisoformat(str(value))
+            elif isinstance(columns[field].type, String) and not isinstance(value, str):
+                # JSON lines can carry numbers, lists or objects for text columns
+                raise ValueError
+        except (TypeError, ValueError):
+            raise ValueError(f'{field}: invalid value {value!r}')
+        length = getattr(columns[field].type, 'length', None)
+        if length and len(value) > length:
+            raise ValueError(f'{field}: longer than {length} characters')
+        values[field] = value
+    for key, (validator, _) in Medicine.__mapper__.validators.items():
+        if values.get(key) is not None:
+            validator(_NEW_MEDICINE, key, values[key])
+    return values
+
+def upsert_medicines(rows):
+    """Insert or update a chunk of cleaned rows keyed on (name, manufacturer).
+
+    Runs in the caller's transaction. Optional columns a row leaves out
+    get INSERT_DEFAULTS on a new medicine and are left alone on an
+    existing one. Bulk statements bypass the ORM, so this also does what
+    the Medicine listeners would have done: the reorder and expiry flags,
+    the search index, the medicine counter, the stock ledger and the
+    catalog cache. Returns (inserted, updated).
+    """
+    table = Medicine.__table__
+    # Last row wins when a file repeats a medicine
+    by_key = {(row['name'], row['manufacturer']): row for row in rows}
+    keys = list(by_key)
+    now = datetime.utcnow()
+
+    # Touching the existing rows first takes their write locks (the database
+    # write lock on SQLite), so the stock read next cannot be changed by a
+    # sale before the upsert and the adjustment deltas stay exact
+    matches_key = tuple_(table.c.name, table.c.manufacturer).in_(keys)
+    db.session.execute(table.update().where(matches_key).values(updated_at=now))
+    existing = {
+        (row.name, row.manufacturer): row
+        for row in db.session.execute(
+            db.select(table.c.id, table.c.name, table.c.manufacturer,
+                      table.c.stock_quantity, table.c.reorder_level)
+            .where(matches_key)
+        )
+    }
+
+    # Rows grouped by the optional columns they provide, one statement per group
+    groups = {}
+    for key, row in by_key.items():
+        provided = tuple(column for column in INSERT_DEFAULTS if column in row)
+        current = existing.get(key)
+        fallback = current._mapping if current is not None else INSERT_DEFAULTS
+        stock = row.get('stock_quantity', fallback['stock_quantity'])
+        reorder_level = row.get('reorder_level', fallback['reorder_level'])
+        groups.setdefault(provided, []).append(dict(
+            INSERT_DEFAULTS,
+            **row,
+            needs_reorder=stock <= reorder_level,
+            expiry_bucket=bucket_for(row['expiry_date']),
+            created_at=now,
+            updated_at=now
+        ))
+
+    dialect = db.engine.dialect.name
+    for provided, values in groups.items():
+        columns = UPDATED_COLUMNS + provided
+        if dialect in ('sqlite', 'postgresql'):
+            insert = (sqlite.insert if dialect == 'sqlite' else postgresql.insert)(table)
+            db.session.execute(insert.on_conflict_do_update(
+                index_elements=['name', 'manufacturer'],
+                set_={column: insert.excluded[column] for column in columns}
+            ), values)
+            continue
+        for row in values:
+            if (row['name'], row['manufacturer']) in existing:
+                db.session.execute(
+                    table.update()
+                    .where(table.c.name == row['name'], table.c.manufacturer == row['manufacturer'])
+                    .values({column: row[column] for column in columns})
+                )
+            else:
+                db.session.execute(table.insert().values(row))
+
+    new_keys = [key for key in keys if key not in existing]
+    new_ids = {}
+    if new_keys:
+        new_ids = {
+            (row.name, row.manufacturer): row.id
+            for row in db.session.execute(
+                db.select(table.c.id, table.c.name, table.c.manufacturer)
+                .where(tuple_(table.c.name, table.c.manufacturer).in_(new_keys))
+            )
+        }
+
+    connection = db.session.connection()
+    reindex_medicines(connection, [row.id for row in existing.values()] + list(new_ids.values()))
+    if new_ids:
+        adjust_count(connection, 'medicine', len(new_ids))
+
+    receipts = {new_ids[key]: by_key[key]['stock_quantity']
+                for key in new_keys if by_key[key].get('stock_quantity')}
+    adjustments = {row.id: by_key[key]['stock_quantity'] - row.stock_quantity
+                   for key, row in existing.items()
+                   if 'stock_quantity' in by_key[key]
+                   and by_key[key]['stock_quantity'] != row.stock_quantity}
+    insert_movements(receipts, 'receipt')
+    insert_movements(adjustments, 'adjustment')
+
+    mark_touched(db.session, 'medicine')
+    if receipts or adjustments:
+        mark_touched(db.session, STOCK_NAMESPACE)
+    return len(new_ids), len(existing)
+
+def import_medicines(stream, fmt='csv', chunk_size=IMPORT_CHUNK_SIZE, errors=None, echo=None):
+    """Stream medicines from a CSV or JSON-lines file into the catalog.
+
+    Rows are read, validated and written one chunk at a time, each chunk
+    in its own transaction, so memory use does not grow with the file.
+    Invalid rows are skipped and written to ``errors`` (a text stream) as
+    CSV with the line number and reason; a chunk the database rejects as
+    a whole is reported the same way. Returns a dict of counts.
+    """
+    writer = None
+    if errors is not None:
+        writer = csv.writer(errors)
+        writer.writerow(['line', 'error', *IMPORT_FIELDS])
+    counts = {'rows': 0, 'inserted': 0, 'updated': 0, 'failed': 0}
+    started = time.monotonic()
+
+    def fail(line_no, raw, reason):
+        counts['failed'] += 1
+        if writer is not None:
+            fields = raw if isinstance(raw, dict) else {}
+            writer.writerow([line_no, reason, *(fields.get(field, '') for field in IMPORT_FIELDS)])
+
+    rows = read_rows(stream, fmt)
+    while True:
+        batch = list(islice(rows, chunk_size))
+        if not batch:
+            break
+        counts['rows'] += len(batch)
+        cleaned = []
+        for line_no, raw in batch:
+            try:
+                cleaned.append((line_no, raw, clean_row(raw)))
+            except ValueError as e:
+                fail(line_no, raw, str(e))
+        if cleaned:
+            try:
+                inserted, updated = run_with_lock_retry(
+                    lambda: upsert_medicines([values for _, _, values in cleaned]))
+            except Exception as e:
+                for line_no, raw, _ in cleaned:
+                    fail(line_no, raw, f'Chunk rejected by the database: {e}')
+            else:
+                counts['inserted'] += inserted
+                counts['updated'] += updated
+        if echo:
+            rate = counts['rows'] / max(time.monotonic() - started, 1e-9)
+            echo(f"{counts['rows']} rows read, {counts['inserted']} inserted, "
+                 f"{counts['updated']} updated, {counts['failed']} failed ({rate:.0f} rows/s)")
+    return counts
+
+@import_cli.command('medicines')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']),
+              help='Defaults to jsonl for .jsonl/.ndjson files, csv otherwise.')
+@click.option('--chunk-size', default=IMPORT_CHUNK_SIZE, show_default=True,
+              help='Rows per transaction.')
+@click.option('--errors', 'errors_path', type=click.Path(dir_okay=False),
+              help='Where to write rejected rows. Defaults to PATH.errors.csv.')
+def import_medicines_command(path, fmt, chunk_size, errors_path):
+    """Create or update medicines from a CSV or JSON-lines file."""
+    errors_path = errors_path or f'{path}.errors.csv'
+    with open(path, encoding='utf-8-sig', newline='') as stream, \
+            open(errors_path, 'w', encoding='utf-8', newline='') as errors:
+        counts = import_medicines(stream, fmt or import_format(path), chunk_size, errors, echo=click.echo)
+    click.echo(f"Imported {counts['inserted'] + counts['updated']} of {counts['rows']} rows "
+               f"({counts['inserted']} new, {counts['updated']} updated).")
+    if counts['failed']:
+        click.echo(f"{counts['failed']} row(s) rejected, see {errors_path}")
+        raise SystemExit(1)
+    os.remove(errors_path)
+
+def open_upload(file_storage):
+    """Text stream over an uploaded file, read straight from the request body"""
+    return io.TextIOWrapper(file_storage.stream, encoding='utf-8-sig', newline='')
@@ -0,0 +1,202 @@
+import zlib
+from werkzeug.http import parse_accept_header
+
+try:
+    import brotli
+except ImportError:  # optional; gzip only without it
+    brotli = None
+
+COMPRESSIBLE_TYPES = ('text/', 'application/json', 'application/javascript', 'application/xml',
+                      'application/x-ndjson', 'image/svg+xml')
+
+# Status codes whose body is empty or a byte range of the identity encoding
+_UNCOMPRESSED_STATUSES = (204, 206, 304)
+
+class GzipEncoder:
+    def __init__(self, level):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        # Ends the data written so far on a byte boundary so the client can decode it now
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._compressor.flush()
+
+class BrotliEncoder:
+    def __init__(self, quality):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self):
+        return self._compressor.flush()
+
+    def finish(self):
+        return self._compressor.finish()
+
+def _header(headers, name):
+    name = name.lower()
+    for key, value in headers:
+        if key.lower() == name:
+            return value
+    return None
+
+def _without(headers, *names):
+    names = {name.lower() for name in names}
+    return [(key, value) for key, value in headers if key.lower() not in names]
+
+def _vary_accept_encoding(headers):
+    vary = _header(headers, 'Vary')
+    if vary is None:
+        return headers + [('Vary', 'Accept-Encoding')]
+    if vary.strip() == '*' or 'accept-encoding' in (v.strip().lower() for v in vary.split(',')):
+        return headers
+    return _without(headers, 'Vary') + [('Vary', f'{vary}, Accept-Encoding')]
+
+def _compressible(headers):
+    content_type = (_header(headers, 'Content-Type') or '').split(';')[0].strip().lower()
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+class _WrittenFirst:
+    """Body of an app that used the legacy write() callable: the data it
+    wrote before returning, then the iterable it returned"""
+
+    def __init__(self, written, app_iter):
+        self.written = written
+        self.app_iter = app_iter
+
+    def __iter__(self):
+        yield from self.written
+        yield from self.app_iter
+
+    def close(self):
+        if hasattr(self.app_iter, 'close'):
+            self.app_iter.close()
+
+class CompressionMiddleware:
+    """WSGI middleware that gzip- or brotli-encodes text responses.
+
+    Bodies with a Content-Length are already in memory and are compressed
+    in one go. Streamed bodies are compressed chunk by chunk and flushed
+    after each one, so an export still reaches the client as it is
+    written; up to ``min_size`` bytes are held back to decide whether it
+    is worth it. A compressed response is a different representation, so
+    a strong ETag becomes weak: If-None-Match compares weakly and keeps
+    matching, while If-Range and If-Match no longer do. Data an app passes
+    to the write() callable start_response returns is held until the app
+    returns, then goes through the encoder ahead of the rest of the body.
+    """
+
+    def __init__(self, app, min_size=500, level=6, brotli_quality=4):
+        self.app = app
+        self.min_size = min_size
+        self.level = level
+        self.brotli_quality = brotli_quality
+        # Preferred first when the client rates them equally
+        self.encodings = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+    def negotiate(self, accept_encoding):
+        accepted = parse_accept_header(accept_encoding)
+        best, best_quality = None, 0
+        for name in self.encodings:
+            quality = accepted.quality(name)
+            if quality > best_quality:
+                best, best_quality = name, quality
+        return best
+
+    def encoder(self, name):
+        if name == 'br':
+            return BrotliEncoder(self.brotli_quality)
+        return GzipEncoder(self.level)
+
+    def __call__(self, environ, start_response):
+        captured = []
+        written = []
+
+        def capture(status, headers, exc_info=None):
+            captured[:] = [status, headers, exc_info]
+            return written.append
+
+        app_iter = self.app(environ, capture)
+        if written:
+            app_iter = _WrittenFirst(written, app_iter)
+        # Werkzeug responses call start_response before returning their body
+        status, headers, exc_info = captured
+        code = int(status.split(' ', 1)[0])
+
+        if not _compressible(headers):
+            start_response(status, headers, exc_info)
+            return app_iter
+        headers = _vary_accept_encoding(headers)
+
+        length = _header(headers, 'Content-Length')
+        cache_control = (_header(headers, 'Cache-Control') or '').lower()
+        name = None
+        if (environ['REQUEST_METHOD'] != 'HEAD' and code >= 200 and code not in _UNCOMPRESSED_STATUSES
+                and _header(headers, 'Content-Encoding') is None and 'no-transform' not in cache_control
+                and (length is None or int(length) >= self.min_size)):
+            name = self.negotiate(environ.get('HTTP_ACCEPT_ENCODING', ''))
+        if name is None:
+            start_response(status, headers, exc_info)
+            return app_iter
+
+        encoded = _without(headers, 'Content-Length') + [('Content-Encoding', name)]
+        etag = _header(headers, 'ETag')
+        if etag and not etag.startswith('W/'):
+            encoded = _without(encoded, 'ETag') + [('ETag', f'W/{etag}')]
+
+        if length is not None:
+            return self._compress_whole(app_iter, status, encoded, exc_info, name, start_response)
+        return self._compress_stream(app_iter, status, headers, encoded, exc_info, name, start_response)
+
+    def _compress_whole(self, app_iter, status, headers, exc_info, name, start_response):
+        try:
+            body = b''.join(app_iter)
+        finally:
+            if hasattr(app_iter, 'close'):
+                app_iter.close()
+        encoder = self.encoder(name)
+        data = encoder.compress(body) + encoder.finish()
+        start_response(status, headers + [('Content-Length', str(len(data)))], exc_info)
+        return [data]
+
+    def _compress_stream(self, app_iter, status, headers, encoded, exc_info, name, start_response):
+        try:
+            chunks = iter(app_iter)
+            held, size = [], 0
+            for chunk in chunks:
+                held.append(chunk)
+                size += len(chunk)
+                if size >= self.min_size:
+                    break
+            else:
+                # The whole body turned out small: send it as it is
+                start_response(status, headers + [('Content-Length', str(size))], exc_info)
+                yield b''.join(held)
+                return
+
+            start_response(status, encoded, exc_info)
+            encoder = self.encoder(name)
+            yield encoder.compress(b''.join(held)) + encoder.flush()
+            for chunk in chunks:
+                if chunk:
+                    yield encoder.compress(chunk) + encoder.flush()
+            yield encoder.finish()
+        finally:
+            if hasattr(app_iter, 'close'):
+                app_iter.close()
+
+def install_compression(app):
+    """Wrap the app's WSGI callable when COMPRESSION is on"""
+    if not app.config['COMPRESSION']:
+        return False
+    app.wsgi_app = CompressionMiddleware(app.wsgi_app,
+                                         min_size=app.config['COMPRESSION_MIN_SIZE'],
+                                         level=app.config['COMPRESSION_LEVEL'],
+                                         brotli_quality=app.config['COMPRESSION_BROTLI_QUALITY'])
+    return True
@@ -6,22 +6,102 @@ basedir = os.path.abspath(os.path.dirname(__file__))
 
 class Config:
     # Flask configuration
-    SECRET_KEY = os.environ.get('SECRET_KEY') or 'your-secret-key-here'
+    SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev'
     
     # SQLAlchemy configuration
     # Use absolute path for the database
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or f'sqlite:///{os.path.join(basedir, "instance", "pharmacy.db")}'
+    if SQLALCHEMY_DATABASE_URI.startswith('postgres://'):
+        # SQLAlchemy 1.4 only accepts the postgresql:// scheme
+        SQLALCHEMY_DATABASE_URI = SQLALCHEMY_DATABASE_URI.replace('postgres://', 'postgresql://', 1)
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
+    # Database engine profile: 'sqlite', 'server' or 'default' (no tuning).
+    # 'auto' picks sqlite or server from the database URI, see engine_profile.py
+    DATABASE_PROFILE = os.environ.get('DATABASE_PROFILE') or 'auto'
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE') or 5)
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW') or 10)
+    DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT') or 30)  # seconds
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE') or 1800)  # seconds
+    SQLITE_JOURNAL_MODE = os.environ.get('SQLITE_JOURNAL_MODE') or 'WAL'
+    SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS') or 'NORMAL'
+    SQLITE_BUSY_TIMEOUT = int(os.environ.get('SQLITE_BUSY_TIMEOUT') or 5000)  # milliseconds
+    SQLITE_CACHE_SIZE = int(os.environ.get('SQLITE_CACHE_SIZE') or -65536)  # negative means KiB
+    SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE') or 268435456)  # bytes
+    
+    # Password hashing. Hashes made with other settings are redone at the
+    # user's next login. See benchmarks/password_hash.py for timings.
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD') or 'pbkdf2:sha256:260000'
+    PASSWORD_SALT_LENGTH = int(os.environ.get('PASSWORD_SALT_LENGTH') or 16)
+    
+    # How long a worker trusts its cached copy of a logged-in user, in seconds
+    USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL') or 60)
+    
+    # Request instrumentation: SQL and template timings in a Server-Timing
+    # header, a slow query log and a sample of slow requests per worker
+    # (admins: /api/instrumentation/slow-requests). Off means not installed.
+    INSTRUMENTATION = (os.environ.get('INSTRUMENTATION') or 'false').lower() == 'true'
+    SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS') or 200)
+    SLOW_REQUEST_MS = float(os.environ.get('SLOW_REQUEST_MS') or 500)
+    SLOW_REQUEST_SAMPLE_RATE = float(os.environ.get('SLOW_REQUEST_SAMPLE_RATE') or 1.0)
+    SLOW_REQUEST_BUFFER = int(os.environ.get('SLOW_REQUEST_BUFFER') or 100)
+    
+    # Prometheus metrics at /metrics, summed over all gunicorn workers
+    # through per-process files in METRICS_DIR. When METRICS_TOKEN is set,
+    # scrapers must send it as a bearer token.
+    METRICS = (os.environ.get('METRICS') or 'false').lower() == 'true'
+    METRICS_DIR = os.environ.get('METRICS_DIR') or os.path.join(basedir, 'instance', 'metrics')
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    
+    # Background jobs, run by `flask jobs worker` from the job table.
+    # Failed attempts are retried after JOB_RETRY_DELAY seconds, doubling
+    # each time; running jobs without a heartbeat for JOB_STALE_AFTER
+    # seconds are requeued. With JOB_IMPORTS on, uploaded medicine imports
+    # are queued instead of run inside the request.
+    JOB_WORKER_PROCESSES = int(os.environ.get('JOB_WORKER_PROCESSES') or 2)
+    JOB_POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL') or 2)  # seconds
+    JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS') or 3)
+    JOB_RETRY_DELAY = int(os.environ.get('JOB_RETRY_DELAY') or 30)  # seconds
+    JOB_STALE_AFTER = int(os.environ.get('JOB_STALE_AFTER') or 600)  # seconds
+    JOB_IMPORTS = (os.environ.get('JOB_IMPORTS') or 'false').lower() == 'true'
+    
+    # Response compression (compression.py); brotli is used when the package is installed
+    COMPRESSION = (os.environ.get('COMPRESSION') or 'true').lower() == 'true'
+    COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE') or 500)  # bytes
+    COMPRESSION_LEVEL = int(os.environ.get('COMPRESSION_LEVEL') or 6)  # gzip, 1-9
+    COMPRESSION_BROTLI_QUALITY = int(os.environ.get('COMPRESSION_BROTLI_QUALITY') or 4)  # 0-11
+    
     # Session configuration
     PERMANENT_SESSION_LIFETIME = timedelta(minutes=60)
     
+    # Flask-WTF
+    WTF_CSRF_TIME_LIMIT = 3600  # 1 hour
+    WTF_CSRF_SSL_STRICT = False
+    
     # Flask-Limiter
     RATELIMIT_DEFAULT = "200 per day;50 per hour"
     RATELIMIT_STORAGE_URL = "memory://"
     
+    # Flask-Caching: SimpleCache, FileSystemCache or RedisCache. Tests can
+    # set CACHE_REDIS_HOST to any redis-py compatible client object instead
+    # of a running server. Catalog entries stay coherent across workers with
+    # any of them, as their versions are kept in the database (catalog.py).
+    CACHE_TYPE = os.environ.get('CACHE_TYPE') or 'SimpleCache'
+    CACHE_DEFAULT_TIMEOUT = 300
+    CACHE_KEY_PREFIX = 'pharmacy:'
+    CACHE_DIR = os.path.join(basedir, 'instance', 'cache')
+    CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL') or os.environ.get('REDIS_URL')
+    # Room for rendered template fragments as well as catalog reads (SimpleCache, FileSystemCache)
+    CACHE_THRESHOLD = int(os.environ.get('CACHE_THRESHOLD') or 5000)
+    
+    # Templates: compiled bytecode survives restarts once `flask bootstrap dirs`
+    # has created the directory; cached fragments are keyed on row changes
+    TEMPLATE_BYTECODE_DIR = os.environ.get('TEMPLATE_BYTECODE_DIR') or os.path.join(basedir, 'instance', 'jinja')
+    TEMPLATE_FRAGMENT_TIMEOUT = int(os.environ.get('TEMPLATE_FRAGMENT_TIMEOUT') or 3600)  # seconds
+    
     # Security
-    SESSION_COOKIE_SECURE = False  # Set to True in production with HTTPS
+    SESSION_COOKIE_SECURE = (os.environ.get('SESSION_COOKIE_SECURE') or 'true').lower() == 'true'
     SESSION_COOKIE_HTTPONLY = True
+    SESSION_COOKIE_SAMESITE = 'Lax'
     REMEMBER_COOKIE_SECURE = False  # Set to True in production with HTTPS
     REMEMBER_COOKIE_HTTPONLY = True 
\ No newline at end of file
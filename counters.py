@@ -0,0 +1,98 @@
+from collections import Counter
+from datetime import datetime
+import click
+from flask.cli import AppGroup
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
+from extensions import db
+from models import Medicine, Customer, Employee, Prescription, Sale, EntityCount
+
+# Tables whose row counts are maintained, keyed by EntityCount.name
+COUNTED_MODELS = {
+    'medicine': Medicine,
+    'customer': Customer,
+    'employee': Employee,
+    'prescription': Prescription,
+    'sale': Sale,
+}
+
+_COUNTED_TYPES = {model: name for name, model in COUNTED_MODELS.items()}
+
+counters_cli = AppGroup('counters', help='Maintained entity counters.')
+
+def adjust_count(connection, name, delta):
+    """Apply a delta to one counter, seeding it from COUNT(*) if it is missing"""
+    table = EntityCount.__table__
+    result = connection.execute(
+        table.update()
+        .where(table.c.name == name)
+        .values(count=table.c.count + delta, updated_at=datetime.utcnow())
+    )
+    if result.rowcount == 0:
+        # Runs inside the same transaction, so the count already includes this change
+        model = COUNTED_MODELS[name]
+        actual = connection.execute(db.select(func.count()).select_from(model.__table__)).scalar()
+        connection.execute(table.insert().values(name=name, count=actual, updated_at=datetime.utcnow()))
+
+@event.listens_for(Session, 'after_flush')
+def update_entity_counts(session, flush_context):
+    deltas = Counter()
+    for obj in session.new:
+        name = _COUNTED_TYPES.get(type(obj))
+        if name:
+            deltas[name] += 1
+    for obj in session.deleted:
+        name = _COUNTED_TYPES.get(type(obj))
+        if name:
+            deltas[name] -= 1
+    if not deltas:
+        return
+    connection = session.connection()
+    for name, delta in deltas.items():
+        if delta:
+            adjust_count(connection, name, delta)
+
+def dashboard_counts():
+    """All counters in a single query, seeding any that do not exist yet"""
+    counts = dict(db.session.query(EntityCount.name, EntityCount.count)
+                  .filter(EntityCount.name.in_(COUNTED_MODELS)).all())
+    missing = [name for name in COUNTED_MODELS if name not in counts]
+    if missing:
+        counts.update(reconcile_counts(fix=True, names=missing)['actual'])
+        db.session.commit()
+    return counts
+
+def reconcile_counts(fix=False, names=None):
+    """Compare counters with real COUNT(*) values, optionally correcting them.
+
+    Returns a dict with the stored and actual values and the names that drifted.
+    """
+    names = names or list(COUNTED_MODELS)
+    stored = dict(db.session.query(EntityCount.name, EntityCount.count)
+                  .filter(EntityCount.name.in_(names)).all())
+    actual = {name: db.session.query(func.count()).select_from(COUNTED_MODELS[name]).scalar() for name in names}
+    drifted = [name for name in names if stored.get(name) != actual[name]]
+    if fix:
+        for name in drifted:
+            counter = db.session.get(EntityCount, name)
+            if counter is None:
+                db.session.add(EntityCount(name=name, count=actual[name]))
+            else:
+                counter.count = actual[name]
+    return {'stored': stored, 'actual': actual, 'drifted': drifted}
+
+@counters_cli.command('reconcile')
+@click.option('--fix', is_flag=True, help='Overwrite drifted counters with the real counts.')
+def reconcile_command(fix):
+    """Check the entity counters against real table counts."""
+    result = reconcile_counts(fix=fix)
+    for name in COUNTED_MODELS:
+        stored = result['stored'].get(name)
+        actual = result['actual'][name]
+        marker = '' if stored == actual else '  <- drift'
+        click.echo(f'{name:<14} stored={stored} actual={actual}{marker}')
+    if fix:
+        db.session.commit()
+        click.echo(f"Fixed {len(result['drifted'])} counter(s).")
+    elif result['drifted']:
+        raise SystemExit(1)
@@ -0,0 +1,269 @@
+import random
+from datetime import date, datetime, time, timedelta
+import click
+from flask.cli import AppGroup
+from sqlalchemy import text
+from extensions import db
+from models import Medicine, Customer, Employee, Prescription, PrescriptionItem, Sale, SaleItem
+from catalog import ALL_NAMESPACES, mark_touched
+from counters import COUNTED_MODELS, reconcile_counts
+from expiry import flag_expiring_stock
+from ledger import insert_movements
+from reorder import refresh_reorder_flags
+from rollups import backfill
+from search import fts_enabled, rebuild_fts_index
+
+GENERATE_BATCH_SIZE = 10000
+GENERATE_DAYS = 730
+
+# Share of the requested row count per table. Line items follow from the
+# basket sizes below: about 0.16 for prescription items, 0.25 for sale items.
+ROW_SHARES = {
+    'medicine': 0.02,
+    'customer': 0.05,
+    'employee': 0.001,
+    'prescription': 0.08,
+    'sale': 0.42,
+}
+MINIMUM_ROWS = {'medicine': 50, 'customer': 20, 'employee': 5, 'prescription': 1, 'sale': 1}
+PRESCRIPTION_ITEMS = (1, 3)
+ITEMISED_SALE_SHARE = 0.2
+SALE_ITEMS = (1, 5)
+
+CATEGORIES = ('Analgesic', 'Antibiotic', 'Antihistamine', 'Antacid', 'Antiviral', 'Cardiovascular',
+              'Dermatological', 'Diabetes', 'Respiratory', 'Supplement', 'Vaccine', 'Ophthalmic')
+MANUFACTURERS = ('Acme Pharma', 'Borealis Labs', 'Cedar Health', 'Delta Generics', 'Evergreen Bio',
+                 'Fulcrum Medical', 'Granite Therapeutics', 'Harbor Pharma', 'Ionic Labs', 'Juniper Health',
+                 'Keystone Generics', 'Lumen Bio', 'Meridian Pharma', 'Northwind Labs', 'Orchid Health',
+                 'Pinnacle Generics', 'Quarry Medical', 'Redwood Pharma', 'Summit Labs', 'Tidal Health')
+STEMS = ('Amoxi', 'Cefa', 'Ibu', 'Para', 'Lora', 'Ceti', 'Omepra', 'Metfor', 'Atorva', 'Lisino',
+         'Salbu', 'Predni', 'Azithro', 'Doxy', 'Cipro', 'Fluco', 'Sertra', 'Gaba', 'Panto', 'Montelu')
+SUFFIXES = ('cillin', 'zole', 'profen', 'cetamol', 'tadine', 'rizine', 'min', 'statin', 'pril', 'tamol')
+FIRST_NAMES = ('Alex', 'Blake', 'Casey', 'Dana', 'Eli', 'Frankie', 'Gray', 'Harper', 'Indra', 'Jordan',
+               'Kai', 'Lee', 'Morgan', 'Noor', 'Oakley', 'Parker', 'Quinn', 'Riley', 'Sam', 'Taylor')
+LAST_NAMES = ('Adams', 'Baker', 'Chen', 'Diaz', 'Evans', 'Fischer', 'Garcia', 'Haddad', 'Ito', 'Jones',
+              'Khan', 'Lopez', 'Moreau', 'Nguyen', 'Okafor', 'Patel', 'Rossi', 'Silva', 'Tanaka', 'Weber')
+POSITIONS = ('Pharmacist', 'Pharmacy Technician', 'Cashier', 'Store Manager', 'Inventory Clerk')
+STREETS = ('Oak', 'Maple', 'Cedar', 'Pine', 'Elm', 'Birch', 'Willow', 'Spruce', 'Ash', 'Poplar')
+INSTRUCTIONS = ('Once daily after food', 'Twice daily', 'Every 8 hours', 'At bedtime', 'As needed for pain')
+
+data_cli = AppGroup('data', help='Synthetic data for benchmarks and load tests.')
+
+def plan_counts(rows):
+    """Rows to generate per parent table for about ``rows`` rows in total"""
+    return {name: max(MINIMUM_ROWS[name], int(rows * share)) for name, share in ROW_SHARES.items()}
+
+def _skewed(rng, count):
+    # Low ids are picked far more often, so some medicines and customers are hot
+    return int(count * rng.random() ** 2) + 1
+
+class _BatchWriter:
+    """Buffers rows per table and writes them with one executemany per table.
+
+    Tables are always written in the order they were first seen, so parent
+    rows land before the lines that reference them.
+    """
+
+    def __init__(self, batch_size):
+        self.batch_size = batch_size
+        self.pending = {}
+        self.written = {}
+
+    def add(self, table, row):
+        rows = self.pending.setdefault(table, [])
+        rows.append(row)
+        if len(rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        for table, rows in self.pending.items():
+            if rows:
+                db.session.execute(table.insert(), rows)
+                self.written[table.name] = self.written.get(table.name, 0) + len(rows)
+                self.pending[table] = []
+        db.session.commit()
+
+def _medicines(writer, rng, count, today, stamp):
+    prices = {}
+    stock = {}
+    for i in range(1, count + 1):
+        price = round(rng.uniform(0.5, 200), 2)
+        reorder_level = rng.randint(10, 50)
+        quantity = rng.randint(0, reorder_level) if rng.random() < 0.1 else rng.randint(reorder_level + 1, 500)
+        writer.add(Medicine.__table__, {
+            'id': i,
+            'name': f'{rng.choice(STEMS)}{rng.choice(SUFFIXES)} {rng.choice((5, 10, 20, 50, 100, 250, 500))}mg #{i}',
+            'description': f'Generated medicine {i}' if rng.random() < 0.7 else None,
+            'manufacturer': rng.choice(MANUFACTURERS),
+            'category': rng.choice(CATEGORIES),
+            'price': price,
+            'stock_quantity': quantity,
+            'reorder_level': reorder_level,
+            'needs_reorder': False,
+            'expiry_date': today + timedelta(days=rng.randint(-60, 3 * 365)),
+            'created_at': stamp,
+            'updated_at': stamp,
+        })
+        prices[i] = price
+        if quantity:
+            stock[i] = quantity
+        if i % writer.batch_size == 0 or i == count:
+            writer.flush()
+            # Opening stock, as the ORM listener in ledger.py would have recorded it
+            insert_movements(stock, 'receipt')
+            db.session.commit()
+            stock = {}
+    return prices
+
+def _people(writer, rng, counts, today, stamp):
+    for i in range(1, counts['customer'] + 1):
+        writer.add(Customer.__table__, {
+            'id': i,
+            'name': f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}',
+            'email': f'customer{i}@example.com',
+            'phone': str(rng.randint(10 ** 9, 10 ** 10 - 1)),
+            'address': f'{rng.randint(1, 999)} {rng.choice(STREETS)} Street',
+            'created_at': stamp,
+            'updated_at': stamp,
+        })
+    for i in range(1, counts['employee'] + 1):
+        writer.add(Employee.__table__, {
+            'id': i,
+            'name': f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}',
+            'email': f'employee{i}@example.com',
+            'phone': str(rng.randint(10 ** 9, 10 ** 10 - 1)),
+            'position': rng.choice(POSITIONS),
+            'hire_date': today - timedelta(days=rng.randint(30, 3650)),
+            'created_at': stamp,
+            'updated_at': stamp,
+        })
+    writer.flush()
+
+def _prescriptions(writer, rng, counts, today, days):
+    item_id = 0
+    for i in range(1, counts['prescription'] + 1):
+        day = today - timedelta(days=rng.randrange(days))
+        stamp = datetime.combine(day, time(12))
+        writer.add(Prescription.__table__, {
+            'id': i,
+            'customer_id': _skewed(rng, counts['customer']),
+            'doctor_name': f'Dr. {rng.choice(LAST_NAMES)}',
+            'prescription_date': day,
+            'notes': 'Follow up in two weeks' if rng.random() < 0.3 else None,
+            'created_at': stamp,
+            'updated_at': stamp,
+        })
+        for _ in range(rng.randint(*PRESCRIPTION_ITEMS)):
+            item_id += 1
+            writer.add(PrescriptionItem.__table__, {
+                'id': item_id,
+                'prescription_id': i,
+                'medicine_id': _skewed(rng, counts['medicine']),
+                'quantity': rng.randint(1, 3),
+                'instructions': rng.choice(INSTRUCTIONS),
+                'created_at': stamp,
+                'updated_at': stamp,
+            })
+    writer.flush()
+
+def _sales(writer, rng, counts, prices, today, days, echo):
+    item_id = 0
+    for i in range(1, counts['sale'] + 1):
+        day = today - timedelta(days=rng.randrange(days))
+        stamp = datetime.combine(day, time(12))
+        row = {
+            'id': i,
+            'customer_id': _skewed(rng, counts['customer']),
+            'employee_id': rng.randint(1, counts['employee']),
+            'sale_date': day,
+            'created_at': stamp,
+            'updated_at': stamp,
+        }
+        if rng.random() < ITEMISED_SALE_SHARE:
+            # Checkout sale: one line per distinct medicine, total from the lines
+            basket = {_skewed(rng, counts['medicine']): rng.randint(1, 3)
+                      for _ in range(rng.randint(*SALE_ITEMS))}
+            row.update(medicine_id=None, unit_price=None, quantity=sum(basket.values()),
+                       total_amount=round(sum(prices[m] * q for m, q in basket.items()), 2))
+            writer.add(Sale.__table__, row)
+            for medicine_id, quantity in basket.items():
+                item_id += 1
+                writer.add(SaleItem.__table__, {
+                    'id': item_id,
+                    'sale_id': i,
+                    'medicine_id': medicine_id,
+                    'quantity': quantity,
+                    'price': prices[medicine_id],
+                    'created_at': stamp,
+                })
+        else:
+            medicine_id = _skewed(rng, counts['medicine'])
+            quantity = rng.randint(1, 5)
+            row.update(medicine_id=medicine_id, unit_price=prices[medicine_id], quantity=quantity,
+                       total_amount=round(prices[medicine_id] * quantity, 2))
+            writer.add(Sale.__table__, row)
+        if echo and i % (writer.batch_size * 10) == 0:
+            echo(f'{i} sales generated')
+    writer.flush()
+
+def derive_tables(echo=None):
+    """Bring every maintained table in line after rows were written in bulk:
+    counters, search index, reorder flags, expiry buckets and sales rollups.
+    """
+    reconcile_counts(fix=True)
+    connection = db.session.connection()
+    if fts_enabled(connection):
+        rebuild_fts_index(connection)
+    refresh_reorder_flags()
+    mark_touched(db.session, *ALL_NAMESPACES)
+    db.session.commit()
+    flag_expiring_stock()
+    backfill(GENERATE_BATCH_SIZE, echo=echo)
+    if db.engine.dialect.name == 'sqlite':
+        db.session.execute(text('ANALYZE'))
+        db.session.commit()
+
+def generate(rows, seed=1, today=None, days=GENERATE_DAYS, batch_size=GENERATE_BATCH_SIZE, echo=None):
+    """Fill an empty database with about ``rows`` rows of realistic data.
+
+    The same ``rows``, ``seed`` and ``today`` give the same rows, ids
+    included. Everything is written with executemany in batches, then the
+    tables the ORM hooks would normally maintain are derived in one pass.
+    Returns the rows written per table.
+    """
+    for name, model in COUNTED_MODELS.items():
+        if db.session.query(model.id).first() is not None:
+            raise ValueError(f'The {name} table is not empty; generate into a fresh database.')
+    rng = random.Random(seed)
+    today = today or date.today()
+    stamp = datetime.combine(today, time(12))
+    counts = plan_counts(rows)
+    writer = _BatchWriter(batch_size)
+
+    prices = _medicines(writer, rng, counts['medicine'], today, stamp)
+    _people(writer, rng, counts, today, stamp)
+    if echo:
+        echo(f"{counts['medicine']} medicines, {counts['customer']} customers, {counts['employee']} employees")
+    _prescriptions(writer, rng, counts, today, days)
+    if echo:
+        echo(f"{counts['prescription']} prescriptions")
+    _sales(writer, rng, counts, prices, today, days, echo)
+    derive_tables(echo)
+    return writer.written
+
+@data_cli.command('generate')
+@click.option('--rows', default=100000, show_default=True, help='Approximate total rows, 10k to 5M.')
+@click.option('--seed', default=1, show_default=True)
+@click.option('--today', type=click.DateTime(['%Y-%m-%d']), help='Date the history ends on. Defaults to today.')
+@click.option('--days', default=GENERATE_DAYS, show_default=True, help='Days of sales and prescription history.')
+@click.option('--batch-size', default=GENERATE_BATCH_SIZE, show_default=True, help='Rows per INSERT batch.')
+def generate_command(rows, seed, today, days, batch_size):
+    """Fill an empty database with deterministic synthetic data."""
+    started = datetime.utcnow()
+    try:
+        written = generate(rows, seed, today.date() if today else None, days, batch_size, echo=click.echo)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    for table, count in written.items():
+        click.echo(f'{table:<18} {count}')
+    click.echo(f'Generated {sum(written.values())} rows in {(datetime.utcnow() - started).total_seconds():.1f}s.')
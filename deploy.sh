@@ -10,13 +10,18 @@ pip install -r requirements.txt
 echo "Creating instance directory..."
 mkdir -p instance
 
-# Initialize database
-echo "Initializing database..."
+# Bring existing tables up to date with the revisions in migrations/versions
+echo "Migrating database..."
 export FLASK_APP=app.py
-flask db init || true
-flask db migrate -m "Initial migration"
 flask db upgrade
 
+# Directories, any missing tables and the admin user; workers no longer do this
+echo "Bootstrapping..."
+flask bootstrap all
+
+# Fill in expiry buckets added by a migration
+flask expiry flag
+
 # Start the application
 echo "Starting application..."
 gunicorn wsgi:app --log-level debug 
\ No newline at end of file
@@ -0,0 +1,141 @@
+import logging
+import os
+import weakref
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+from extensions import db
+
+logger = logging.getLogger(__name__)
+
+PROFILES = ('sqlite', 'server', 'default')
+
+# Engines this process has configured, disposed after a fork
+_engines = weakref.WeakSet()
+
+def resolve_profile(config):
+    name = config.get('DATABASE_PROFILE') or 'auto'
+    if name == 'auto':
+        url = make_url(config['SQLALCHEMY_DATABASE_URI'])
+        name = 'sqlite' if url.get_backend_name() == 'sqlite' else 'server'
+    if name not in PROFILES:
+        raise ValueError(f"Unknown DATABASE_PROFILE {name!r}, expected one of {', '.join(PROFILES)}")
+    return name
+
+def _is_memory_sqlite(config):
+    return make_url(config['SQLALCHEMY_DATABASE_URI']).database in (None, '', ':memory:')
+
+def sqlite_pragmas(config):
+    """PRAGMAs run on every new SQLite connection, in order"""
+    pragmas = {
+        'busy_timeout': config['SQLITE_BUSY_TIMEOUT'],
+        'journal_mode': config['SQLITE_JOURNAL_MODE'],
+        'synchronous': config['SQLITE_SYNCHRONOUS'],
+        'cache_size': config['SQLITE_CACHE_SIZE'],
+        'mmap_size': config['SQLITE_MMAP_SIZE'],
+        'foreign_keys': 'ON',
+        'temp_store': 'MEMORY',
+    }
+    if _is_memory_sqlite(config):
+        # WAL and mmap do not apply to in-memory databases
+        del pragmas['journal_mode'], pragmas['mmap_size']
+    return pragmas
+
+def engine_options(profile, config):
+    if profile == 'sqlite':
+        if _is_memory_sqlite(config):
+            return {}
+        # Flask-SQLAlchemy would use NullPool for SQLite files, which reopens
+        # the file and re-runs the PRAGMAs on every checkout
+        return {
+            'poolclass': QueuePool,
+            'pool_size': config['DB_POOL_SIZE'],
+            'max_overflow': config['DB_MAX_OVERFLOW'],
+            'pool_timeout': config['DB_POOL_TIMEOUT'],
+            'connect_args': {
+                'timeout': config['SQLITE_BUSY_TIMEOUT'] / 1000,
+                'check_same_thread': False,
+            },
+        }
+    if profile == 'server':
+        return {
+            'pool_size': config['DB_POOL_SIZE'],
+            'max_overflow': config['DB_MAX_OVERFLOW'],
+            'pool_timeout': config['DB_POOL_TIMEOUT'],
+            'pool_recycle': config['DB_POOL_RECYCLE'],
+            'pool_pre_ping': True,
+        }
+    return {}
+
+def configure_engine_profile(app):
+    """Fill SQLALCHEMY_ENGINE_OPTIONS for the selected profile.
+
+    Must run before the engine is created. Options set explicitly in the
+    app config take precedence over the profile.
+    """
+    profile = resolve_profile(app.config)
+    options = engine_options(profile, app.config)
+    options.update(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+    app.config['DATABASE_PROFILE'] = profile
+
+def _pragma_listener(pragmas):
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
+    return set_pragmas
+
+def install_engine_profile(app):
+    """Create the engine and attach the per-connection hooks of its profile"""
+    with app.app_context():
+        engine = db.engine
+    if app.config['DATABASE_PROFILE'] == 'sqlite' and engine.dialect.name == 'sqlite':
+        event.listen(engine, 'connect', _pragma_listener(sqlite_pragmas(app.config)))
+    _engines.add(engine)
+    return engine
+
+def effective_settings(app):
+    """What the database actually runs with, as opposed to what was asked for"""
+    engine = db.engine
+    settings = {
+        'profile': app.config['DATABASE_PROFILE'],
+        'url': engine.url.render_as_string(hide_password=True),
+        'pool': type(engine.pool).__name__,
+    }
+    for option in ('pool_size', 'max_overflow', 'pool_timeout', 'pool_recycle'):
+        if option in app.config['SQLALCHEMY_ENGINE_OPTIONS']:
+            settings[option] = app.config['SQLALCHEMY_ENGINE_OPTIONS'][option]
+    if engine.dialect.name == 'sqlite':
+        with engine.connect() as connection:
+            for name in ('journal_mode', 'synchronous', 'busy_timeout', 'cache_size', 'mmap_size', 'foreign_keys'):
+                settings[name] = connection.exec_driver_sql(f'PRAGMA {name}').scalar()
+    return settings
+
+_SYNCHRONOUS_LEVELS = {'OFF': 0, 'NORMAL': 1, 'FULL': 2, 'EXTRA': 3}
+
+def log_engine_profile(app):
+    """Startup self-check: log the effective settings and warn about mismatches"""
+    settings = effective_settings(app)
+    logger.info('Database engine: ' + ', '.join(f'{k}={v}' for k, v in settings.items()))
+    if settings['profile'] == 'sqlite' and 'journal_mode' in settings and not _is_memory_sqlite(app.config):
+        expected = app.config['SQLITE_JOURNAL_MODE'].lower()
+        if str(settings['journal_mode']).lower() != expected:
+            logger.warning(f"SQLite journal_mode is {settings['journal_mode']}, expected {expected}")
+        synchronous = _SYNCHRONOUS_LEVELS.get(app.config['SQLITE_SYNCHRONOUS'].upper())
+        if synchronous is not None and settings['synchronous'] != synchronous:
+            logger.warning(f"SQLite synchronous is {settings['synchronous']}, expected {synchronous}")
+    return settings
+
+def dispose_engines():
+    """Drop pooled connections inherited from a parent process.
+
+    close=False leaves the parent's connections alone, the child simply
+    starts with an empty pool.
+    """
+    for engine in list(_engines):
+        engine.dispose(close=False)
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=dispose_engines)
@@ -0,0 +1,121 @@
+from datetime import date, datetime, timedelta
+import click
+from flask.cli import AppGroup
+from sqlalchemy import event, func, or_
+from extensions import db
+from models import Medicine
+
+EXPIRY_PAGE_SIZE = 20
+EXPIRY_FLAG_CHUNK_SIZE = 1000
+
+# Bucket name and the last day of the window, in days from today.
+# 'expired' covers everything before today.
+EXPIRY_BUCKETS = (('expired', -1), ('30', 30), ('60', 60), ('90', 90))
+EXPIRY_HORIZON = EXPIRY_BUCKETS[-1][1]
+
+# Keyset order matching idx_medicine_expiry (expiry_date, id)
+EXPIRY_LIST_KEYS = ((Medicine.expiry_date, False), (Medicine.id, False))
+
+expiry_cli = AppGroup('expiry', help='Medicine expiry tracking.')
+
+def bucket_bounds(bucket, today=None):
+    """First and last expiry date of a bucket; the expired bucket has no first day"""
+    today = today or date.today()
+    first = None
+    for name, last_day in EXPIRY_BUCKETS:
+        if name == bucket:
+            return first, today + timedelta(days=last_day)
+        first = today + timedelta(days=last_day + 1)
+    raise KeyError(bucket)
+
+def bucket_for(expiry_date, today=None):
+    today = today or date.today()
+    days = (expiry_date - today).days
+    for name, last_day in EXPIRY_BUCKETS:
+        if days <= last_day:
+            return name
+    return None
+
+@event.listens_for(Medicine, 'before_insert')
+@event.listens_for(Medicine, 'before_update')
+def set_expiry_bucket(mapper, connection, target):
+    if target.expiry_date is not None:
+        target.expiry_bucket = bucket_for(target.expiry_date)
+
+def expiry_summary(today=None):
+    """Medicine count per bucket in one statement.
+
+    Each bucket is its own COUNT over a date range, which SQLite answers
+    from the covering idx_medicine_expiry without touching the table; a
+    single CASE ... GROUP BY has to evaluate every row up to the horizon.
+    """
+    counts = []
+    for name, _ in EXPIRY_BUCKETS:
+        first, last = bucket_bounds(name, today)
+        criteria = [Medicine.expiry_date <= last]
+        if first is not None:
+            criteria.append(Medicine.expiry_date >= first)
+        counts.append(db.select(func.count()).select_from(Medicine.__table__)
+                      .where(*criteria).scalar_subquery())
+    row = db.session.execute(db.select(*counts)).one()
+    return {name: count for (name, _), count in zip(EXPIRY_BUCKETS, row)}
+
+def expiry_query(bucket, today=None):
+    """Medicines in one bucket, soonest expiry first"""
+    first, last = bucket_bounds(bucket, today)
+    query = Medicine.query.filter(Medicine.expiry_date <= last)
+    if first is not None:
+        query = query.filter(Medicine.expiry_date >= first)
+    return query.order_by(Medicine.expiry_date, Medicine.id)
+
+def flag_expiring_stock(today=None, chunk_size=EXPIRY_FLAG_CHUNK_SIZE, echo=None):
+    """Bring every medicine's expiry_bucket up to date, one chunk per transaction.
+
+    For each bucket, looks up rows in its date range (an index range scan
+    on idx_medicine_expiry) whose flag is wrong and fixes them a chunk at
+    a time, so a daily run only writes the rows that moved bucket. Then
+    clears flags left on rows now beyond the horizon, for example after a
+    restock with a later date went in through a bulk path. Returns the
+    number of rows changed. Changed rows get a new updated_at, which the
+    medicine row fragments and the /medicines ETag are keyed on.
+    """
+    today = today or date.today()
+    table = Medicine.__table__
+    changed = 0
+
+    def fix(criteria, value):
+        nonlocal changed
+        while True:
+            ids = [row.id for row in db.session.query(table.c.id)
+                   .filter(*criteria).limit(chunk_size)]
+            if not ids:
+                return
+            result = db.session.execute(
+                table.update().where(table.c.id.in_(ids))
+                .values(expiry_bucket=value, updated_at=datetime.utcnow())
+            )
+            db.session.commit()
+            changed += result.rowcount
+            if echo:
+                echo(f'{value or "beyond horizon"}: {changed} changed')
+
+    for name, _ in EXPIRY_BUCKETS:
+        first, last = bucket_bounds(name, today)
+        criteria = [table.c.expiry_date <= last,
+                    or_(table.c.expiry_bucket.is_(None), table.c.expiry_bucket != name)]
+        if first is not None:
+            criteria.append(table.c.expiry_date >= first)
+        fix(criteria, name)
+
+    horizon = today + timedelta(days=EXPIRY_HORIZON)
+    fix([table.c.expiry_bucket.isnot(None), table.c.expiry_date > horizon], None)
+    return changed
+
+@expiry_cli.command('flag')
+@click.option('--chunk-size', default=EXPIRY_FLAG_CHUNK_SIZE, show_default=True)
+def flag_command(chunk_size):
+    """Recompute expiry buckets. Run daily, as buckets shift with the date."""
+    changed = flag_expiring_stock(chunk_size=chunk_size, echo=click.echo)
+    click.echo(f'Updated {changed} medicine(s).')
+    for name, count in expiry_summary().items():
+        click.echo(f'{name:<8} {count}')
@@ -0,0 +1,158 @@
+import csv
+import io
+import json
+import zlib
+from datetime import date
+import click
+from flask.cli import AppGroup
+from sqlalchemy import func
+from extensions import db
+from models import Medicine, Customer, Employee, Prescription, PrescriptionItem, Sale, SaleItem
+
+EXPORT_BATCH_SIZE = 1000
+EXPORT_FORMATS = ('csv', 'jsonl')
+
+export_cli = AppGroup('export', help='Streaming data export.')
+
+def _sales(start, end):
+    items = db.select(func.count(SaleItem.id)) \
+        .where(SaleItem.sale_id == Sale.id) \
+        .correlate(Sale).scalar_subquery()
+    query = db.select(
+        Sale.id.label('id'),
+        Sale.sale_date.label('sale_date'),
+        Customer.name.label('customer'),
+        Employee.name.label('employee'),
+        Medicine.name.label('medicine'),
+        items.label('item_count'),
+        Sale.quantity.label('quantity'),
+        Sale.unit_price.label('unit_price'),
+        Sale.total_amount.label('total_amount')
+    ).join(Customer, Customer.id == Sale.customer_id) \
+        .join(Employee, Employee.id == Sale.employee_id) \
+        .outerjoin(Medicine, Medicine.id == Sale.medicine_id)
+    return _date_range(query, Sale.sale_date, start, end).order_by(Sale.sale_date, Sale.id)
+
+def _prescriptions(start, end):
+    items = db.select(func.count(PrescriptionItem.id)) \
+        .where(PrescriptionItem.prescription_id == Prescription.id) \
+        .correlate(Prescription).scalar_subquery()
+    query = db.select(
+        Prescription.id.label('id'),
+        Prescription.prescription_date.label('prescription_date'),
+        Customer.name.label('customer'),
+        Prescription.doctor_name.label('doctor_name'),
+        items.label('item_count'),
+        Prescription.notes.label('notes')
+    ).join(Customer, Customer.id == Prescription.customer_id)
+    return _date_range(query, Prescription.prescription_date, start, end) \
+        .order_by(Prescription.prescription_date, Prescription.id)
+
+def _inventory(start, end):
+    # Current stock has no date of its own; the range is ignored
+    return db.select(
+        Medicine.id,
+        Medicine.name,
+        Medicine.manufacturer,
+        Medicine.category,
+        Medicine.price,
+        Medicine.stock_quantity,
+        Medicine.reorder_level,
+        Medicine.needs_reorder,
+        Medicine.expiry_date
+    ).order_by(Medicine.id)
+
+def _date_range(query, column, start, end):
+    # Both ends inclusive; a range scan on the date index
+    if start is not None:
+        query = query.where(column >= start)
+    if end is not None:
+        query = query.where(column <= end)
+    return query
+
+# Dataset name -> query builder taking (start, end)
+EXPORTS = {
+    'sales': _sales,
+    'prescriptions': _prescriptions,
+    'inventory': _inventory,
+}
+
+def stream_rows(dataset, start=None, end=None, batch_size=EXPORT_BATCH_SIZE):
+    """Yield the column names, then lists of row tuples of at most ``batch_size``.
+
+    ``yield_per`` makes the ORM fetch in batches, from a server-side cursor
+    where the driver has one; without it the whole result is buffered
+    before the first row. Rows are plain tuples, not instances, so nothing
+    accumulates in the session either.
+    """
+    query = EXPORTS[dataset](start, end)
+    result = db.session.execute(query.execution_options(yield_per=batch_size))
+    yield list(result.keys())
+    for partition in result.partitions(batch_size):
+        yield [tuple(row) for row in partition]
+
+def _json_value(value):
+    return value.isoformat() if isinstance(value, date) else str(value)
+
+def encode(rows, fmt='csv'):
+    """Turn a stream_rows generator into text chunks, one per batch"""
+    columns = next(rows)
+    buffer = io.StringIO()
+    if fmt == 'csv':
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        yield buffer.getvalue()
+        for batch in rows:
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerows(batch)
+            yield buffer.getvalue()
+        return
+    for batch in rows:
+        yield ''.join(json.dumps(dict(zip(columns, row)), default=_json_value) + '\n' for row in batch)
+
+def gzip_chunks(chunks):
+    """Compress a stream of text chunks into one gzip member as it goes"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+def export_stream(dataset, fmt='csv', start=None, end=None, gzip=False, batch_size=EXPORT_BATCH_SIZE):
+    """Bytes of an export, produced batch by batch"""
+    chunks = encode(stream_rows(dataset, start, end, batch_size), fmt)
+    if gzip:
+        return gzip_chunks(chunks)
+    return (chunk.encode('utf-8') for chunk in chunks)
+
+def export_filename(dataset, fmt, start=None, end=None, gzip=False):
+    parts = [dataset]
+    if start or end:
+        parts.append(f"{start or 'start'}_{end or date.today()}")
+    return '-'.join(str(part) for part in parts) + f'.{fmt}' + ('.gz' if gzip else '')
+
+def _export_command(dataset):
+    @click.option('--format', 'fmt', type=click.Choice(EXPORT_FORMATS), default='csv', show_default=True)
+    @click.option('--start', type=click.DateTime(['%Y-%m-%d']), help='First day, inclusive.')
+    @click.option('--end', type=click.DateTime(['%Y-%m-%d']), help='Last day, inclusive.')
+    @click.option('--gzip', 'compress', is_flag=True, help='Gzip the output.')
+    @click.option('--output', '-o', type=click.Path(dir_okay=False, allow_dash=True),
+                  help="File to write, '-' for stdout. Defaults to a name built from the options.")
+    @click.option('--batch-size', default=EXPORT_BATCH_SIZE, show_default=True, help='Rows fetched at a time.')
+    def command(fmt, start, end, compress, output, batch_size):
+        start = start.date() if start else None
+        end = end.date() if end else None
+        output = output or export_filename(dataset, fmt, start, end, compress)
+        with click.open_file(output, 'wb') as f:
+            for chunk in export_stream(dataset, fmt, start, end, compress, batch_size):
+                f.write(chunk)
+        if output != '-':
+            click.echo(f'Wrote {output}', err=True)
+
+    command.__doc__ = f'Export {dataset} as CSV or JSON lines.'
+    return click.command(dataset)(command)
+
+for _dataset in EXPORTS:
+    export_cli.add_command(_export_command(_dataset))
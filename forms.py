@@ -1,9 +1,16 @@
 from flask_wtf import FlaskForm, RecaptchaField
-from wtforms import StringField, PasswordField, SubmitField, TextAreaField, DecimalField, IntegerField, SelectField, BooleanField, FloatField, EmailField, TelField
+from flask_wtf.file import FileField, FileRequired, FileAllowed
+from wtforms import Form, FieldList, FormField, StringField, PasswordField, SubmitField, TextAreaField, DecimalField, IntegerField, SelectField, BooleanField, FloatField, EmailField, TelField
 from wtforms.validators import DataRequired, Email, Length, NumberRange, Optional, ValidationError, Regexp, EqualTo
 from wtforms.fields import DateField, DateTimeField
+from wtforms.widgets import html_params
+from flask import url_for
+from markupsafe import Markup
 from datetime import date, datetime
 import re
+from extensions import db
+from models import Customer, Medicine, Employee, User
+from sales import CHECKOUT_MAX_LINES
 
 def clean_data(data):
     if data:
@@ -11,6 +18,59 @@ def clean_data(data):
         return str(data).replace('<', '&lt;').replace('>', '&gt;')
     return data
 
+class LookupWidget:
+    """Hidden id input plus a search box that script.js wires to a JSON lookup endpoint"""
+    def __call__(self, field, **kwargs):
+        search_kwargs = {
+            'type': 'text',
+            'id': f'{field.id}_lookup',
+            'class': kwargs.pop('class', 'form-control'),
+            'value': field.display_text(),
+            'placeholder': kwargs.pop('placeholder', 'Start typing to search...'),
+            'autocomplete': 'off',
+            'data-lookup-url': url_for(field.endpoint, **field.endpoint_args),
+            'data-lookup-target': field.id,
+        }
+        hidden_kwargs = {
+            'type': 'hidden',
+            'id': field.id,
+            'name': field.name,
+            'value': field._value(),
+        }
+        return Markup(f'<input {html_params(**hidden_kwargs)}><input {html_params(**search_kwargs)}>')
+
+class LookupField(IntegerField):
+    """Foreign key picker validated with a single primary-key lookup.
+
+    Replaces a SelectField whose choices would list the whole table; the
+    browser searches through `endpoint` and only the chosen id is posted.
+    """
+    widget = LookupWidget()
+
+    def __init__(self, label=None, validators=None, model=None, endpoint=None, endpoint_args=None,
+                 display=None, **kwargs):
+        super().__init__(label, validators, **kwargs)
+        self.model = model
+        self.endpoint = endpoint
+        self.endpoint_args = endpoint_args or {}
+        self.display = display or (lambda obj: obj.name)
+        self.object = None
+
+    def get_object(self):
+        if self.data is None:
+            return None
+        if self.object is None or self.object.id != self.data:
+            self.object = db.session.get(self.model, self.data)
+        return self.object
+
+    def display_text(self):
+        obj = self.get_object()
+        return self.display(obj) if obj else ''
+
+    def pre_validate(self, form):
+        if self.data is not None and self.get_object() is None:
+            raise ValidationError(f'Not a valid {self.label.text.lower()}.')
+
 class BaseForm(FlaskForm):
     """Base form class with CSRF protection and common methods"""
     class Meta:
@@ -65,10 +125,22 @@ class MedicineForm(FlaskForm):
     reorder_level = IntegerField('Reorder Level', validators=[DataRequired(), NumberRange(min=0)])
     expiry_date = DateField('Expiry Date', validators=[DataRequired()])
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        obj = kwargs.get('obj')
+        self.original_expiry_date = obj.expiry_date if obj is not None else None
+
     def validate_expiry_date(self, field):
-        if field.data < date.today():
+        # An already expired medicine can still be edited without changing its date
+        if field.data < date.today() and field.data != self.original_expiry_date:
             raise ValidationError('Expiry date must be in the future')
 
+class MedicineImportForm(FlaskForm):
+    file = FileField('Price list', validators=[
+        FileRequired(),
+        FileAllowed(['csv', 'jsonl', 'ndjson'], 'CSV or JSON-lines files only')
+    ])
+
 class CustomerForm(FlaskForm):
     name = StringField('Name', validators=[DataRequired(), Length(min=2, max=100)])
     email = StringField('Email', validators=[DataRequired(), Email()])
@@ -83,21 +155,46 @@ class EmployeeForm(FlaskForm):
     hire_date = DateField('Hire Date', validators=[DataRequired()])
 
 class PrescriptionForm(FlaskForm):
-    customer_id = SelectField('Customer', coerce=int, validators=[DataRequired()])
+    customer_id = LookupField('Customer', validators=[DataRequired()],
+                              model=Customer, endpoint='api.search_customers')
     doctor_name = StringField('Doctor Name', validators=[DataRequired()])
     prescription_date = DateField('Prescription Date', validators=[DataRequired()])
     notes = TextAreaField('Notes')
 
 class SaleForm(FlaskForm):
-    customer_id = SelectField('Customer', coerce=int, validators=[DataRequired()])
-    medicine_id = SelectField('Medicine', coerce=int, validators=[DataRequired()])
-    employee_id = SelectField('Employee', coerce=int, validators=[DataRequired()])
+    customer_id = LookupField('Customer', validators=[DataRequired()],
+                              model=Customer, endpoint='api.search_customers')
+    medicine_id = LookupField('Medicine', validators=[DataRequired()],
+                              model=Medicine, endpoint='api.search_medicines', endpoint_args={'in_stock': 1},
+                              display=lambda m: f"{m.name} - Stock: {m.stock_quantity}")
+    employee_id = LookupField('Employee', validators=[DataRequired()],
+                              model=Employee, endpoint='api.search_employees')
     quantity = IntegerField('Quantity', validators=[
         DataRequired(),
         NumberRange(min=1, message='Quantity must be at least 1')
     ])
     sale_date = DateField('Sale Date', default=date.today, validators=[DataRequired()])
 
+class CartLineForm(Form):
+    # Plain ids: the checkout UPDATE checks existence and stock for every line at once
+    medicine_id = IntegerField('Medicine', validators=[DataRequired()])
+    quantity = IntegerField('Quantity', validators=[
+        DataRequired(),
+        NumberRange(min=1, max=9999, message="Quantity must be between 1 and 9,999")
+    ], default=1)
+
+class CheckoutForm(FlaskForm):
+    customer_id = LookupField('Customer', validators=[DataRequired()],
+                              model=Customer, endpoint='api.search_customers')
+    employee_id = LookupField('Employee', validators=[DataRequired()],
+                              model=Employee, endpoint='api.search_employees')
+    sale_date = DateField('Sale Date', default=date.today, validators=[DataRequired()])
+    lines = FieldList(FormField(CartLineForm), min_entries=0, max_entries=CHECKOUT_MAX_LINES)
+
+    def validate_lines(self, field):
+        if not field.entries:
+            raise ValidationError('Add at least one item to the cart.')
+
 class PrescriptionItemForm(BaseForm):
     medicine_id = SelectField('Medicine',
         coerce=int,
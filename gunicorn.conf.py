@@ -0,0 +1,37 @@
+# Gunicorn reads this file from the working directory on startup.
+import logging
+import os
+
+# Load the app once in the master and fork workers from it. create_app()
+# opens no connections, and post_fork below resets the pool anyway.
+preload_app = (os.environ.get('GUNICORN_PRELOAD') or 'true').lower() == 'true'
+
+def post_fork(server, worker):
+    # Workers must never share database connections opened by the master,
+    # e.g. when the app is loaded with --preload
+    from engine_profile import dispose_engines
+    dispose_engines()
+    logging.getLogger('gunicorn.error').info(f'Worker {worker.pid}: database connections reset')
+
+def post_worker_init(worker):
+    # Each worker logs the settings its own connections run with, once, so a
+    # PRAGMA that did not take shows up in the log without a bootstrap run
+    from engine_profile import log_engine_profile
+    app = worker.wsgi
+    with app.app_context():
+        log_engine_profile(app)
+
+def on_starting(server):
+    # Metrics files from a previous run would be added to this one's
+    from config import Config
+    if Config.METRICS:
+        from metrics import clear_directory
+        os.makedirs(Config.METRICS_DIR, exist_ok=True)
+        clear_directory(Config.METRICS_DIR)
+
+def child_exit(server, worker):
+    # A dead worker's requests still count, its in-flight gauges do not
+    from config import Config
+    if Config.METRICS:
+        from metrics import mark_process_dead
+        mark_process_dead(Config.METRICS_DIR, worker.pid)
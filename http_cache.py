@@ -0,0 +1,113 @@
+import hashlib
+import os
+import time
+from functools import lru_cache
+from flask import current_app, g, make_response, render_template, request, session
+from flask_login import current_user
+
+STATIC_MAX_AGE = 31536000  # one year; a fingerprinted URL never changes content
+
+def static_fingerprint(filename):
+    """Short content hash of a file in the static folder, or None if it does not exist"""
+    path = os.path.join(current_app.static_folder, filename)
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return _file_digest(path, stat.st_mtime_ns, stat.st_size)
+
+@lru_cache(maxsize=256)
+def _file_digest(path, mtime_ns, size):
+    # Keyed on mtime and size, so an edited file is hashed again
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()[:12]
+
+def _fingerprint_static_urls(endpoint, values):
+    # url_for('static', filename=...) gains ?v=<content hash>
+    if endpoint == 'static' and 'filename' in values and 'v' not in values:
+        fingerprint = static_fingerprint(values['filename'])
+        if fingerprint:
+            values['v'] = fingerprint
+
+def _cache_static(response):
+    # Only the current version is immutable; a stale ?v= keeps Flask's revalidation
+    if request.endpoint != 'static' or response.status_code not in (200, 304):
+        return response
+    version = request.args.get('v')
+    if version and version == static_fingerprint(request.view_args['filename']):
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = STATIC_MAX_AGE
+        response.cache_control.immutable = True
+        response.expires = int(time.time() + STATIC_MAX_AGE)
+    return response
+
+def _scan_templates(folder):
+    digest = hashlib.sha1()
+    for root, _, files in sorted(os.walk(folder)):
+        for name in sorted(files):
+            stat = os.stat(os.path.join(root, name))
+            digest.update(f'{root}/{name}:{stat.st_mtime_ns}:{stat.st_size}'.encode())
+    return digest.hexdigest()[:12]
+
+_cached_scan = lru_cache(maxsize=4)(_scan_templates)
+
+def templates_version():
+    """Changes whenever a template does, so a deploy invalidates every page ETag"""
+    folder = os.path.join(current_app.root_path, current_app.template_folder)
+    if not current_app.debug:
+        return _cached_scan(folder)
+    # Templates can be edited under a running debug server; scan once per request
+    if 'templates_version' not in g:
+        g.templates_version = _scan_templates(folder)
+    return g.templates_version
+
+def rows_version(rows):
+    """Identity and newest change of the rows on a page: ([(table, id)], max updated_at).
+
+    Rows without updated_at (sale lines never change) count with their
+    created_at. None entries, such as the missing medicine of an itemised
+    sale, are skipped.
+    """
+    rows = [row for row in rows if row is not None]
+    stamps = [getattr(row, 'updated_at', None) or row.created_at for row in rows]
+    return [(row.__tablename__, row.id) for row in rows], max(stamps) if stamps else None
+
+def page_etag(*parts):
+    """Weak ETag for a page showing ``parts``.
+
+    Besides the data, the HTML depends on the URL, the user in the navbar,
+    the templates and the CSRF tokens in its forms. Tokens are only valid
+    for WTF_CSRF_TIME_LIMIT, so the tag also changes every half of that
+    and a page kept by the browser never carries an expired token.
+    """
+    window = (current_app.config.get('WTF_CSRF_TIME_LIMIT') or 3600) // 2
+    user = (current_user.get_id(), getattr(current_user, 'updated_at', None)) \
+        if current_user.is_authenticated else None
+    key = repr((parts, request.full_path, user, int(time.time() // window), templates_version()))
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+def render_conditional(etag_parts, template, **context):
+    """render_template() with a weak ETag, or an empty 304 if the client has this version.
+
+    The browser must revalidate every time (private, no-cache), but an
+    unchanged page costs only the queries that built ``etag_parts``.
+    Pages with flashed messages waiting are always rendered, since
+    showing them is what clears them.
+    """
+    if session.get('_flashes'):
+        return render_template(template, **context)
+    etag = page_etag(*etag_parts)
+    if request.if_none_match.contains_weak(etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = make_response(render_template(template, **context))
+    response.set_etag(etag, weak=True)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+def install_http_cache(app):
+    """Fingerprinted static URLs with long-lived caching"""
+    app.url_defaults(_fingerprint_static_urls)
+    app.after_request(_cache_static)
@@ -0,0 +1,179 @@
+import hashlib
+import logging
+import os
+import random
+import re
+import time
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime
+from functools import lru_cache
+from logging.handlers import RotatingFileHandler
+from flask import request
+from jinja2 import Template
+from sqlalchemy import event
+from extensions import db
+
+slow_query_logger = logging.getLogger('pharmacy.slow_queries')
+
+# Timings of the request this thread is handling, None outside requests
+_current = ContextVar('request_timings', default=None)
+
+# Per-process settings, filled in by install_instrumentation
+_settings = {'slow_query': 0.2, 'slow_request': 0.5, 'sample_rate': 1.0}
+
+# Recently sampled slow requests of this worker, oldest first
+slow_requests = deque(maxlen=100)
+
+class RequestTimings:
+    __slots__ = ('started', 'sql_count', 'sql_time', 'template_time', 'slowest_query', 'slowest_statement')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.slowest_query = 0.0
+        self.slowest_statement = None
+
+class TimedTemplate(Template):
+    """Adds its render time to the current request's timings.
+
+    ``extends`` and ``include`` render inside the outer template, so each
+    render_template() is counted once.
+    """
+
+    def render(self, *args, **kwargs):
+        timings = _current.get()
+        if timings is None:
+            return super().render(*args, **kwargs)
+        started = time.perf_counter()
+        try:
+            return super().render(*args, **kwargs)
+        finally:
+            timings.template_time += time.perf_counter() - started
+
+_PARAMETERS = re.compile(r'%\(\w+\)s|(?<!:):\w+\b|\$\d+')
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_LISTS = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_SPACE = re.compile(r'\s+')
+
+@lru_cache(maxsize=1024)
+def fingerprint(statement):
+    """Return (digest, normalized) for a SQL statement.
+
+    Literals and bound parameters become ``?`` and IN lists of any length
+    become ``(?+)``, so the same query with other values or another number
+    of ids groups under one digest.
+    """
+    normalized = _SPACE.sub(' ', statement).strip()
+    normalized = _PARAMETERS.sub('?', normalized)
+    normalized = _LITERALS.sub('?', normalized)
+    normalized = _LISTS.sub('(?+)', normalized)
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()[:12], normalized
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # Overwritten by the next statement, so a failed execute leaves nothing behind
+    conn.info['query_started'] = time.perf_counter()
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.pop('query_started', None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    timings = _current.get()
+    if timings is not None:
+        timings.sql_count += 1
+        timings.sql_time += elapsed
+        if elapsed > timings.slowest_query:
+            timings.slowest_query = elapsed
+            timings.slowest_statement = statement
+    if elapsed >= _settings['slow_query']:
+        digest, normalized = fingerprint(statement)
+        endpoint = request.endpoint if timings is not None else None
+        slow_query_logger.warning(f'{elapsed * 1000:.1f} ms [{digest}] {endpoint or "-"} {normalized}')
+
+def _start_request():
+    _current.set(RequestTimings())
+
+def server_timing(timings, total):
+    """Server-Timing header value: SQL, template and total time in ms"""
+    return (f'db;dur={timings.sql_time * 1000:.2f};desc="{timings.sql_count} queries", '
+            f'tpl;dur={timings.template_time * 1000:.2f}, '
+            f'total;dur={total * 1000:.2f}')
+
+def _finish_request(response):
+    timings = _current.get()
+    if timings is None:
+        return response
+    total = time.perf_counter() - timings.started
+    response.headers['Server-Timing'] = server_timing(timings, total)
+    if total >= _settings['slow_request'] and slow_requests.maxlen \
+            and random.random() < _settings['sample_rate']:
+        slow_requests.append(_slow_request_entry(timings, total, response.status_code))
+    return response
+
+def _end_request(exc):
+    _current.set(None)
+
+def _slow_request_entry(timings, total, status):
+    entry = {
+        'at': datetime.utcnow().isoformat(timespec='seconds'),
+        'method': request.method,
+        'path': request.path,
+        'endpoint': request.endpoint,
+        'status': status,
+        'total_ms': round(total * 1000, 2),
+        'sql_ms': round(timings.sql_time * 1000, 2),
+        'sql_count': timings.sql_count,
+        'template_ms': round(timings.template_time * 1000, 2),
+        'slowest_query': None,
+    }
+    if timings.slowest_statement is not None:
+        digest, normalized = fingerprint(timings.slowest_statement)
+        entry['slowest_query'] = {
+            'ms': round(timings.slowest_query * 1000, 2),
+            'fingerprint': digest,
+            'statement': normalized,
+        }
+    return entry
+
+def slow_request_snapshot():
+    """Sampled slow requests of this worker, slowest first"""
+    return sorted(slow_requests, key=lambda entry: entry['total_ms'], reverse=True)
+
+def _add_log_file():
+    # Same convention as the app log: only when `flask bootstrap dirs` made logs/
+    if slow_query_logger.handlers or not os.path.isdir('logs'):
+        return
+    handler = RotatingFileHandler('logs/slow_queries.log', maxBytes=1048576, backupCount=5)
+    handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+    slow_query_logger.addHandler(handler)
+
+def install_instrumentation(app):
+    """Time SQL and template rendering per request when INSTRUMENTATION is on.
+
+    When it is off nothing is installed, so there is no cost at all. Must
+    run before the first template is loaded.
+    """
+    if not app.config['INSTRUMENTATION']:
+        return False
+    global slow_requests
+    _settings['slow_query'] = app.config['SLOW_QUERY_MS'] / 1000
+    _settings['slow_request'] = app.config['SLOW_REQUEST_MS'] / 1000
+    _settings['sample_rate'] = app.config['SLOW_REQUEST_SAMPLE_RATE']
+    if slow_requests.maxlen != app.config['SLOW_REQUEST_BUFFER']:
+        slow_requests = deque(slow_requests, maxlen=app.config['SLOW_REQUEST_BUFFER'])
+
+    with app.app_context():
+        engine = db.engine
+    if not event.contains(engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+    app.jinja_env.template_class = TimedTemplate
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.teardown_request(_end_request)
+    _add_log_file()
+    return True
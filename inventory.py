@@ -0,0 +1,129 @@
+import logging
+import random
+import time
+from datetime import datetime
+from sqlalchemy import case, func
+from sqlalchemy.exc import OperationalError
+from extensions import db
+from models import Medicine
+from catalog import STOCK_NAMESPACE, mark_touched
+from ledger import record_movements
+
+logger = logging.getLogger(__name__)
+
+LOCK_RETRY_ATTEMPTS = 5
+LOCK_RETRY_BASE_DELAY = 0.05  # seconds, doubled on each attempt
+
+class InsufficientStock(Exception):
+    def __init__(self, medicine_id, requested, available=None):
+        self.medicine_id = medicine_id
+        self.requested = requested
+        self.available = available
+        if available is None:
+            message = f"Medicine {medicine_id} not found."
+        else:
+            message = f"Not enough stock. Only {available} units available."
+        super().__init__(message)
+
+def decrement_stock_many(quantities, sale_id=None, kind='sale'):
+    """Take stock for a whole basket, ``{medicine_id: quantity}``, in one UPDATE.
+
+    The UPDATE only runs if every row has enough units, so the check and
+    the write stay atomic however many lines there are, and a basket with
+    a short line changes nothing. InsufficientStock is then raised for the
+    first line that falls short, read with the negated predicate. The
+    reorder flag is updated by the same statement, and the matching ledger
+    movements by one more in the same transaction.
+    """
+    if not quantities:
+        return
+    table = Medicine.__table__
+    ids = list(quantities)
+    amount = case(quantities, value=table.c.id)
+    stocked = table.alias('stocked')
+    enough = db.select(func.count()).select_from(stocked).where(
+        stocked.c.id.in_(ids),
+        stocked.c.stock_quantity >= case(quantities, value=stocked.c.id)
+    ).scalar_subquery()
+    result = db.session.execute(
+        table.update()
+        .where(table.c.id.in_(ids))
+        .where(enough == len(ids))
+        .values(stock_quantity=table.c.stock_quantity - amount,
+                needs_reorder=table.c.stock_quantity - amount <= table.c.reorder_level,
+                updated_at=datetime.utcnow())
+    )
+    if result.rowcount != len(ids):
+        # Nothing was decremented, so the rows still hold the stock the UPDATE saw
+        rows = {row.id: row for row in db.session.execute(
+            db.select(table.c.id, table.c.stock_quantity, (table.c.stock_quantity < amount).label('short'))
+            .where(table.c.id.in_(ids))
+        )}
+        for medicine_id, quantity in quantities.items():
+            row = rows.get(medicine_id)
+            if row is None:
+                raise InsufficientStock(medicine_id, quantity)
+            if row.short:
+                raise InsufficientStock(medicine_id, quantity, row.stock_quantity)
+        # Restocked after the UPDATE read it, which SQLite's write lock rules out
+        medicine_id = ids[0]
+        raise InsufficientStock(medicine_id, quantities[medicine_id], rows[medicine_id].stock_quantity)
+    record_movements(quantities, kind, sale_id, sign=-1)
+    mark_touched(db.session, STOCK_NAMESPACE)
+
+def increment_stock_many(quantities, sale_id=None, kind='sale_reversal'):
+    """Return stock for a whole basket, ``{medicine_id: quantity}``, in one UPDATE"""
+    if not quantities:
+        return
+    table = Medicine.__table__
+    amount = case(quantities, value=table.c.id)
+    db.session.execute(
+        table.update()
+        .where(table.c.id.in_(list(quantities)))
+        .values(stock_quantity=table.c.stock_quantity + amount,
+                needs_reorder=table.c.stock_quantity + amount <= table.c.reorder_level,
+                updated_at=datetime.utcnow())
+    )
+    record_movements(quantities, kind, sale_id)
+    mark_touched(db.session, STOCK_NAMESPACE)
+
+def decrement_stock(medicine_id, quantity, sale_id=None):
+    """Take ``quantity`` units out of stock in a single conditional UPDATE.
+
+    The check and the write happen in one statement, so concurrent sales
+    can never oversell or lose each other's updates. Raises
+    InsufficientStock when the row does not have enough units.
+    """
+    decrement_stock_many({medicine_id: quantity}, sale_id)
+
+def increment_stock(medicine_id, quantity, sale_id=None):
+    """Return ``quantity`` units to stock in a single UPDATE"""
+    increment_stock_many({medicine_id: quantity}, sale_id)
+
+def _is_lock_error(error):
+    message = str(error.orig).lower() if error.orig is not None else str(error).lower()
+    return 'database is locked' in message or 'database is busy' in message or 'deadlock' in message
+
+def run_with_lock_retry(operation, attempts=LOCK_RETRY_ATTEMPTS, base_delay=LOCK_RETRY_BASE_DELAY):
+    """Run ``operation`` and commit, retrying the whole unit of work on lock contention.
+
+    ``operation`` must be safe to call again after a rollback, i.e. build all
+    of its ORM objects itself. Exponential backoff with jitter keeps
+    competing workers from retrying in lockstep.
+    """
+    for attempt in range(1, attempts + 1):
+        try:
+            result = operation()
+            db.session.commit()
+            return result
+        except OperationalError as e:
+            db.session.rollback()
+            if not _is_lock_error(e) or attempt == attempts:
+                raise
+            delay = base_delay * (2 ** (attempt - 1))
+            delay += random.uniform(0, delay)
+            logger.warning(f"Database locked, retrying in {delay:.3f}s (attempt {attempt}/{attempts})")
+            time.sleep(delay)
+        except Exception:
+            db.session.rollback()
+            raise
@@ -0,0 +1,552 @@
+import json
+import logging
+import multiprocessing
+import os
+import re
+import signal
+import socket
+import time
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime, timedelta
+from uuid import uuid4
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import case, func, or_
+from sqlalchemy.exc import IntegrityError, OperationalError
+from extensions import db
+from models import Job, Medicine
+
+logger = logging.getLogger(__name__)
+
+PRICE_CHANGE_CHUNK_SIZE = 1000
+PROGRESS_INTERVAL = 1.0  # seconds between progress writes
+HEARTBEAT_INTERVAL = 30  # seconds between worker heartbeats
+
+JobType = namedtuple('JobType', 'handler concurrency max_attempts description')
+
+# Job kind -> JobType, filled in by @job_type below
+JOB_TYPES = {}
+
+_UPLOAD_NAME = re.compile(r'[0-9a-f]{32}\.upload\.(?:csv|jsonl)')
+
+jobs_cli = AppGroup('jobs', help='Background jobs.')
+
+class JobError(Exception):
+    """Fails a job for good: raised for problems a retry cannot fix"""
+
+def job_type(kind, concurrency=1, max_attempts=None):
+    """Register ``handler(job)`` for a kind of job.
+
+    The handler gets a RunningJob and returns a JSON-serialisable result.
+    At most ``concurrency`` jobs of the kind run at once across all
+    workers. Handlers may run more than once, after a failure or a dead
+    worker, so they must be safe to repeat or resume from a checkpoint.
+    """
+    def register(handler):
+        description = (handler.__doc__ or kind).strip().splitlines()[0]
+        JOB_TYPES[kind] = JobType(handler, concurrency, max_attempts, description)
+        return handler
+    return register
+
+def enqueue(kind, params=None, idempotency_key=None, max_attempts=None):
+    """Queue a job and commit. Returns (job, created).
+
+    If ``idempotency_key`` was used before, nothing is queued and the job
+    it was used for is returned instead, whatever its status.
+    """
+    if kind not in JOB_TYPES:
+        raise ValueError(f'Unknown job type: {kind}')
+    if idempotency_key:
+        existing = Job.query.filter_by(idempotency_key=idempotency_key).first()
+        if existing is not None:
+            return existing, False
+    job = Job(
+        kind=kind,
+        params=json.dumps(params or {}),
+        idempotency_key=idempotency_key or None,
+        max_attempts=max_attempts or JOB_TYPES[kind].max_attempts or current_app.config['JOB_MAX_ATTEMPTS'],
+        run_after=datetime.utcnow()
+    )
+    db.session.add(job)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Another request queued the same key first
+        db.session.rollback()
+        existing = Job.query.filter_by(idempotency_key=idempotency_key).first()
+        if existing is None:
+            raise
+        return existing, False
+    return job, True
+
+def _iso(value):
+    return value.isoformat() if value else None
+
+def job_payload(job):
+    """JSON view of a job for the API and the CLI"""
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'status': job.status,
+        'params': json.loads(job.params),
+        'progress': {
+            'done': job.progress_done,
+            'total': job.progress_total,
+            'message': job.progress_message,
+        },
+        'result': json.loads(job.result) if job.result else None,
+        'error': job.error,
+        'attempts': job.attempts,
+        'max_attempts': job.max_attempts,
+        'idempotency_key': job.idempotency_key,
+        'created_at': _iso(job.created_at),
+        'run_after': _iso(job.run_after),
+        'started_at': _iso(job.started_at),
+        'finished_at': _iso(job.finished_at),
+    }
+
+class RunningJob:
+    """What a handler sees of its job: params, checkpoint and progress reporting"""
+
+    def __init__(self, job):
+        self.id = job.id
+        self.kind = job.kind
+        self.params = json.loads(job.params)
+        self.checkpoint = json.loads(job.checkpoint) if job.checkpoint else None
+        self.attempt = job.attempts
+        # Latest progress reported, including what throttling kept from the table
+        self.latest = {}
+        self._last_progress = 0.0
+
+    def _update(self, **values):
+        table = Job.__table__
+        db.session.execute(table.update().where(table.c.id == self.id).values(**values))
+
+    def save_checkpoint(self, value):
+        """Remember how far the job got, in the caller's transaction.
+
+        Committed together with the work it describes, so a retry can pick
+        up exactly where the last commit left off.
+        """
+        self.checkpoint = value
+        self._update(checkpoint=json.dumps(value))
+
+    def progress(self, done=None, total=None, message=None, force=False):
+        """Report progress, written at most once per PROGRESS_INTERVAL.
+
+        Inside an open transaction the update is committed with the
+        handler's own work; otherwise it is committed straight away.
+        """
+        if done is not None:
+            self.latest['progress_done'] = done
+        if total is not None:
+            self.latest['progress_total'] = total
+        if message is not None:
+            self.latest['progress_message'] = message[:200]
+        now = time.monotonic()
+        if not force and now - self._last_progress < PROGRESS_INTERVAL:
+            return
+        self._last_progress = now
+        values = dict(self.latest, heartbeat_at=datetime.utcnow())
+        pending = db.session().in_transaction()
+        self._update(**values)
+        if not pending:
+            db.session.commit()
+
+    def echo(self, message):
+        # For the echo= callbacks of the maintenance functions
+        self.progress(message=message)
+
+def _retry_delay(attempts):
+    return timedelta(seconds=current_app.config['JOB_RETRY_DELAY'] * 2 ** max(attempts - 1, 0))
+
+def record_failure(job_id, error, retry=True):
+    """Requeue a running job with a growing delay, or fail it once out of attempts.
+
+    Returns the job's new status.
+    """
+    job = db.session.get(Job, job_id)
+    if job is None or job.status != 'running':
+        return None
+    now = datetime.utcnow()
+    job.error = error[:2000]
+    job.worker = None
+    if retry and job.attempts < job.max_attempts:
+        job.status = 'queued'
+        job.run_after = now + _retry_delay(job.attempts)
+    else:
+        job.status = 'failed'
+        job.finished_at = now
+    db.session.commit()
+    return job.status
+
+def run_job(job_id):
+    """Run one claimed job in this process and record how it ended"""
+    job = db.session.get(Job, job_id)
+    if job is None or job.status != 'running':
+        return None
+    running = RunningJob(job)
+    registered = JOB_TYPES.get(job.kind)
+    db.session.commit()
+    try:
+        if registered is None:
+            raise JobError(f'Unknown job type: {running.kind}')
+        result = registered.handler(running)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.exception(f'Job {job_id} ({running.kind}) failed on attempt {running.attempt}')
+        return record_failure(job_id, f'{type(e).__name__}: {e}', retry=not isinstance(e, JobError))
+
+    values = dict(running.latest, status='succeeded', result=json.dumps(result), error=None,
+                  finished_at=datetime.utcnow())
+    if running.latest.get('progress_total') is not None:
+        values['progress_done'] = running.latest['progress_total']
+    table = Job.__table__
+    db.session.execute(table.update().where(table.c.id == job_id, table.c.status == 'running').values(values))
+    db.session.commit()
+    return 'succeeded'
+
+def claim_jobs(slots, worker):
+    """Mark up to ``slots`` due jobs as running for ``worker`` and return their ids.
+
+    The claim is a conditional UPDATE that also checks the kind's running
+    count, so several workers never exceed a kind's concurrency between
+    them.
+    """
+    table = Job.__table__
+    now = datetime.utcnow()
+    candidates = db.session.query(table.c.id, table.c.kind) \
+        .filter(table.c.status == 'queued', table.c.run_after <= now) \
+        .order_by(table.c.id).limit(slots * 10).all()
+    claimed = []
+    for job_id, kind in candidates:
+        if len(claimed) == slots:
+            break
+        registered = JOB_TYPES.get(kind)
+        if registered is None:
+            db.session.execute(table.update().where(table.c.id == job_id, table.c.status == 'queued')
+                               .values(status='failed', error=f'Unknown job type: {kind}', finished_at=now))
+            db.session.commit()
+            continue
+        running = db.select(func.count()).select_from(table) \
+            .where(table.c.kind == kind, table.c.status == 'running').scalar_subquery()
+        result = db.session.execute(
+            table.update()
+            .where(table.c.id == job_id, table.c.status == 'queued', running < registered.concurrency)
+            .values(status='running', worker=worker, attempts=table.c.attempts + 1,
+                    started_at=now, heartbeat_at=now, finished_at=None)
+        )
+        db.session.commit()
+        if result.rowcount:
+            claimed.append(job_id)
+    return claimed
+
+def requeue_stale(stale_after):
+    """Give jobs of workers that stopped heartbeating back to the queue. Returns their ids."""
+    cutoff = datetime.utcnow() - timedelta(seconds=stale_after)
+    stale = [row.id for row in db.session.query(Job.id).filter(
+        Job.status == 'running', or_(Job.heartbeat_at < cutoff, Job.heartbeat_at.is_(None)))]
+    for job_id in stale:
+        record_failure(job_id, 'Worker stopped responding')
+    return stale
+
+def _heartbeat(job_ids):
+    table = Job.__table__
+    db.session.execute(table.update().where(table.c.id.in_(job_ids), table.c.status == 'running')
+                       .values(heartbeat_at=datetime.utcnow()))
+    db.session.commit()
+
+# The app pool processes run jobs under; set in the parent before forking
+_app = None
+
+def _init_process():
+    # Ctrl-C stops the worker from claiming; jobs already running finish.
+    # SIGTERM, sent when the pool is torn down, must not run the parent's handler.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    # Forget the parent's session without touching its connection
+    db.session.registry.clear()
+    _app.app_context().push()
+
+def _run_in_process(job_id):
+    try:
+        return run_job(job_id)
+    finally:
+        db.session.remove()
+
+def work(processes, poll_interval, stale_after, burst=False, echo=None):
+    """Claim and run jobs in a pool of ``processes`` until stopped.
+
+    SIGTERM or Ctrl-C stop claiming and wait for running jobs. With
+    ``burst`` the worker exits as soon as nothing is due or running. A
+    pool process that dies takes its job back to the queue as a failed
+    attempt. Returns the number of jobs run.
+    """
+    global _app
+    _app = current_app._get_current_object()
+    name = f'{socket.gethostname()}:{os.getpid()}'
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        if echo:
+            echo('Stopping: waiting for running jobs')
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    context = multiprocessing.get_context('fork')
+    pool = ProcessPoolExecutor(processes, mp_context=context, initializer=_init_process)
+    running = {}
+    finished = 0
+    broken = False
+    last_heartbeat = last_stale_check = 0.0
+    try:
+        while True:
+            claimed = []
+            try:
+                now = time.monotonic()
+                if now - last_stale_check >= stale_after / 4:
+                    for job_id in requeue_stale(stale_after):
+                        logger.warning(f'Job {job_id} was abandoned by its worker; requeued')
+                    last_stale_check = now
+                if running and now - last_heartbeat >= HEARTBEAT_INTERVAL:
+                    _heartbeat(list(running.values()))
+                    last_heartbeat = now
+                if not stopping and not broken and len(running) < processes:
+                    claimed = claim_jobs(processes - len(running), name)
+            except OperationalError as e:
+                # Usually SQLite busy with a long job chunk; try again next round
+                db.session.rollback()
+                logger.warning(f'Job queue unavailable: {e}')
+            finally:
+                # Pool processes are forked on submit and must not inherit a connection
+                db.session.remove()
+
+            for job_id in claimed:
+                running[pool.submit(_run_in_process, job_id)] = job_id
+                if echo:
+                    echo(f'Started job {job_id}')
+
+            if not running:
+                if stopping or (burst and not claimed):
+                    break
+                time.sleep(poll_interval)
+                continue
+
+            done, _ = wait(running, timeout=poll_interval, return_when=FIRST_COMPLETED)
+            for future in done:
+                job_id = running.pop(future)
+                finished += 1
+                try:
+                    outcome = future.result()
+                except Exception as e:
+                    broken = True
+                    outcome = record_failure(job_id, f'Worker process died: {type(e).__name__}: {e}')
+                    db.session.remove()
+                if echo:
+                    echo(f'Job {job_id} {outcome}')
+            if broken and not running:
+                # Every job of a broken pool has failed by now; start a fresh one
+                pool.shutdown(wait=False)
+                pool = ProcessPoolExecutor(processes, mp_context=context, initializer=_init_process)
+                broken = False
+    finally:
+        pool.shutdown(wait=True)
+    return finished
+
+def prune_jobs(older_than):
+    """Delete finished jobs older than ``older_than``. Returns the number deleted."""
+    deleted = Job.query.filter(Job.status.in_(('succeeded', 'failed')), Job.finished_at < older_than) \
+        .delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
+
+# Job types. Each wraps an existing maintenance function, so a job does
+# exactly what the matching CLI command does.
+
+@job_type('rollups.backfill')
+def _rollups_backfill(job):
+    """Rebuild the daily sales rollups from the sale table"""
+    from rollups import backfill, BACKFILL_CHUNK_SIZE
+    return {'sales': backfill(job.params.get('chunk_size', BACKFILL_CHUNK_SIZE), echo=job.echo)}
+
+@job_type('expiry.flag')
+def _expiry_flag(job):
+    """Recompute the expiry bucket of every medicine"""
+    from expiry import flag_expiring_stock, expiry_summary
+    changed = flag_expiring_stock(echo=job.echo)
+    return {'changed': changed, 'buckets': expiry_summary()}
+
+@job_type('reorder.refresh')
+def _reorder_refresh(job):
+    """Recompute the reorder flag from stock and reorder levels"""
+    from reorder import refresh_reorder_flags, reorder_count
+    fixed = refresh_reorder_flags()
+    db.session.commit()
+    return {'fixed': fixed, 'queue': reorder_count()}
+
+@job_type('counters.reconcile')
+def _counters_reconcile(job):
+    """Correct the entity counters from real table counts"""
+    from counters import reconcile_counts
+    result = reconcile_counts(fix=True)
+    db.session.commit()
+    return {'drifted': result['drifted'], 'counts': result['actual']}
+
+@job_type('stock.snapshot')
+def _stock_snapshot(job):
+    """Snapshot stock for every medicine that moved since its last snapshot"""
+    from ledger import take_snapshots
+    count = take_snapshots()
+    db.session.commit()
+    return {'snapshots': count}
+
+@job_type('search.rebuild')
+def _search_rebuild(job):
+    """Rebuild the medicine full-text index"""
+    from search import fts5_supported, rebuild_fts_index
+    connection = db.session.connection()
+    if not fts5_supported(connection):
+        raise JobError('This database does not support FTS5.')
+    count = rebuild_fts_index(connection)
+    db.session.commit()
+    return {'indexed': count}
+
+def imports_dir():
+    return os.path.join(current_app.instance_path, 'imports')
+
+@job_type('medicines.import', concurrency=2)
+def _medicines_import(job):
+    """Create or update medicines from an uploaded CSV or JSON-lines file"""
+    from catalog_import import import_medicines, import_format
+    upload = job.params.get('upload', '')
+    # Only files the upload form saved, never an arbitrary path
+    if not _UPLOAD_NAME.fullmatch(upload):
+        raise JobError(f'Invalid upload name: {upload!r}')
+    path = os.path.join(imports_dir(), upload)
+    if not os.path.exists(path):
+        raise JobError(f'Upload {upload} no longer exists')
+    errors_name = f'{uuid4().hex}.csv'
+    errors_path = os.path.join(imports_dir(), errors_name)
+    # A rerun upserts the same rows again, which leaves the catalog as one run would
+    with open(path, encoding='utf-8-sig', newline='') as stream, \
+            open(errors_path, 'w', encoding='utf-8', newline='') as errors:
+        counts = import_medicines(stream, import_format(upload), errors=errors, echo=job.echo)
+    os.remove(path)
+    if not counts['failed']:
+        os.remove(errors_path)
+        errors_name = None
+    return dict(counts, filename=job.params.get('filename'), errors_name=errors_name)
+
+@job_type('medicines.price_change')
+def _price_change(job):
+    """Change medicine prices by a percentage, optionally in one category"""
+    from catalog import mark_touched
+    try:
+        factor = 1 + float(job.params['percent']) / 100
+    except (KeyError, TypeError, ValueError):
+        raise JobError('percent is required and must be a number')
+    if factor <= 0:
+        raise JobError('percent must be above -100')
+    table = Medicine.__table__
+    criteria = []
+    if job.params.get('category'):
+        criteria.append(table.c.category == job.params['category'])
+    chunk_size = job.params.get('chunk_size', PRICE_CHANGE_CHUNK_SIZE)
+    total = db.session.query(func.count()).select_from(table).filter(*criteria).scalar()
+    # Resume after the last committed chunk, so no price changes twice
+    state = job.checkpoint or {'last_id': 0, 'changed': 0}
+    new_price = func.round(table.c.price * factor, 2)
+    while True:
+        ids = [row.id for row in db.session.query(table.c.id)
+               .filter(table.c.id > state['last_id'], *criteria)
+               .order_by(table.c.id).limit(chunk_size)]
+        if not ids:
+            break
+        db.session.execute(
+            table.update().where(table.c.id.in_(ids)).values(
+                price=case((new_price < 0.01, 0.01), else_=new_price),
+                updated_at=datetime.utcnow()
+            )
+        )
+        state = {'last_id': ids[-1], 'changed': state['changed'] + len(ids)}
+        job.save_checkpoint(state)
+        job.progress(state['changed'], total, force=True)
+        mark_touched(db.session, 'medicine')
+        db.session.commit()
+    return {'changed': state['changed']}
+
+def _parse_params(pairs):
+    params = {}
+    for pair in pairs:
+        key, sep, value = pair.partition('=')
+        if not sep:
+            raise click.BadParameter(f'{pair!r} is not key=value', param_hint='--param')
+        try:
+            params[key] = json.loads(value)
+        except ValueError:
+            params[key] = value
+    return params
+
+def _echo_job(job):
+    progress = f'{job.progress_done}/{job.progress_total}' if job.progress_total else str(job.progress_done)
+    click.echo(f'{job.id:>6} {job.kind:<24} {job.status:<10} {job.attempts}/{job.max_attempts} '
+               f'{progress:>12} {job.progress_message or job.error or ""}')
+
+@jobs_cli.command('worker')
+@click.option('--processes', type=int, help='Jobs run at once. Defaults to JOB_WORKER_PROCESSES.')
+@click.option('--burst', is_flag=True, help='Exit once no job is due or running.')
+def worker_command(processes, burst):
+    """Run queued jobs until stopped."""
+    config = current_app.config
+    processes = processes or config['JOB_WORKER_PROCESSES']
+    click.echo(f'Job worker {os.getpid()}: {processes} process(es), types: {", ".join(sorted(JOB_TYPES))}')
+    count = work(processes, config['JOB_POLL_INTERVAL'], config['JOB_STALE_AFTER'], burst, echo=click.echo)
+    click.echo(f'Ran {count} job(s).')
+
+@jobs_cli.command('enqueue')
+@click.argument('kind', type=click.Choice(sorted(JOB_TYPES)))
+@click.option('--param', '-p', 'pairs', multiple=True, help='key=value; values are read as JSON if they parse.')
+@click.option('--key', 'idempotency_key', help='Idempotency key; reusing one returns the earlier job.')
+def enqueue_command(kind, pairs, idempotency_key):
+    """Queue a job of type KIND."""
+    job, created = enqueue(kind, _parse_params(pairs), idempotency_key)
+    click.echo(f"{'Queued' if created else 'Already queued as'} job {job.id} ({job.status}).")
+
+@jobs_cli.command('list')
+@click.option('--status', type=click.Choice(Job.STATUSES))
+@click.option('--limit', default=20, show_default=True)
+def list_command(status, limit):
+    """Show the most recent jobs."""
+    query = Job.query
+    if status:
+        query = query.filter(Job.status == status)
+    for job in query.order_by(Job.id.desc()).limit(limit):
+        _echo_job(job)
+
+@jobs_cli.command('show')
+@click.argument('job_id', type=int)
+def show_command(job_id):
+    """Show one job as JSON."""
+    job = db.session.get(Job, job_id)
+    if job is None:
+        raise click.ClickException(f'No job {job_id}.')
+    click.echo(json.dumps(job_payload(job), indent=2))
+
+@jobs_cli.command('types')
+def types_command():
+    """List the job types and their concurrency limits."""
+    for kind, registered in sorted(JOB_TYPES.items()):
+        click.echo(f'{kind:<24} at most {registered.concurrency} at once  {registered.description}')
+
+@jobs_cli.command('prune')
+@click.option('--days', default=30, show_default=True, help='Delete finished jobs older than this.')
+def prune_command(days):
+    """Delete old finished jobs."""
+    deleted = prune_jobs(datetime.utcnow() - timedelta(days=days))
+    click.echo(f'Deleted {deleted} job(s).')
@@ -0,0 +1,283 @@
+from datetime import datetime, timedelta
+import click
+from flask.cli import AppGroup
+from sqlalchemy import case, event, func, inspect, literal
+from extensions import db
+from models import Medicine, StockMovement, StockSnapshot
+
+COMPACT_AFTER_DAYS = 90
+COMPACT_CHUNK_SIZE = 10000
+
+stock_cli = AppGroup('stock', help='Stock movement ledger.')
+
+def movement_insert(quantities, kind, sale_id=None, sign=1):
+    """One INSERT ... SELECT writing a movement per medicine in ``quantities``.
+
+    ``quantities`` maps medicine ids to unsigned unit counts; ``sign`` is -1
+    for stock leaving. Ids with no medicine row are skipped.
+    """
+    medicine = Medicine.__table__
+    amount = case(quantities, value=medicine.c.id)
+    return StockMovement.__table__.insert().from_select(
+        ['medicine_id', 'kind', 'quantity', 'sale_id', 'created_at'],
+        db.select(
+            medicine.c.id,
+            literal(kind),
+            amount * sign,
+            literal(sale_id, db.Integer),
+            literal(datetime.utcnow())
+        ).where(medicine.c.id.in_(list(quantities)))
+    )
+
+def record_movements(quantities, kind, sale_id=None, sign=1):
+    if quantities:
+        db.session.execute(movement_insert(quantities, kind, sale_id, sign))
+
+def insert_movements(quantities, kind):
+    """Write signed movements for medicines known to exist, as one executemany.
+
+    For bulk writes with thousands of medicines, where the CASE in
+    movement_insert would be compiled and searched for every row.
+    """
+    if quantities:
+        now = datetime.utcnow()
+        db.session.execute(StockMovement.__table__.insert(), [
+            {'medicine_id': medicine_id, 'kind': kind, 'quantity': quantity, 'created_at': now}
+            for medicine_id, quantity in quantities.items()
+        ])
+
+# Form edits and new medicines change stock through the ORM rather than inventory.py
+
+@event.listens_for(Medicine, 'after_insert')
+def record_opening_stock(mapper, connection, target):
+    if target.stock_quantity:
+        connection.execute(StockMovement.__table__.insert().values(
+            medicine_id=target.id,
+            kind='receipt',
+            quantity=target.stock_quantity,
+            created_at=datetime.utcnow()
+        ))
+
+@event.listens_for(Medicine, 'after_update')
+def record_stock_adjustment(mapper, connection, target):
+    history = inspect(target).attrs.stock_quantity.history
+    if not history.added or not history.deleted:
+        return
+    delta = (history.added[0] or 0) - (history.deleted[0] or 0)
+    if delta:
+        connection.execute(StockMovement.__table__.insert().values(
+            medicine_id=target.id,
+            kind='adjustment',
+            quantity=delta,
+            created_at=datetime.utcnow()
+        ))
+
+@event.listens_for(Medicine, 'before_delete')
+def record_stock_write_off(mapper, connection, target):
+    # The movements outlive the medicine, so its ledger still ends at zero
+    table = Medicine.__table__
+    stock = connection.execute(
+        db.select(table.c.stock_quantity).where(table.c.id == target.id)
+    ).scalar()
+    if stock:
+        connection.execute(StockMovement.__table__.insert().values(
+            medicine_id=target.id,
+            kind='adjustment',
+            quantity=-stock,
+            created_at=datetime.utcnow()
+        ))
+
+def latest_snapshot(medicine_id, when=None):
+    query = StockSnapshot.query.filter(StockSnapshot.medicine_id == medicine_id)
+    if when is not None:
+        query = query.filter(StockSnapshot.taken_at <= when)
+    return query.order_by(StockSnapshot.taken_at.desc(), StockSnapshot.id.desc()).first()
+
+def stock_at(medicine_id, when):
+    """Units in stock for a medicine at ``when``, or None if unknown.
+
+    Starts from the nearest snapshot at or before ``when`` and adds the
+    movements recorded after it, an index range scan on
+    (medicine_id, id). Without such a snapshot it works backwards from the
+    live stock instead, which is zero for a deleted medicine. Times whose
+    movements have been compacted away are unknown.
+    """
+    snapshot = latest_snapshot(medicine_id, when)
+    after = snapshot.last_movement_id if snapshot is not None else 0
+
+    # Compaction deletes a prefix of the ledger by id and snapshots every
+    # medicine it touches, so a later snapshot inside that prefix means
+    # some of the movements we need are gone.
+    first_kept = db.session.query(func.min(StockMovement.id)).scalar()
+    folded = StockSnapshot.query.filter(
+        StockSnapshot.medicine_id == medicine_id,
+        StockSnapshot.last_movement_id > after
+    )
+    if first_kept is not None:
+        folded = folded.filter(StockSnapshot.last_movement_id < first_kept)
+    if db.session.query(folded.exists()).scalar():
+        return None
+
+    movements = db.session.query(func.coalesce(func.sum(StockMovement.quantity), 0)) \
+        .filter(StockMovement.medicine_id == medicine_id)
+    if snapshot is not None:
+        return snapshot.quantity + movements.filter(
+            StockMovement.id > after,
+            StockMovement.created_at <= when
+        ).scalar()
+
+    current = db.session.query(Medicine.stock_quantity).filter(Medicine.id == medicine_id).scalar()
+    if current is None:
+        # Deleted medicines were written off to zero; ids never seen are unknown
+        if db.session.query(StockMovement.id).filter(StockMovement.medicine_id == medicine_id).first() is None:
+            return None
+        current = 0
+    return current - movements.filter(StockMovement.created_at > when).scalar()
+
+def take_snapshots(cutoff=None):
+    """Snapshot every medicine with movements since its last snapshot, as of ``cutoff``.
+
+    Each snapshot folds in the movements up to the last one recorded at
+    or before the cutoff. Medicines without an earlier snapshot start from
+    the live stock minus everything the ledger holds for them. Returns the
+    number of snapshots written.
+    """
+    cutoff = cutoff or datetime.utcnow()
+    last = db.session.query(StockMovement.id, StockMovement.created_at) \
+        .filter(StockMovement.created_at <= cutoff) \
+        .order_by(StockMovement.id.desc()).first()
+    if last is None:
+        return 0
+
+    # Snapshots taken after the cutoff do not count as a starting point
+    previous = db.session.query(
+        StockSnapshot.medicine_id.label('medicine_id'),
+        func.max(StockSnapshot.last_movement_id).label('last_movement_id')
+    ).filter(StockSnapshot.last_movement_id <= last.id) \
+        .group_by(StockSnapshot.medicine_id).subquery()
+    bases = dict(
+        db.session.query(StockSnapshot.medicine_id, StockSnapshot.quantity)
+        .join(previous, (previous.c.medicine_id == StockSnapshot.medicine_id)
+              & (previous.c.last_movement_id == StockSnapshot.last_movement_id))
+        .all()
+    )
+    deltas = db.session.query(StockMovement.medicine_id, func.sum(StockMovement.quantity)) \
+        .outerjoin(previous, previous.c.medicine_id == StockMovement.medicine_id) \
+        .filter(
+            StockMovement.id <= last.id,
+            StockMovement.id > func.coalesce(previous.c.last_movement_id, 0)
+        ) \
+        .group_by(StockMovement.medicine_id).all()
+
+    unsnapshotted = [medicine_id for medicine_id, _ in deltas if medicine_id not in bases]
+    if unsnapshotted:
+        # Opening balance implied by the live stock and the full ledger
+        totals = dict(
+            db.session.query(StockMovement.medicine_id, func.sum(StockMovement.quantity))
+            .filter(StockMovement.medicine_id.in_(unsnapshotted))
+            .group_by(StockMovement.medicine_id).all()
+        )
+        stock = dict(db.session.query(Medicine.id, Medicine.stock_quantity)
+                     .filter(Medicine.id.in_(unsnapshotted)).all())
+        for medicine_id in unsnapshotted:
+            bases[medicine_id] = stock.get(medicine_id, 0) - totals[medicine_id]
+
+    if deltas:
+        db.session.execute(StockSnapshot.__table__.insert(), [
+            {
+                'medicine_id': medicine_id,
+                'quantity': bases[medicine_id] + delta,
+                'last_movement_id': last.id,
+                'taken_at': last.created_at,
+            }
+            for medicine_id, delta in deltas
+        ])
+    return len(deltas)
+
+def compact_movements(before, chunk_size=COMPACT_CHUNK_SIZE):
+    """Fold movements recorded before ``before`` into snapshots and delete them.
+
+    Deletes run in primary key chunks, each in its own transaction, so a
+    large backlog never holds the write lock for long. Returns
+    (snapshots written, movements deleted).
+    """
+    snapshots = take_snapshots(before)
+    db.session.commit()
+    horizon = db.session.query(func.max(StockSnapshot.last_movement_id)) \
+        .filter(StockSnapshot.taken_at <= before).scalar()
+    if horizon is None:
+        return snapshots, 0
+
+    table = StockMovement.__table__
+    deleted = 0
+    low = db.session.query(func.min(StockMovement.id)).scalar() or 0
+    while low <= horizon:
+        high = min(low + chunk_size - 1, horizon)
+        result = db.session.execute(table.delete().where(table.c.id.between(low, high)))
+        db.session.commit()
+        deleted += result.rowcount
+        low = high + 1
+    return snapshots, deleted
+
+def ledger_drift():
+    """Medicines whose live stock disagrees with their latest snapshot plus later movements.
+
+    Only medicines that have a snapshot can be checked.
+    """
+    latest = db.session.query(
+        StockSnapshot.medicine_id.label('medicine_id'),
+        func.max(StockSnapshot.last_movement_id).label('last_movement_id')
+    ).group_by(StockSnapshot.medicine_id).subquery()
+    snapshots = db.session.query(StockSnapshot.medicine_id, StockSnapshot.quantity, StockSnapshot.last_movement_id) \
+        .join(latest, (latest.c.medicine_id == StockSnapshot.medicine_id)
+              & (latest.c.last_movement_id == StockSnapshot.last_movement_id)).all()
+    if not snapshots:
+        return []
+    since = dict(
+        db.session.query(StockMovement.medicine_id, func.sum(StockMovement.quantity))
+        .join(latest, latest.c.medicine_id == StockMovement.medicine_id)
+        .filter(StockMovement.id > latest.c.last_movement_id)
+        .group_by(StockMovement.medicine_id).all()
+    )
+    stock = dict(db.session.query(Medicine.id, Medicine.stock_quantity).all())
+    drift = []
+    for medicine_id, quantity, _ in snapshots:
+        expected = quantity + (since.get(medicine_id) or 0)
+        if medicine_id in stock and stock[medicine_id] != expected:
+            drift.append((medicine_id, stock[medicine_id], expected))
+    return drift
+
+@stock_cli.command('snapshot')
+def snapshot_command():
+    """Snapshot stock for every medicine that moved since its last snapshot."""
+    count = take_snapshots()
+    db.session.commit()
+    click.echo(f'Wrote {count} snapshot(s).')
+
+@stock_cli.command('compact')
+@click.option('--days', default=COMPACT_AFTER_DAYS, show_default=True,
+              help='Fold movements older than this many days.')
+def compact_command(days):
+    """Fold old movements into snapshots and delete them."""
+    snapshots, deleted = compact_movements(datetime.utcnow() - timedelta(days=days))
+    click.echo(f'Wrote {snapshots} snapshot(s), deleted {deleted} movement(s).')
+
+@stock_cli.command('at')
+@click.argument('medicine_id', type=int)
+@click.argument('when', type=click.DateTime())
+def at_command(medicine_id, when):
+    """Show the stock of MEDICINE_ID at WHEN (UTC)."""
+    quantity = stock_at(medicine_id, when)
+    if quantity is None:
+        raise click.ClickException('Stock at that time is not known.')
+    click.echo(quantity)
+
+@stock_cli.command('verify')
+def verify_command():
+    """Check live stock against the ledger."""
+    drift = ledger_drift()
+    for medicine_id, actual, expected in drift:
+        click.echo(f'medicine {medicine_id}: stock={actual} ledger={expected}  <- drift')
+    if drift:
+        raise SystemExit(1)
+    click.echo('Stock matches the ledger.')
@@ -0,0 +1,306 @@
+import bisect
+import glob
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from flask import g, request
+from sqlalchemy import event, exc
+from sqlalchemy.pool import QueuePool
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+POOL_WAIT_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0)
+
+# Set by install_metrics; None means metrics are off and recording is a no-op
+_directory = None
+
+# Each thread of each process writes its own files, so recording needs no lock
+_local = threading.local()
+
+_INITIAL_SIZE = 1 << 16
+_HEADER = struct.Struct('Q')
+_LENGTH = struct.Struct('I')
+_VALUE = struct.Struct('d')
+
+class ValueFile:
+    """String keys mapped to float64 values in a memory-mapped file.
+
+    Entries are only ever appended, and the used length in the header is
+    updated after an entry is complete, so readers in other processes see
+    either the whole entry or none of it. Only one thread writes a file.
+    """
+
+    def __init__(self, path):
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        size = os.fstat(self._fd).st_size
+        if size == 0:
+            size = _INITIAL_SIZE
+            os.ftruncate(self._fd, size)
+        self._map = mmap.mmap(self._fd, size)
+        self._positions = {}
+        self._used = max(_HEADER.unpack_from(self._map, 0)[0], _HEADER.size)
+        for key, _, position in _entries(self._map, self._used):
+            self._positions[key] = position
+
+    def add(self, key, amount):
+        position = self._positions.get(key)
+        if position is None:
+            position = self._allocate(key)
+        _VALUE.pack_into(self._map, position, _VALUE.unpack_from(self._map, position)[0] + amount)
+
+    def _allocate(self, key):
+        data = key.encode('utf-8')
+        # Pad so values stay 8-byte aligned
+        padded = (_LENGTH.size + len(data) + 7) // 8 * 8
+        end = self._used + padded + _VALUE.size
+        if end > len(self._map):
+            size = len(self._map)
+            while size < end:
+                size *= 2
+            os.ftruncate(self._fd, size)
+            self._map.close()
+            self._map = mmap.mmap(self._fd, size)
+        _LENGTH.pack_into(self._map, self._used, len(data))
+        self._map[self._used + _LENGTH.size:self._used + _LENGTH.size + len(data)] = data
+        position = self._used + padded
+        _VALUE.pack_into(self._map, position, 0.0)
+        self._used = end
+        _HEADER.pack_into(self._map, 0, end)
+        self._positions[key] = position
+        return position
+
+def _entries(buffer, used):
+    position = _HEADER.size
+    while position < used:
+        length = _LENGTH.unpack_from(buffer, position)[0]
+        key = bytes(buffer[position + _LENGTH.size:position + _LENGTH.size + length]).decode('utf-8')
+        value_position = position + (_LENGTH.size + length + 7) // 8 * 8
+        yield key, _VALUE.unpack_from(buffer, value_position)[0], value_position
+        position = value_position + _VALUE.size
+
+def read_values(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) < _HEADER.size:
+        return {}
+    return {key: value for key, value, _ in _entries(data, _HEADER.unpack_from(data, 0)[0])}
+
+def _file(kind):
+    files = getattr(_local, 'files', None)
+    if files is None:
+        files = _local.files = {}
+    value_file = files.get(kind)
+    if value_file is None:
+        os.makedirs(_directory, exist_ok=True)
+        name = f'{kind}_{os.getpid()}_{threading.get_ident()}.db'
+        value_file = files[kind] = ValueFile(os.path.join(_directory, name))
+    return value_file
+
+def _reset_after_fork():
+    # The parent's open files belong to the parent's pid
+    global _local
+    _local = threading.local()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+class Metric:
+    """A metric family. Counters and histograms are summed over every
+    process that ever wrote them; gauges only over live processes.
+    """
+
+    def __init__(self, name, kind, documentation, labelnames=(), buckets=None):
+        self.name = name
+        self.kind = kind
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = buckets
+        self._keys = {}
+        REGISTRY.append(self)
+
+    def _key(self, suffix, labelvalues):
+        cache_key = (suffix, labelvalues)
+        key = self._keys.get(cache_key)
+        if key is None:
+            key = self._keys[cache_key] = json.dumps([self.name, suffix, [str(v) for v in labelvalues]])
+        return key
+
+    def _add(self, suffix, labelvalues, amount):
+        if _directory is not None:
+            _file('gauge' if self.kind == 'gauge' else 'counter').add(self._key(suffix, labelvalues), amount)
+
+    def inc(self, *labelvalues, amount=1):
+        self._add('', labelvalues, amount)
+
+    def dec(self, *labelvalues, amount=1):
+        self._add('', labelvalues, -amount)
+
+    def observe(self, value, *labelvalues):
+        # Buckets are stored individually and made cumulative on output
+        index = bisect.bisect_left(self.buckets, value)
+        self._add(f'_bucket:{index}', labelvalues, 1)
+        self._add('_sum', labelvalues, value)
+        self._add('_count', labelvalues, 1)
+
+REGISTRY = []
+
+REQUEST_LATENCY = Metric('pharmacy_http_request_duration_seconds', 'histogram',
+                         'Time to produce a response, by endpoint.', ['endpoint'], LATENCY_BUCKETS)
+REQUESTS = Metric('pharmacy_http_requests_total', 'counter',
+                  'Responses by endpoint, method and status code.', ['endpoint', 'method', 'status'])
+IN_FLIGHT = Metric('pharmacy_http_requests_in_flight', 'gauge', 'Requests being handled.')
+POOL_CHECKOUTS = Metric('pharmacy_db_pool_checkouts_total', 'counter',
+                        'Connections taken from the database pool.')
+POOL_CHECKED_OUT = Metric('pharmacy_db_pool_checked_out', 'gauge', 'Connections currently in use.')
+POOL_WAIT = Metric('pharmacy_db_pool_wait_seconds', 'histogram',
+                   'Time to get a connection from the pool, including opening a new one.',
+                   buckets=POOL_WAIT_BUCKETS)
+POOL_TIMEOUTS = Metric('pharmacy_db_pool_timeouts_total', 'counter',
+                       'Checkouts that gave up after DB_POOL_TIMEOUT.')
+CACHE_REQUESTS = Metric('pharmacy_cache_requests_total', 'counter',
+                        'Catalog cache reads by namespace and result (hit or miss).', ['namespace', 'result'])
+
+class MeteredQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waits"""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            POOL_TIMEOUTS.inc()
+            raise
+        finally:
+            POOL_WAIT.observe(time.perf_counter() - started)
+
+@event.listens_for(MeteredQueuePool, 'checkout')
+def _checkout(dbapi_connection, connection_record, connection_proxy):
+    POOL_CHECKOUTS.inc()
+    POOL_CHECKED_OUT.inc()
+
+@event.listens_for(MeteredQueuePool, 'checkin')
+def _checkin(dbapi_connection, connection_record):
+    POOL_CHECKED_OUT.dec()
+
+def _endpoint():
+    # Unmatched URLs share one label instead of one series per path
+    return request.endpoint or 'unmatched'
+
+def _start_request():
+    IN_FLIGHT.inc()
+    g.metrics_started = time.perf_counter()
+
+def _record_response(response):
+    REQUEST_LATENCY.observe(time.perf_counter() - g.metrics_started, _endpoint())
+    REQUESTS.inc(_endpoint(), request.method, response.status_code)
+    g.metrics_recorded = True
+    return response
+
+def _end_request(error):
+    started = g.pop('metrics_started', None)
+    if started is None:
+        return
+    IN_FLIGHT.dec()
+    if not g.pop('metrics_recorded', False):
+        # Unhandled exception: after_request never ran
+        REQUEST_LATENCY.observe(time.perf_counter() - started, _endpoint())
+        REQUESTS.inc(_endpoint(), request.method, 500)
+
+def collect(directory):
+    """Sum the values of every process's files: {kind: {key: value}}"""
+    totals = {'counter': {}, 'gauge': {}}
+    for kind, values in totals.items():
+        for path in glob.glob(os.path.join(directory, f'{kind}_*.db')):
+            for key, value in read_values(path).items():
+                values[key] = values.get(key, 0.0) + value
+    return totals
+
+def _labels(names, values):
+    if not names:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for v in values)
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(names, escaped)) + '}'
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+def exposition(directory=None):
+    """All metrics in the Prometheus text format"""
+    totals = collect(directory or _directory)
+    samples = {}
+    for kind, values in totals.items():
+        for key, value in values.items():
+            name, suffix, labelvalues = json.loads(key)
+            samples.setdefault(name, {})[(suffix, tuple(labelvalues))] = value
+
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f'# HELP {metric.name} {metric.documentation}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        values = samples.get(metric.name, {})
+        if metric.kind != 'histogram':
+            if not values and not metric.labelnames:
+                values = {('', ()): 0.0}
+            for (_, labelvalues), value in sorted(values.items()):
+                lines.append(f'{metric.name}{_labels(metric.labelnames, labelvalues)} {_number(value)}')
+            continue
+        series = sorted({labelvalues for _, labelvalues in values} or ({()} if not metric.labelnames else set()))
+        names = metric.labelnames + ('le',)
+        for labelvalues in series:
+            cumulative = 0.0
+            for index, bound in enumerate(metric.buckets + (float('inf'),)):
+                cumulative += values.get((f'_bucket:{index}', labelvalues), 0.0)
+                lines.append(f'{metric.name}_bucket{_labels(names, labelvalues + (_number(bound),))} '
+                             f'{_number(cumulative)}')
+            labels = _labels(metric.labelnames, labelvalues)
+            lines.append(f"{metric.name}_sum{labels} {_number(values.get(('_sum', labelvalues), 0.0))}")
+            lines.append(f"{metric.name}_count{labels} {_number(values.get(('_count', labelvalues), 0.0))}")
+
+    # Hit ratio per namespace over the lifetime of the counters
+    cache = samples.get(CACHE_REQUESTS.name, {})
+    namespaces = sorted({labelvalues[0] for _, labelvalues in cache})
+    lines.append('# HELP pharmacy_cache_hit_ratio Catalog cache hits over all reads, by namespace.')
+    lines.append('# TYPE pharmacy_cache_hit_ratio gauge')
+    for namespace in namespaces:
+        hits = cache.get(('', (namespace, 'hit')), 0.0)
+        total = hits + cache.get(('', (namespace, 'miss')), 0.0)
+        if total:
+            lines.append(f'pharmacy_cache_hit_ratio{_labels(("namespace",), (namespace,))} {hits / total:.4f}')
+    return '\n'.join(lines) + '\n'
+
+def clear_directory(directory):
+    """Remove every process's files; run once when the server starts"""
+    for path in glob.glob(os.path.join(directory, '*.db')):
+        os.remove(path)
+
+def mark_process_dead(directory, pid):
+    """Drop the gauges of a worker that exited; its counters still count"""
+    for path in glob.glob(os.path.join(directory, f'gauge_{pid}_*.db')):
+        os.remove(path)
+
+def install_metrics(app):
+    """Record request, pool and cache metrics when METRICS is on.
+
+    Must run after configure_engine_profile and before the engine is
+    created, so the pool can be swapped for MeteredQueuePool.
+    """
+    if not app.config['METRICS']:
+        return False
+    global _directory
+    _directory = app.config['METRICS_DIR']
+
+    options = app.config['SQLALCHEMY_ENGINE_OPTIONS']
+    default_pool = QueuePool if app.config['DATABASE_PROFILE'] == 'server' else None
+    if options.get('poolclass', default_pool) is QueuePool:
+        options['poolclass'] = MeteredQueuePool
+
+    app.before_request(_start_request)
+    app.after_request(_record_response)
+    app.teardown_request(_end_request)
+    return True
@@ -51,6 +51,18 @@ def get_metadata():
     return target_db.metadata
 
 
+# Tables the models do not describe: the FTS5 search index and its shadow
+# tables (search.py) and SQLite's own, such as sqlite_stat1 from ANALYZE.
+# Without this, autogenerate would drop them.
+UNMANAGED_TABLE_PREFIXES = ('medicine_fts', 'sqlite_')
+
+
+def include_name(name, type_, parent_names):
+    if type_ == 'table':
+        return not name.startswith(UNMANAGED_TABLE_PREFIXES)
+    return True
+
+
 def run_migrations_offline():
     """Run migrations in 'offline' mode.
 
@@ -65,7 +77,8 @@ def run_migrations_offline():
     """
     url = config.get_main_option("sqlalchemy.url")
     context.configure(
-        url=url, target_metadata=get_metadata(), literal_binds=True
+        url=url, target_metadata=get_metadata(), literal_binds=True,
+        include_name=include_name
     )
 
     with context.begin_transaction():
@@ -97,6 +110,7 @@ def run_migrations_online():
             connection=connection,
             target_metadata=get_metadata(),
             process_revision_directives=process_revision_directives,
+            include_name=include_name,
             **current_app.extensions['migrate'].configure_args
         )
 
@@ -0,0 +1,43 @@
+"""Make sale.medicine_id and sale.unit_price optional for itemised sales
+
+Revision ID: a1c3e5f70901
+Revises: 
+Create Date: 2026-10-18 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a1c3e5f70901'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+# Tables missing here are created at their current definition by
+# `flask bootstrap schema`, so every revision only alters what exists.
+
+
+def _sale_columns():
+    inspector = sa.inspect(op.get_bind())
+    if 'sale' not in inspector.get_table_names():
+        return {}
+    return {column['name']: column for column in inspector.get_columns('sale')}
+
+
+def upgrade():
+    columns = _sale_columns()
+    if not columns or columns['medicine_id']['nullable'] and columns['unit_price']['nullable']:
+        return
+    with op.batch_alter_table('sale') as batch_op:
+        batch_op.alter_column('medicine_id', existing_type=sa.Integer(), nullable=True)
+        batch_op.alter_column('unit_price', existing_type=sa.Float(), nullable=True)
+
+
+def downgrade():
+    if not _sale_columns():
+        return
+    with op.batch_alter_table('sale') as batch_op:
+        batch_op.alter_column('medicine_id', existing_type=sa.Integer(), nullable=False)
+        batch_op.alter_column('unit_price', existing_type=sa.Float(), nullable=False)
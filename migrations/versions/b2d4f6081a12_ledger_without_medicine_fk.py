@@ -0,0 +1,54 @@
+"""Drop the medicine foreign keys from the stock ledger
+
+Revision ID: b2d4f6081a12
+Revises: a1c3e5f70901
+Create Date: 2026-10-18 09:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b2d4f6081a12'
+down_revision = 'a1c3e5f70901'
+branch_labels = None
+depends_on = None
+
+LEDGER_TABLES = ('stock_movement', 'stock_snapshot')
+
+# Names SQLite's unnamed constraints are given in batch mode, so they can be dropped
+NAMING_CONVENTION = {'fk': 'fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s'}
+
+
+def _medicine_fk_name(inspector, table):
+    for fk in inspector.get_foreign_keys(table):
+        if fk['referred_table'] == 'medicine' and fk['constrained_columns'] == ['medicine_id']:
+            return fk['name'] or f'fk_{table}_medicine_id_medicine'
+    return None
+
+
+def upgrade():
+    # The ledger outlives a deleted medicine; the cascading foreign keys
+    # these tables were first created with deleted its movements instead
+    inspector = sa.inspect(op.get_bind())
+    tables = inspector.get_table_names()
+    for table in LEDGER_TABLES:
+        if table not in tables:
+            continue
+        name = _medicine_fk_name(inspector, table)
+        if name is None:
+            continue
+        with op.batch_alter_table(table, naming_convention=NAMING_CONVENTION) as batch_op:
+            batch_op.drop_constraint(name, type_='foreignkey')
+
+
+def downgrade():
+    inspector = sa.inspect(op.get_bind())
+    tables = inspector.get_table_names()
+    for table in LEDGER_TABLES:
+        if table not in tables or _medicine_fk_name(inspector, table) is not None:
+            continue
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.create_foreign_key(f'fk_{table}_medicine_id_medicine', 'medicine',
+                                        ['medicine_id'], ['id'], ondelete='CASCADE')
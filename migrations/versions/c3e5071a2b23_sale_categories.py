@@ -0,0 +1,37 @@
+"""Record the medicine category on sales and sale items
+
+Revision ID: c3e5071a2b23
+Revises: b2d4f6081a12
+Create Date: 2026-10-18 09:20:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3e5071a2b23'
+down_revision = 'b2d4f6081a12'
+branch_labels = None
+depends_on = None
+
+CATEGORY_TABLES = ('sale', 'sale_item')
+
+
+def _tables_with_category(inspector, present):
+    tables = inspector.get_table_names()
+    return [table for table in CATEGORY_TABLES if table in tables
+            and present == any(column['name'] == 'category' for column in inspector.get_columns(table))]
+
+
+def upgrade():
+    # Left null here; `flask reports backfill` records the categories
+    for table in _tables_with_category(sa.inspect(op.get_bind()), present=False):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.add_column(sa.Column('category', sa.String(length=50), nullable=True))
+
+
+def downgrade():
+    for table in _tables_with_category(sa.inspect(op.get_bind()), present=True):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('category')
@@ -0,0 +1,53 @@
+"""Add medicine.needs_reorder and the partial index behind the reorder queue
+
+Revision ID: d4f6182b3c34
+Revises: c3e5071a2b23
+Create Date: 2026-10-18 09:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4f6182b3c34'
+down_revision = 'c3e5071a2b23'
+branch_labels = None
+depends_on = None
+
+
+def _medicine(inspector):
+    if 'medicine' not in inspector.get_table_names():
+        return None, None
+    columns = {column['name'] for column in inspector.get_columns('medicine')}
+    indexes = {index['name'] for index in inspector.get_indexes('medicine')}
+    return columns, indexes
+
+
+def upgrade():
+    columns, indexes = _medicine(sa.inspect(op.get_bind()))
+    if columns is None:
+        return
+    if 'needs_reorder' not in columns:
+        with op.batch_alter_table('medicine') as batch_op:
+            batch_op.add_column(sa.Column('needs_reorder', sa.Boolean(), nullable=False,
+                                          server_default=sa.false()))
+        medicine = sa.table('medicine', sa.column('needs_reorder'),
+                            sa.column('stock_quantity'), sa.column('reorder_level'))
+        op.execute(medicine.update().values(
+            needs_reorder=medicine.c.stock_quantity <= medicine.c.reorder_level))
+    if 'idx_medicine_reorder' not in indexes:
+        op.create_index('idx_medicine_reorder', 'medicine', ['name', 'id'], unique=False,
+                        sqlite_where=sa.text('needs_reorder = 1'),
+                        postgresql_where=sa.text('needs_reorder'))
+
+
+def downgrade():
+    columns, indexes = _medicine(sa.inspect(op.get_bind()))
+    if columns is None:
+        return
+    if 'idx_medicine_reorder' in indexes:
+        op.drop_index('idx_medicine_reorder', table_name='medicine')
+    if 'needs_reorder' in columns:
+        with op.batch_alter_table('medicine') as batch_op:
+            batch_op.drop_column('needs_reorder')
@@ -0,0 +1,53 @@
+"""Add medicine.expiry_bucket and key idx_medicine_expiry on (expiry_date, id)
+
+Revision ID: e5072a3c4d45
+Revises: d4f6182b3c34
+Create Date: 2026-10-18 09:40:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5072a3c4d45'
+down_revision = 'd4f6182b3c34'
+branch_labels = None
+depends_on = None
+
+
+def _medicine(inspector):
+    if 'medicine' not in inspector.get_table_names():
+        return None, None
+    columns = {column['name'] for column in inspector.get_columns('medicine')}
+    indexes = {index['name']: index['column_names'] for index in inspector.get_indexes('medicine')}
+    return columns, indexes
+
+
+def _replace_expiry_index(indexes, column_names):
+    if indexes.get('idx_medicine_expiry') == column_names:
+        return
+    if 'idx_medicine_expiry' in indexes:
+        op.drop_index('idx_medicine_expiry', table_name='medicine')
+    op.create_index('idx_medicine_expiry', 'medicine', column_names, unique=False)
+
+
+def upgrade():
+    # The buckets start empty; `flask expiry flag` fills them in
+    columns, indexes = _medicine(sa.inspect(op.get_bind()))
+    if columns is None:
+        return
+    if 'expiry_bucket' not in columns:
+        with op.batch_alter_table('medicine') as batch_op:
+            batch_op.add_column(sa.Column('expiry_bucket', sa.String(length=10), nullable=True))
+    _replace_expiry_index(indexes, ['expiry_date', 'id'])
+
+
+def downgrade():
+    columns, indexes = _medicine(sa.inspect(op.get_bind()))
+    if columns is None:
+        return
+    _replace_expiry_index(indexes, ['expiry_date'])
+    if 'expiry_bucket' in columns:
+        with op.batch_alter_table('medicine') as batch_op:
+            batch_op.drop_column('expiry_bucket')
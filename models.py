@@ -2,10 +2,10 @@ from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime, date
 from decimal import Decimal
 from sqlalchemy.orm import validates
-from sqlalchemy import CheckConstraint, event, text
+from sqlalchemy import CheckConstraint, text
 import re
 from extensions import db
-from werkzeug.security import generate_password_hash, check_password_hash
+from passwords import hash_password, verify_password, needs_rehash
 from flask_login import UserMixin
 
 class User(UserMixin, db.Model):
@@ -20,10 +20,13 @@ class User(UserMixin, db.Model):
     updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hash_password(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return verify_password(self.password_hash, password)
+
+    def password_needs_rehash(self):
+        return needs_rehash(self.password_hash)
 
     def save(self):
         db.session.add(self)
@@ -47,7 +50,11 @@ class Medicine(db.Model):
     price = db.Column(db.Float, nullable=False)
     stock_quantity = db.Column(db.Integer, nullable=False, default=0)
     reorder_level = db.Column(db.Integer, nullable=False, default=10)
+    # stock_quantity <= reorder_level, kept in step by reorder.py and inventory.py
+    needs_reorder = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
     expiry_date = db.Column(db.Date, nullable=False)
+    # 'expired', '30', '60' or '90' days, set by expiry.py; None when further out
+    expiry_bucket = db.Column(db.String(10), nullable=True)
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -56,12 +63,19 @@ class Medicine(db.Model):
         CheckConstraint('stock_quantity >= 0', name='check_positive_stock'),
         db.UniqueConstraint('name', 'manufacturer', name='uq_medicine_name_manufacturer'),
         db.Index('idx_medicine_name_category', 'name', 'category'),
-        db.Index('idx_medicine_expiry', 'expiry_date'),
+        db.Index('idx_medicine_expiry', 'expiry_date', 'id'),
+        # Only flagged rows are indexed, so the reorder queue is a small index scan
+        db.Index('idx_medicine_reorder', 'name', 'id',
+                 sqlite_where=text('needs_reorder = 1'),
+                 postgresql_where=text('needs_reorder')),
     )
     
     # Define relationships without backrefs
     sales = db.relationship('Sale', back_populates='medicine', lazy='dynamic')
     prescription_items = db.relationship('PrescriptionItem', back_populates='medicine', lazy='dynamic')
+
+    # bm25 score, populated by full-text search queries, see search.py
+    search_rank = db.query_expression()
     
     @validates('price')
     def validate_price(self, key, price):
@@ -77,7 +91,8 @@ class Medicine(db.Model):
     
     @validates('expiry_date')
     def validate_expiry_date(self, key, value):
-        if value and value < date.today():
+        # Expired stock keeps its date when other fields are edited
+        if value and value < date.today() and value != self.expiry_date:
             raise ValueError("Expiry date must be in the future")
         return value
     
@@ -233,6 +248,9 @@ class Prescription(db.Model):
     # Define relationships without backrefs
     items = db.relationship('PrescriptionItem', back_populates='prescription')
 
+    # Populated by list queries from an aggregate subquery, see queries.py
+    item_count = db.query_expression()
+
     customer = db.relationship('Customer', back_populates='prescriptions')
 
     def __repr__(self):
@@ -287,12 +305,15 @@ class Sale(db.Model):
     
     id = db.Column(db.Integer, primary_key=True)
     customer_id = db.Column(db.Integer, db.ForeignKey('customer.id'), nullable=False)
-    medicine_id = db.Column(db.Integer, db.ForeignKey('medicine.id'), nullable=False)
+    # Null for itemised (checkout) sales, whose lines are in sale_item
+    medicine_id = db.Column(db.Integer, db.ForeignKey('medicine.id'), nullable=True)
     employee_id = db.Column(db.Integer, db.ForeignKey('employee.id'), nullable=False)
     quantity = db.Column(db.Integer, nullable=False)
-    unit_price = db.Column(db.Float, nullable=False)
+    unit_price = db.Column(db.Float, nullable=True)
     total_amount = db.Column(db.Float, nullable=False)
     sale_date = db.Column(db.Date, nullable=False, default=date.today)
+    # Medicine category when the sale was rolled up, see rollups.record_categories
+    category = db.Column(db.String(50), nullable=True)
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -300,6 +321,10 @@ class Sale(db.Model):
     customer = db.relationship('Customer', back_populates='sales')
     medicine = db.relationship('Medicine', back_populates='sales')
     employee = db.relationship('Employee', back_populates='sales')
+    items = db.relationship('SaleItem', back_populates='sale', cascade='all, delete-orphan')
+
+    # Populated by queries.sale_list_query
+    item_count = db.query_expression()
 
     __table_args__ = (
         db.Index('idx_sale_date', 'sale_date'),
@@ -309,6 +334,10 @@ class Sale(db.Model):
     def __repr__(self):
         return f"<Sale {self.id} by {self.customer.name}>"
 
+    @property
+    def is_itemised(self):
+        return self.medicine_id is None
+
     def save(self):
         if not self.total_amount:
             self.total_amount = self.quantity * self.unit_price
@@ -325,6 +354,8 @@ class SaleItem(db.Model):
     medicine_id = db.Column(db.Integer, db.ForeignKey('medicine.id', ondelete='RESTRICT'), nullable=False, index=True)
     quantity = db.Column(db.Integer, nullable=False)
     price = db.Column(db.Numeric(10, 2), nullable=False)
+    # Medicine category when the sale was rolled up, see rollups.record_categories
+    category = db.Column(db.String(50), nullable=True)
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     
     __table_args__ = (
@@ -335,11 +366,9 @@ class SaleItem(db.Model):
     
     @validates('quantity')
     def validate_quantity(self, key, quantity):
+        # Stock is checked by the batched UPDATE in inventory.decrement_stock_many
         if quantity <= 0:
             raise ValueError("Quantity must be positive")
-        medicine = Medicine.query.get(self.medicine_id)
-        if medicine and medicine.stock_quantity < quantity:
-            raise ValueError(f"Not enough stock. Only {medicine.stock_quantity} units available.")
         return quantity
     
     @validates('price')
@@ -348,26 +377,149 @@ class SaleItem(db.Model):
             raise ValueError("Price cannot be negative")
         return price
     
-    sale = db.relationship('Sale')
+    sale = db.relationship('Sale', back_populates='items')
     medicine = db.relationship('Medicine')
     
     def __repr__(self):
         return f"<SaleItem {self.id} for Sale {self.sale_id}>"
 
-# Event listeners for automatic updates
-@event.listens_for(Sale, 'before_insert')
-@event.listens_for(Sale, 'before_update')
-def update_sale_total(mapper, connection, target):
-    target.total_amount = sum(item.price * item.quantity for item in target.items)
-
-@event.listens_for(SaleItem, 'after_insert')
-def update_stock_after_sale(mapper, connection, target):
-    medicine = Medicine.query.get(target.medicine_id)
-    if medicine:
-        medicine.stock_quantity -= target.quantity
-
-@event.listens_for(SaleItem, 'after_delete')
-def restore_stock_after_delete(mapper, connection, target):
-    medicine = Medicine.query.get(target.medicine_id)
-    if medicine:
-        medicine.stock_quantity += target.quantity 
\ No newline at end of file
+class EntityCount(db.Model):
+    """Row count per table, kept exact by the session hooks in counters.py"""
+    __tablename__ = 'entity_count'
+
+    name = db.Column(db.String(50), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<EntityCount {self.name}={self.count}>"
+
+class CatalogVersion(db.Model):
+    """Version counter per cached catalog namespace, bumped by the session hooks in catalog.py"""
+    __tablename__ = 'catalog_version'
+
+    namespace = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<CatalogVersion {self.namespace}={self.version}>"
+
+class StockMovement(db.Model):
+    """Append-only record of every stock change, written by ledger.py"""
+    __tablename__ = 'stock_movement'
+
+    KINDS = ('sale', 'sale_reversal', 'receipt', 'adjustment')
+
+    id = db.Column(db.Integer, primary_key=True)
+    # Not a foreign key, so the ledger outlives a deleted medicine
+    medicine_id = db.Column(db.Integer, nullable=False)
+    kind = db.Column(db.String(20), nullable=False)
+    # Signed change in units: negative for sales, positive for reversals and receipts
+    quantity = db.Column(db.Integer, nullable=False)
+    # Not a foreign key, so the movement outlives a deleted sale
+    sale_id = db.Column(db.Integer, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        CheckConstraint("kind IN ('sale', 'sale_reversal', 'receipt', 'adjustment')", name='check_movement_kind'),
+        db.Index('idx_stock_movement_medicine', 'medicine_id', 'id'),
+        db.Index('idx_stock_movement_created', 'created_at'),
+    )
+
+    def __repr__(self):
+        return f"<StockMovement {self.kind} {self.quantity:+d} of medicine {self.medicine_id}>"
+
+class StockSnapshot(db.Model):
+    """Stock level of one medicine after all its movements up to last_movement_id"""
+    __tablename__ = 'stock_snapshot'
+
+    id = db.Column(db.Integer, primary_key=True)
+    # Not a foreign key, kept with the movements of a deleted medicine
+    medicine_id = db.Column(db.Integer, nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+    last_movement_id = db.Column(db.Integer, nullable=False)
+    taken_at = db.Column(db.DateTime, nullable=False)
+
+    __table_args__ = (
+        db.Index('idx_stock_snapshot_medicine', 'medicine_id', 'taken_at'),
+    )
+
+    def __repr__(self):
+        return f"<StockSnapshot medicine {self.medicine_id}={self.quantity} at {self.taken_at}>"
+
+# Daily sales rollups, maintained by rollups.py. No foreign keys, so the
+# history survives deleted medicines and employees.
+
+class SalesDailyMedicine(db.Model):
+    __tablename__ = 'sales_daily_medicine'
+
+    day = db.Column(db.Date, primary_key=True)
+    medicine_id = db.Column(db.Integer, primary_key=True)
+    sale_count = db.Column(db.Integer, nullable=False, default=0)
+    units = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<SalesDailyMedicine {self.day} medicine {self.medicine_id}>"
+
+class SalesDailyEmployee(db.Model):
+    __tablename__ = 'sales_daily_employee'
+
+    day = db.Column(db.Date, primary_key=True)
+    employee_id = db.Column(db.Integer, primary_key=True)
+    sale_count = db.Column(db.Integer, nullable=False, default=0)
+    units = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<SalesDailyEmployee {self.day} employee {self.employee_id}>"
+
+class SalesDailyCategory(db.Model):
+    __tablename__ = 'sales_daily_category'
+
+    day = db.Column(db.Date, primary_key=True)
+    category = db.Column(db.String(50), primary_key=True)
+    sale_count = db.Column(db.Integer, nullable=False, default=0)
+    units = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<SalesDailyCategory {self.day} {self.category}>"
+
+class Job(db.Model):
+    """A unit of background work, queued here and run by `flask jobs worker` (jobs.py)"""
+    __tablename__ = 'job'
+
+    STATUSES = ('queued', 'running', 'succeeded', 'failed')
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='queued')
+    # JSON; params are fixed at enqueue time, checkpoint is saved by the job as it goes
+    params = db.Column(db.Text, nullable=False, default='{}')
+    checkpoint = db.Column(db.Text, nullable=True)
+    result = db.Column(db.Text, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    # A second enqueue with the same key returns the first job
+    idempotency_key = db.Column(db.String(100), unique=True, nullable=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=3)
+    progress_done = db.Column(db.Integer, nullable=False, default=0)
+    progress_total = db.Column(db.Integer, nullable=True)
+    progress_message = db.Column(db.String(200), nullable=True)
+    # Queued jobs wait until then; retries are pushed back with a growing delay
+    run_after = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    worker = db.Column(db.String(100), nullable=True)
+    heartbeat_at = db.Column(db.DateTime, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        CheckConstraint("status IN ('queued', 'running', 'succeeded', 'failed')", name='check_job_status'),
+        db.Index('idx_job_status', 'status', 'run_after', 'id'),
+        db.Index('idx_job_kind_status', 'kind', 'status'),
+    )
+
+    def __repr__(self):
+        return f"<Job {self.id} {self.kind} {self.status}>"
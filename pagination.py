@@ -0,0 +1,160 @@
+import base64
+import binascii
+import hashlib
+import json
+from datetime import date, datetime
+from sqlalchemy import and_, or_, text
+from extensions import db, cache
+
+COUNT_CACHE_TTL = 300  # seconds
+
+class KeysetPagination:
+    """One page of a keyset (cursor) paginated query.
+
+    Exposes the same has_next/has_prev/items surface as Flask-SQLAlchemy's
+    Pagination, but navigates with opaque cursor tokens instead of page
+    numbers, so no OFFSET or COUNT(*) is needed.
+    """
+
+    def __init__(self, items, per_page, next_cursor=None, prev_cursor=None, total=None):
+        self.items = items
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.total = total
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+def _encode_value(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+def _decode_value(column, value):
+    python_type = column.type.python_type
+    if python_type is datetime:
+        return datetime.fromisoformat(value)
+    if python_type is date:
+        return date.fromisoformat(value)
+    return python_type(value)
+
+def encode_cursor(direction, values):
+    payload = json.dumps([direction, [_encode_value(v) for v in values]], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+def decode_cursor(token, keys):
+    """Return (direction, values) for a cursor token, or raise ValueError."""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        direction, values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (binascii.Error, UnicodeDecodeError, TypeError, ValueError):
+        raise ValueError("Malformed cursor")
+    if direction not in ('n', 'p') or not isinstance(values, list) or len(values) != len(keys):
+        raise ValueError("Malformed cursor")
+    try:
+        values = [_decode_value(column, value) for (column, _), value in zip(keys, values)]
+    except (TypeError, ValueError, NotImplementedError):
+        raise ValueError("Malformed cursor")
+    return direction, values
+
+def _seek_clause(keys, values, backwards):
+    """Rows strictly after (or before) the given key values in sort order."""
+    clauses = []
+    for i, (column, descending) in enumerate(keys):
+        if descending != backwards:
+            comparison = column < values[i]
+        else:
+            comparison = column > values[i]
+        equal_prefix = [keys[j][0] == values[j] for j in range(i)]
+        clauses.append(and_(*equal_prefix, comparison))
+    return or_(*clauses)
+
+def _order_by(keys, backwards):
+    return [column.desc() if descending != backwards else column.asc() for column, descending in keys]
+
+def _key_values(item, keys):
+    return [getattr(item, column.key) for column, _ in keys]
+
+def keyset_paginate(query, keys, cursor=None, per_page=10):
+    """Paginate ``query`` on ``keys``, a sequence of (column, descending) pairs.
+
+    The last key must be unique (normally the primary key) so the ordering
+    is total. An invalid cursor falls back to the first page.
+    """
+    direction, values = 'n', None
+    if cursor:
+        try:
+            direction, values = decode_cursor(cursor, keys)
+        except ValueError:
+            direction, values = 'n', None
+    backwards = direction == 'p'
+
+    query = query.order_by(None)
+    if values is not None:
+        query = query.filter(_seek_clause(keys, values, backwards))
+    rows = query.order_by(*_order_by(keys, backwards)).limit(per_page + 1).all()
+
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+
+    if backwards:
+        has_next, has_prev = values is not None, has_more
+    else:
+        has_next, has_prev = has_more, values is not None
+
+    next_cursor = encode_cursor('n', _key_values(rows[-1], keys)) if rows and has_next else None
+    prev_cursor = encode_cursor('p', _key_values(rows[0], keys)) if rows and has_prev else None
+    return KeysetPagination(rows, per_page, next_cursor, prev_cursor)
+
+def estimated_row_count(model):
+    """Row estimate from the planner statistics, or None if there are none.
+
+    SQLite only has figures after ANALYZE has populated sqlite_stat1.
+    """
+    table = model.__table__.name
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        has_stats = db.session.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+        ).scalar()
+        if not has_stats:
+            return None
+        stat = db.session.execute(
+            text("SELECT stat FROM sqlite_stat1 WHERE tbl = :tbl LIMIT 1"),
+            {'tbl': table}
+        ).scalar()
+        return int(stat.split()[0]) if stat else None
+    if dialect == 'postgresql':
+        estimate = db.session.execute(
+            text("SELECT reltuples::bigint FROM pg_class WHERE relname = :tbl"),
+            {'tbl': table}
+        ).scalar()
+        return estimate if estimate is not None and estimate >= 0 else None
+    return None
+
+def approximate_count(cache_key, query, model=None, ttl=COUNT_CACHE_TTL):
+    """Total for a list page without running COUNT(*) on every view.
+
+    Unfiltered lists (``model`` given) use the planner estimate when one
+    exists, everything else falls back to COUNT(*). Either way the figure
+    is computed at most once per ``ttl`` seconds for each cache key. Keys
+    carry raw search text, so totals live in the Flask-Caching backend,
+    which expires and evicts them, rather than in a per-process dict.
+    """
+    key = 'count:' + hashlib.sha1(repr(cache_key).encode('utf-8')).hexdigest()
+    total = cache.get(key)
+    if total is not None:
+        return total
+    total = estimated_row_count(model) if model is not None else None
+    if total is None:
+        total = query.order_by(None).count()
+    cache.set(key, total, timeout=ttl)
+    return total
@@ -0,0 +1,41 @@
+from flask import current_app, has_app_context
+from werkzeug.security import generate_password_hash, check_password_hash
+
+# werkzeug's own pbkdf2 default, spelled out so stored hashes can be compared with it
+DEFAULT_HASH_METHOD = 'pbkdf2:sha256:260000'
+DEFAULT_SALT_LENGTH = 16
+
+def hash_settings():
+    """(method, salt length) from PASSWORD_HASH_METHOD and PASSWORD_SALT_LENGTH"""
+    if not has_app_context():
+        return DEFAULT_HASH_METHOD, DEFAULT_SALT_LENGTH
+    config = current_app.config
+    return (config.get('PASSWORD_HASH_METHOD') or DEFAULT_HASH_METHOD,
+            config.get('PASSWORD_SALT_LENGTH') or DEFAULT_SALT_LENGTH)
+
+def hash_password(password):
+    method, salt_length = hash_settings()
+    return generate_password_hash(password, method=method, salt_length=salt_length)
+
+def verify_password(password_hash, password):
+    return bool(password_hash) and check_password_hash(password_hash, password)
+
+def needs_rehash(password_hash):
+    """True when a stored hash was made with other settings than the configured ones.
+
+    Only the method string (including the iteration count) and the salt
+    length are compared; the hash itself can only be checked at login,
+    when the plain password is at hand.
+    """
+    method, salt_length = hash_settings()
+    parts = (password_hash or '').split('$')
+    return len(parts) != 3 or parts[0] != method or len(parts[1]) != salt_length
+
+_dummy_hashes = {}
+
+def burn_password_check(password):
+    """Spend as long as a real check would, for logins with an unknown username"""
+    settings = hash_settings()
+    if settings not in _dummy_hashes:
+        _dummy_hashes[settings] = hash_password('not a real password')
+    check_password_hash(_dummy_hashes[settings], password)
@@ -0,0 +1,109 @@
+from sqlalchemy import func, or_, desc
+from sqlalchemy.orm import aliased, contains_eager, joinedload, with_expression
+from extensions import db
+from models import Medicine, Customer, Employee, Prescription, PrescriptionItem, Sale, SaleItem
+
+# Keyset sort keys for each list: (column, descending) pairs ending in the
+# primary key so the ordering is total.
+MEDICINE_LIST_KEYS = ((Medicine.name, False), (Medicine.id, False))
+CUSTOMER_LIST_KEYS = ((Customer.name, False), (Customer.id, False))
+EMPLOYEE_LIST_KEYS = ((Employee.name, False), (Employee.id, False))
+PRESCRIPTION_LIST_KEYS = ((Prescription.prescription_date, True), (Prescription.id, True))
+SALE_LIST_KEYS = ((Sale.sale_date, True), (Sale.id, True))
+
+def medicine_list_query(search='', category=''):
+    query = Medicine.query
+    if search:
+        query = query.filter(
+            or_(
+                Medicine.name.ilike(f'%{search}%'),
+                Medicine.manufacturer.ilike(f'%{search}%'),
+                Medicine.category.ilike(f'%{search}%')
+            )
+        )
+    if category:
+        query = query.filter(Medicine.category == category)
+    return query.order_by(Medicine.name, Medicine.id)
+
+def customer_list_query(search=''):
+    query = Customer.query
+    if search:
+        query = query.filter(
+            or_(
+                Customer.name.ilike(f'%{search}%'),
+                Customer.email.ilike(f'%{search}%'),
+                Customer.phone.ilike(f'%{search}%')
+            )
+        )
+    return query.order_by(Customer.name, Customer.id)
+
+def employee_list_query(search=''):
+    query = Employee.query
+    if search:
+        query = query.filter(
+            or_(
+                Employee.name.ilike(f'%{search}%'),
+                Employee.email.ilike(f'%{search}%'),
+                Employee.position.ilike(f'%{search}%')
+            )
+        )
+    return query.order_by(Employee.name, Employee.id)
+
+def prescription_item_counts():
+    """Aggregate subquery with one row per prescription and its item count."""
+    return db.session.query(
+        PrescriptionItem.prescription_id.label('prescription_id'),
+        func.count(PrescriptionItem.id).label('item_count')
+    ).group_by(PrescriptionItem.prescription_id).subquery()
+
+def prescription_list_query(search=''):
+    counts = prescription_item_counts()
+    query = Prescription.query \
+        .join(Prescription.customer) \
+        .outerjoin(counts, counts.c.prescription_id == Prescription.id) \
+        .options(
+            contains_eager(Prescription.customer),
+            with_expression(Prescription.item_count, func.coalesce(counts.c.item_count, 0))
+        )
+    if search:
+        query = query.filter(
+            or_(
+                Customer.name.ilike(f'%{search}%'),
+                Prescription.doctor_name.ilike(f'%{search}%')
+            )
+        )
+    return query.order_by(desc(Prescription.prescription_date), desc(Prescription.id))
+
+def sale_item_counts():
+    """Aggregate subquery with one row per itemised sale and its line count."""
+    return db.session.query(
+        SaleItem.sale_id.label('sale_id'),
+        func.count(SaleItem.id).label('item_count')
+    ).group_by(SaleItem.sale_id).subquery()
+
+def sale_list_query(search=''):
+    counts = sale_item_counts()
+    # Checkout sales have no medicine of their own, hence the outer join
+    query = Sale.query \
+        .join(Sale.customer) \
+        .outerjoin(Sale.medicine) \
+        .outerjoin(counts, counts.c.sale_id == Sale.id) \
+        .options(
+            contains_eager(Sale.customer),
+            contains_eager(Sale.medicine),
+            joinedload(Sale.employee),
+            with_expression(Sale.item_count, func.coalesce(counts.c.item_count, 0))
+        )
+    if search:
+        line_medicine = aliased(Medicine)
+        itemised = db.session.query(SaleItem.sale_id) \
+            .join(line_medicine, line_medicine.id == SaleItem.medicine_id) \
+            .filter(line_medicine.name.ilike(f'%{search}%'))
+        query = query.filter(
+            or_(
+                Customer.name.ilike(f'%{search}%'),
+                Medicine.name.ilike(f'%{search}%'),
+                Sale.id.in_(itemised)
+            )
+        )
+    return query.order_by(desc(Sale.sale_date), desc(Sale.id))
@@ -0,0 +1,49 @@
+import click
+from flask.cli import AppGroup
+from sqlalchemy import event, func
+from extensions import db
+from models import Medicine
+
+REORDER_PAGE_SIZE = 20
+DASHBOARD_REORDER_ITEMS = 5
+
+# Same order as the partial index idx_medicine_reorder
+REORDER_LIST_KEYS = ((Medicine.name, False), (Medicine.id, False))
+
+reorder_cli = AppGroup('reorder', help='Low-stock reorder queue.')
+
+# inventory.py sets the flag in its stock UPDATEs; these cover ORM writes
+# such as the medicine form, which can change stock or the reorder level.
+
+@event.listens_for(Medicine, 'before_insert')
+@event.listens_for(Medicine, 'before_update')
+def flag_for_reorder(mapper, connection, target):
+    target.needs_reorder = (target.stock_quantity or 0) <= (target.reorder_level or 0)
+
+def reorder_queue_query():
+    """Medicines at or below their reorder level, read from the partial index"""
+    return Medicine.query \
+        .filter(Medicine.needs_reorder == True) \
+        .order_by(Medicine.name, Medicine.id)
+
+def reorder_count():
+    return db.session.query(func.count(Medicine.id)) \
+        .filter(Medicine.needs_reorder == True).scalar()
+
+def refresh_reorder_flags():
+    """Recompute the flag for every medicine whose flag is wrong. Returns rows fixed."""
+    table = Medicine.__table__
+    expected = table.c.stock_quantity <= table.c.reorder_level
+    result = db.session.execute(
+        table.update()
+        .where(table.c.needs_reorder != expected)
+        .values(needs_reorder=expected)
+    )
+    return result.rowcount
+
+@reorder_cli.command('refresh')
+def refresh_command():
+    """Recompute the reorder flag from stock and reorder levels."""
+    fixed = refresh_reorder_flags()
+    db.session.commit()
+    click.echo(f'Updated {fixed} medicine(s); {reorder_count()} need reordering.')
@@ -0,0 +1,235 @@
+from collections import defaultdict
+import click
+from flask.cli import AppGroup
+from sqlalchemy import desc, func
+from sqlalchemy.dialects import postgresql, sqlite
+from extensions import db
+from models import (Medicine, Employee, Sale, SaleItem,
+                    SalesDailyMedicine, SalesDailyEmployee, SalesDailyCategory)
+
+BACKFILL_CHUNK_SIZE = 1000
+
+PERIODS = ('day', 'month', 'year')
+
+# Rollup model per dimension and the line attribute it is keyed on
+DIMENSIONS = {
+    'medicine': (SalesDailyMedicine, 'medicine_id'),
+    'employee': (SalesDailyEmployee, 'employee_id'),
+    'category': (SalesDailyCategory, 'category'),
+}
+
+MEASURES = ('sale_count', 'units', 'revenue')
+
+reports_cli = AppGroup('reports', help='Sales rollups.')
+
+def _current_category(medicine_id):
+    medicine = Medicine.__table__
+    return func.coalesce(
+        db.select(medicine.c.category).where(medicine.c.id == medicine_id).scalar_subquery(),
+        'Unknown'
+    )
+
+def record_categories(criterion, overwrite=True):
+    """Store each line's current medicine category on the sales matching ``criterion``.
+
+    Lines are reversed against the stored category, so a medicine moved
+    to another category later does not take its past sales out of the
+    wrong category rollup. With overwrite=False only lines that have no
+    category yet are filled in.
+    """
+    sale = Sale.__table__
+    item = SaleItem.__table__
+    single = [criterion, sale.c.medicine_id.isnot(None)]
+    lines = [item.c.sale_id.in_(db.select(sale.c.id).where(criterion))]
+    if not overwrite:
+        single.append(sale.c.category.is_(None))
+        lines.append(item.c.category.is_(None))
+    # updated_at is passed through so its onupdate does not fire: a rollup
+    # is not a change to the sale, and ?updated_since= reads rely on that
+    db.session.execute(sale.update().where(*single).values(
+        category=_current_category(sale.c.medicine_id), updated_at=sale.c.updated_at))
+    db.session.execute(item.update().where(*lines).values(category=_current_category(item.c.medicine_id)))
+
+def sale_lines(criterion):
+    """One row per sale and medicine for the sales matching ``criterion``.
+
+    Rows carry sale_id, day, employee_id, medicine_id, category, units and
+    revenue, for single-medicine and itemised sales alike. The category is
+    the one stored by record_categories, or the medicine's current one
+    for lines rolled up before it was stored.
+    """
+    single = db.session.query(
+        Sale.id.label('sale_id'),
+        Sale.sale_date.label('day'),
+        Sale.employee_id.label('employee_id'),
+        Sale.medicine_id.label('medicine_id'),
+        func.coalesce(Sale.category, Medicine.category, 'Unknown').label('category'),
+        Sale.quantity.label('units'),
+        Sale.total_amount.label('revenue')
+    ).outerjoin(Medicine, Medicine.id == Sale.medicine_id) \
+        .filter(criterion, Sale.medicine_id.isnot(None))
+    itemised = db.session.query(
+        Sale.id,
+        Sale.sale_date,
+        Sale.employee_id,
+        SaleItem.medicine_id,
+        func.coalesce(SaleItem.category, Medicine.category, 'Unknown'),
+        SaleItem.quantity,
+        SaleItem.quantity * SaleItem.price
+    ).join(SaleItem, SaleItem.sale_id == Sale.id) \
+        .outerjoin(Medicine, Medicine.id == SaleItem.medicine_id) \
+        .filter(criterion)
+    return single.union_all(itemised).all()
+
+def add_to_rollup(model, key, rows):
+    """Add each row's measures to the matching daily row, creating it if needed"""
+    if not rows:
+        return
+    table = model.__table__
+    dialect = db.engine.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        insert = (sqlite.insert if dialect == 'sqlite' else postgresql.insert)(table)
+        db.session.execute(insert.on_conflict_do_update(
+            index_elements=['day', key],
+            set_={measure: table.c[measure] + insert.excluded[measure] for measure in MEASURES}
+        ), rows)
+        return
+    for row in rows:
+        result = db.session.execute(
+            table.update()
+            .where(table.c.day == row['day'], table.c[key] == row[key])
+            .values({measure: table.c[measure] + row[measure] for measure in MEASURES})
+        )
+        if result.rowcount == 0:
+            db.session.execute(table.insert().values(row))
+
+def apply_lines(lines, sign=1):
+    """Add (sign=1) or remove (sign=-1) sale lines from every rollup table"""
+    if not lines:
+        return
+    for model, key in DIMENSIONS.values():
+        totals = defaultdict(lambda: [set(), 0, 0.0])
+        for line in lines:
+            bucket = totals[(line.day, getattr(line, key))]
+            bucket[0].add(line.sale_id)
+            bucket[1] += line.units
+            bucket[2] += float(line.revenue or 0)
+        add_to_rollup(model, key, [
+            {
+                'day': day,
+                key: value,
+                'sale_count': sign * len(sales),
+                'units': sign * units,
+                'revenue': sign * revenue,
+            }
+            for (day, value), (sales, units, revenue) in totals.items()
+        ])
+        if sign < 0:
+            # Only rows emptied exactly; a negative count means the rollups
+            # drifted and is left to show until `flask reports backfill`
+            table = model.__table__
+            days = {line.day for line in lines}
+            db.session.execute(table.delete().where(table.c.day.in_(days), table.c.sale_count == 0))
+
+def apply_sale(sale_id, sign=1):
+    """Add a sale to the rollups, or take it out with sign=-1.
+
+    Runs in the caller's transaction. Edits take the old version out
+    before changing the sale and add the new one after. Adding records
+    the categories the sale is rolled up under, which taking it out uses.
+    """
+    if sign > 0:
+        record_categories(Sale.id == sale_id)
+    apply_lines(sale_lines(Sale.id == sale_id), sign)
+
+def period_bucket(column, period):
+    """Month or year label for a date column; days are returned as-is"""
+    if period == 'day':
+        return column
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        return func.strftime('%Y-%m' if period == 'month' else '%Y', column)
+    if dialect == 'postgresql':
+        return func.to_char(column, 'YYYY-MM' if period == 'month' else 'YYYY')
+    if period == 'month':
+        return func.extract('year', column) * 100 + func.extract('month', column)
+    return func.extract('year', column)
+
+def revenue_trend(start, end, period='day'):
+    """Sales, units and revenue per day, month or year between two dates.
+
+    Every sale has exactly one employee, so the employee rollup sums to
+    the sale totals with the fewest rows per day.
+    """
+    bucket = period_bucket(SalesDailyEmployee.day, period).label('bucket')
+    return db.session.query(
+        bucket,
+        func.sum(SalesDailyEmployee.sale_count).label('sale_count'),
+        func.sum(SalesDailyEmployee.units).label('units'),
+        func.sum(SalesDailyEmployee.revenue).label('revenue')
+    ).filter(SalesDailyEmployee.day.between(start, end)) \
+        .group_by(bucket).order_by(bucket).all()
+
+def top_sellers(dimension, start, end, limit=10):
+    """Top ``limit`` medicines, employees or categories by revenue between two dates.
+
+    Returns (label, sale_count, units, revenue) tuples.
+    """
+    model, key = DIMENSIONS[dimension]
+    column = getattr(model, key)
+    revenue = func.sum(model.revenue).label('revenue')
+    rows = db.session.query(
+        column,
+        func.sum(model.sale_count),
+        func.sum(model.units),
+        revenue
+    ).filter(model.day.between(start, end)) \
+        .group_by(column).order_by(desc(revenue), column).limit(limit).all()
+
+    if dimension == 'category':
+        return rows
+    named = Medicine if dimension == 'medicine' else Employee
+    ids = [row[0] for row in rows]
+    names = dict(db.session.query(named.id, named.name).filter(named.id.in_(ids)).all()) if ids else {}
+    return [(names.get(value, f'Deleted {dimension} #{value}'), *rest) for value, *rest in rows]
+
+def backfill(chunk_size=BACKFILL_CHUNK_SIZE, echo=None):
+    """Rebuild every rollup table from the sale table in id chunks.
+
+    Each chunk commits on its own. Sales recorded after the backfill starts
+    are left to the incremental updates; edits and deletes of older sales
+    while it runs can still skew the totals, so run it when the shop is
+    quiet. Returns the number of sales processed.
+    """
+    high_water = db.session.query(func.max(Sale.id)).scalar()
+    for model, _ in DIMENSIONS.values():
+        db.session.query(model).delete(synchronize_session=False)
+    db.session.commit()
+    if high_water is None:
+        return 0
+
+    processed = 0
+    last_id = 0
+    while last_id < high_water:
+        ids = [row[0] for row in db.session.query(Sale.id)
+               .filter(Sale.id > last_id, Sale.id <= high_water)
+               .order_by(Sale.id).limit(chunk_size)]
+        if not ids:
+            break
+        chunk = Sale.id.between(ids[0], ids[-1])
+        record_categories(chunk, overwrite=False)
+        apply_lines(sale_lines(chunk))
+        db.session.commit()
+        processed += len(ids)
+        last_id = ids[-1]
+        if echo:
+            echo(f'{processed} sales rolled up (through id {last_id})')
+    return processed
+
+@reports_cli.command('backfill')
+@click.option('--chunk-size', default=BACKFILL_CHUNK_SIZE, show_default=True,
+              help='Sales per transaction.')
+def backfill_command(chunk_size):
+    """Rebuild the daily sales rollups from the sale table."""
+    processed = backfill(chunk_size, echo=click.echo)
+    click.echo(f'Rolled up {processed} sales.')
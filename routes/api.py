@@ -0,0 +1,164 @@
+from flask import Blueprint, current_app, jsonify, request, abort
+from flask_login import login_required, current_user
+from extensions import db
+from models import Medicine, Customer, Employee, Job
+from pagination import keyset_paginate
+from queries import MEDICINE_LIST_KEYS, CUSTOMER_LIST_KEYS, EMPLOYEE_LIST_KEYS
+from search import medicine_search_query
+from catalog import cached_read, stats_snapshot, LOOKUP_TIMEOUT, STOCK_NAMESPACE
+from reorder import reorder_queue_query, REORDER_LIST_KEYS, REORDER_PAGE_SIZE
+from instrumentation import slow_request_snapshot
+from jobs import enqueue, job_payload
+
+api = Blueprint('api', __name__, url_prefix='/api')
+
+LOOKUP_PAGE_SIZE = 20
+JOB_LIST_LIMIT = 50
+
+def _prefix_pattern(term):
+    escaped = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f'{escaped}%'
+
+def _lookup_payload(page, serialize):
+    return {
+        'results': [serialize(item) for item in page.items],
+        'next': page.next_cursor,
+    }
+
+def _cached_lookup(namespace, term, loader, depends_on=(), **extra):
+    cursor = request.args.get('cursor') or ''
+    params = ':'.join(f'{k}={v}' for k, v in sorted(extra.items()))
+    key = f'lookup:{term.lower()}:{cursor}:{params}'
+    return jsonify(cached_read(namespace, key, lambda: loader(cursor or None), timeout=LOOKUP_TIMEOUT,
+                               depends_on=depends_on))
+
+@api.route('/customers/search')
+@login_required
+def search_customers():
+    term = request.args.get('q', '').strip()
+
+    def load(cursor):
+        query = Customer.query
+        if term:
+            query = query.filter(Customer.name.ilike(_prefix_pattern(term), escape='\\'))
+        page = keyset_paginate(query, CUSTOMER_LIST_KEYS, cursor, per_page=LOOKUP_PAGE_SIZE)
+        return _lookup_payload(page, lambda c: {
+            'id': c.id,
+            'text': c.name,
+            'phone': c.phone,
+        })
+
+    return _cached_lookup('customer', term, load)
+
+@api.route('/employees/search')
+@login_required
+def search_employees():
+    term = request.args.get('q', '').strip()
+
+    def load(cursor):
+        query = Employee.query
+        if term:
+            query = query.filter(Employee.name.ilike(_prefix_pattern(term), escape='\\'))
+        page = keyset_paginate(query, EMPLOYEE_LIST_KEYS, cursor, per_page=LOOKUP_PAGE_SIZE)
+        return _lookup_payload(page, lambda e: {
+            'id': e.id,
+            'text': e.name,
+            'position': e.position,
+        })
+
+    return _cached_lookup('employee', term, load)
+
+@api.route('/medicines/search')
+@login_required
+def search_medicines():
+    term = request.args.get('q', '').strip()
+    in_stock = request.args.get('in_stock', 0, type=int)
+
+    def load(cursor):
+        ranked = medicine_search_query(term) if term else None
+        if ranked is not None:
+            query, keys = ranked
+        else:
+            query, keys = Medicine.query, MEDICINE_LIST_KEYS
+            if term:
+                query = query.filter(Medicine.name.ilike(_prefix_pattern(term), escape='\\'))
+        if in_stock:
+            query = query.filter(Medicine.stock_quantity > 0)
+
+        page = keyset_paginate(query, keys, cursor, per_page=LOOKUP_PAGE_SIZE)
+        return _lookup_payload(page, lambda m: {
+            'id': m.id,
+            'text': f"{m.name} ({m.manufacturer})",
+            'price': m.price,
+            'stock': m.stock_quantity,
+        })
+
+    # Shows stock and filters on it, so also keyed on the stock version
+    return _cached_lookup('medicine', term, load, depends_on=(STOCK_NAMESPACE,), in_stock=in_stock)
+
+@api.route('/reorder-queue')
+@login_required
+def reorder_queue():
+    # Not cached: the queue follows live stock
+    page = keyset_paginate(reorder_queue_query(), REORDER_LIST_KEYS, request.args.get('cursor'),
+                           per_page=REORDER_PAGE_SIZE)
+    return jsonify(_lookup_payload(page, lambda m: {
+        'id': m.id,
+        'text': f"{m.name} ({m.manufacturer})",
+        'stock': m.stock_quantity,
+        'reorder_level': m.reorder_level,
+        'shortfall': m.reorder_level - m.stock_quantity,
+    }))
+
+@api.route('/cache/stats')
+@login_required
+def cache_stats():
+    if not current_user.is_admin:
+        abort(403)
+    return jsonify(stats_snapshot())
+
+@api.route('/instrumentation/slow-requests')
+@login_required
+def slow_requests():
+    if not current_user.is_admin:
+        abort(403)
+    return jsonify({
+        'enabled': current_app.config['INSTRUMENTATION'],
+        'slow_request_ms': current_app.config['SLOW_REQUEST_MS'],
+        'requests': slow_request_snapshot(),
+    })
+
+@api.route('/jobs')
+@login_required
+def list_jobs():
+    query = Job.query
+    if request.args.get('status'):
+        query = query.filter(Job.status == request.args['status'])
+    if request.args.get('kind'):
+        query = query.filter(Job.kind == request.args['kind'])
+    jobs = query.order_by(Job.id.desc()).limit(JOB_LIST_LIMIT).all()
+    return jsonify({'jobs': [job_payload(job) for job in jobs]})
+
+@api.route('/jobs/<int:id>')
+@login_required
+def job_status(id):
+    job = db.session.get(Job, id)
+    if job is None:
+        abort(404)
+    return jsonify(job_payload(job))
+
+@api.route('/jobs', methods=['POST'])
+@login_required
+def create_job():
+    if not current_user.is_admin:
+        abort(403)
+    body = request.get_json(silent=True) or {}
+    params = body.get('params') or {}
+    if not isinstance(params, dict):
+        return jsonify({'error': 'params must be an object'}), 400
+    key = request.headers.get('Idempotency-Key') or body.get('idempotency_key')
+    try:
+        job, created = enqueue(body.get('kind'), params, key)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(job_payload(job)), 202 if created else 200
@@ -0,0 +1,243 @@
+from collections import namedtuple
+from datetime import date, datetime
+from decimal import Decimal
+from flask import Blueprint, jsonify, request, abort
+from flask_login import login_required
+from flask_wtf.csrf import generate_csrf
+from extensions import db
+from models import Medicine, Customer, Employee, Prescription, PrescriptionItem, Sale, SaleItem
+from pagination import keyset_paginate
+from inventory import InsufficientStock, run_with_lock_retry
+from sales import create_itemised_sale
+
+api_v1 = Blueprint('api_v1', __name__, url_prefix='/api/v1')
+
+API_PAGE_SIZE = 50
+API_MAX_PAGE_SIZE = 200
+API_BATCH_LIMIT = 100  # ids per batched lookup
+BULK_SALE_LIMIT = 50  # sales per bulk submission
+
+# Lines embedded under "items": (model, parent key column, {field: column})
+Items = namedtuple('Items', 'model parent fields')
+
+# A resource: its model, {field: column} and optional embedded lines.
+# Reads select only the requested columns and return plain rows, so no
+# ORM instances are built and nothing accumulates in the session.
+Resource = namedtuple('Resource', 'model fields items')
+
+RESOURCES = {
+    'medicines': Resource(Medicine, {
+        'id': Medicine.id,
+        'name': Medicine.name,
+        'description': Medicine.description,
+        'manufacturer': Medicine.manufacturer,
+        'category': Medicine.category,
+        'price': Medicine.price,
+        'stock_quantity': Medicine.stock_quantity,
+        'reorder_level': Medicine.reorder_level,
+        'needs_reorder': Medicine.needs_reorder,
+        'expiry_date': Medicine.expiry_date,
+        'expiry_bucket': Medicine.expiry_bucket,
+        'updated_at': Medicine.updated_at,
+    }, None),
+    'customers': Resource(Customer, {
+        'id': Customer.id,
+        'name': Customer.name,
+        'email': Customer.email,
+        'phone': Customer.phone,
+        'address': Customer.address,
+        'updated_at': Customer.updated_at,
+    }, None),
+    'sales': Resource(Sale, {
+        'id': Sale.id,
+        'customer_id': Sale.customer_id,
+        'employee_id': Sale.employee_id,
+        'medicine_id': Sale.medicine_id,
+        'quantity': Sale.quantity,
+        'unit_price': Sale.unit_price,
+        'total_amount': Sale.total_amount,
+        'sale_date': Sale.sale_date,
+        'updated_at': Sale.updated_at,
+    }, Items(SaleItem, SaleItem.sale_id, {
+        'medicine_id': SaleItem.medicine_id,
+        'quantity': SaleItem.quantity,
+        'price': SaleItem.price,
+    })),
+    'prescriptions': Resource(Prescription, {
+        'id': Prescription.id,
+        'customer_id': Prescription.customer_id,
+        'doctor_name': Prescription.doctor_name,
+        'prescription_date': Prescription.prescription_date,
+        'notes': Prescription.notes,
+        'updated_at': Prescription.updated_at,
+    }, Items(PrescriptionItem, PrescriptionItem.prescription_id, {
+        'medicine_id': PrescriptionItem.medicine_id,
+        'quantity': PrescriptionItem.quantity,
+        'instructions': PrescriptionItem.instructions,
+    })),
+}
+
+class InvalidRequest(ValueError):
+    pass
+
+@api_v1.errorhandler(InvalidRequest)
+def bad_request(e):
+    return jsonify({'error': str(e)}), 400
+
+def _value(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+def _int_list(name, limit):
+    raw = request.args.get(name, '')
+    try:
+        values = [int(part) for part in raw.split(',') if part.strip()]
+    except ValueError:
+        raise InvalidRequest(f'{name} must be a comma-separated list of integers')
+    if len(values) > limit:
+        raise InvalidRequest(f'At most {limit} {name} per request')
+    return values
+
+def _selected_fields(resource):
+    """Fields named in ?fields=, all of them by default; 'items' embeds the lines"""
+    allowed = list(resource.fields) + (['items'] if resource.items else [])
+    requested = [f.strip() for f in request.args.get('fields', '').split(',') if f.strip()]
+    if not requested:
+        return allowed
+    unknown = sorted(set(requested) - set(allowed))
+    if unknown:
+        raise InvalidRequest(f"Unknown fields: {', '.join(unknown)}; available: {', '.join(allowed)}")
+    # id is always returned: it is the cursor key and what clients match results on
+    return ['id'] + [f for f in dict.fromkeys(requested) if f != 'id']
+
+def _query(resource, fields):
+    columns = [resource.fields[f].label(f) for f in fields if f != 'items']
+    return db.session.query(*columns).select_from(resource.model)
+
+def _serialize(rows, fields, resource):
+    results = [{f: _value(row._mapping[f]) for f in fields if f != 'items'} for row in rows]
+    if 'items' in fields and results:
+        # One query for the lines of every row on the page
+        items = resource.items
+        lines = {}
+        query = db.session.query(items.parent.label('parent_id'),
+                                 *[column.label(f) for f, column in items.fields.items()]) \
+            .filter(items.parent.in_([r['id'] for r in results])) \
+            .order_by(items.parent, items.model.id)
+        for line in query:
+            lines.setdefault(line.parent_id, []).append({f: _value(line._mapping[f]) for f in items.fields})
+        for result in results:
+            result['items'] = lines.get(result['id'], [])
+    return results
+
+def _conditional(payload):
+    """JSON response with an ETag over its body; a matching If-None-Match gets a 304"""
+    response = jsonify(payload)
+    response.add_etag()
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+def _resource(name):
+    resource = RESOURCES.get(name)
+    if resource is None:
+        abort(404)
+    return resource
+
+@api_v1.route('/')
+@login_required
+def index():
+    # POS clients send the token back as X-CSRFToken on POST requests
+    return jsonify({'version': 1, 'resources': sorted(RESOURCES), 'csrf_token': generate_csrf()})
+
+@api_v1.route('/<resource_name>')
+@login_required
+def list_resource(resource_name):
+    """Rows by ?ids=1,2,3 in that order, or a page in id order from ?cursor="""
+    resource = _resource(resource_name)
+    fields = _selected_fields(resource)
+    query = _query(resource, fields)
+
+    if 'ids' in request.args:
+        ids = _int_list('ids', API_BATCH_LIMIT)
+        rows = {row.id: row for row in query.filter(resource.fields['id'].in_(ids))} if ids else {}
+        found = [rows[i] for i in dict.fromkeys(ids) if i in rows]
+        return _conditional({
+            'results': _serialize(found, fields, resource),
+            'missing': [i for i in dict.fromkeys(ids) if i not in rows],
+        })
+
+    updated_since = request.args.get('updated_since')
+    if updated_since:
+        try:
+            query = query.filter(resource.fields['updated_at'] >= datetime.fromisoformat(updated_since))
+        except ValueError:
+            raise InvalidRequest('updated_since must be an ISO 8601 date or datetime')
+    limit = min(max(request.args.get('limit', API_PAGE_SIZE, type=int), 1), API_MAX_PAGE_SIZE)
+    page = keyset_paginate(query, ((resource.fields['id'], False),), request.args.get('cursor'), per_page=limit)
+    return _conditional({'results': _serialize(page.items, fields, resource), 'next': page.next_cursor})
+
+@api_v1.route('/<resource_name>/<int:id>')
+@login_required
+def get_resource(resource_name, id):
+    resource = _resource(resource_name)
+    fields = _selected_fields(resource)
+    row = _query(resource, fields).filter(resource.fields['id'] == id).first()
+    if row is None:
+        abort(404)
+    return _conditional(_serialize([row], fields, resource)[0])
+
+def _sale_lines(entry):
+    lines = entry.get('items')
+    if not isinstance(lines, list) or not lines:
+        raise ValueError('items must be a non-empty list')
+    try:
+        return [(int(line['medicine_id']), int(line['quantity'])) for line in lines]
+    except (KeyError, TypeError, ValueError):
+        raise ValueError('Each item needs an integer medicine_id and quantity')
+
+@api_v1.route('/sales/bulk', methods=['POST'])
+@login_required
+def bulk_sales():
+    """Record up to BULK_SALE_LIMIT checkout sales.
+
+    Each sale is its own transaction, so one that is short of stock or
+    invalid is reported and the rest are still recorded. Results come
+    back in the order submitted.
+    """
+    body = request.get_json(silent=True) or {}
+    entries = body.get('sales')
+    if not isinstance(entries, list) or not entries:
+        raise InvalidRequest('sales must be a non-empty list')
+    if len(entries) > BULK_SALE_LIMIT:
+        raise InvalidRequest(f'At most {BULK_SALE_LIMIT} sales per request')
+
+    # Every customer and employee of the batch checked in two queries
+    def ids(key):
+        return {entry.get(key) for entry in entries if isinstance(entry, dict) and isinstance(entry.get(key), int)}
+    customers = {i for (i,) in db.session.query(Customer.id).filter(Customer.id.in_(ids('customer_id')))}
+    employees = {i for (i,) in db.session.query(Employee.id).filter(Employee.id.in_(ids('employee_id')))}
+
+    results = []
+    for index, entry in enumerate(entries):
+        try:
+            if not isinstance(entry, dict):
+                raise ValueError('Each sale must be an object')
+            if entry.get('customer_id') not in customers:
+                raise ValueError('Unknown customer_id')
+            if entry.get('employee_id') not in employees:
+                raise ValueError('Unknown employee_id')
+            lines = _sale_lines(entry)
+            sale_date = date.fromisoformat(entry['sale_date']) if entry.get('sale_date') else None
+            sale = run_with_lock_retry(lambda: create_itemised_sale(
+                entry['customer_id'], entry['employee_id'], lines, sale_date=sale_date))
+            results.append({'index': index, 'status': 'created', 'id': sale.id,
+                            'total_amount': sale.total_amount})
+        except (InsufficientStock, ValueError, TypeError) as e:
+            results.append({'index': index, 'status': 'rejected', 'error': str(e)})
+
+    created = sum(1 for result in results if result['status'] == 'created')
+    return jsonify({'created': created, 'rejected': len(results) - created, 'results': results})
@@ -4,6 +4,7 @@ from werkzeug.urls import url_parse
 from models import User
 from forms import LoginForm, RegistrationForm
 from extensions import db
+from passwords import burn_password_check
 import logging
 
 auth = Blueprint('auth', __name__, url_prefix='/auth')
@@ -16,15 +17,12 @@ def login():
     
     form = LoginForm()
     if form.validate_on_submit():
-        logger.info(f"Login attempt for user: {form.username.data}")
-        
+        # One lookup on the unique username index
         user = User.query.filter_by(username=form.username.data).first()
         
-        # Log all users in database for debugging
-        all_users = User.query.all()
-        logger.info(f"All users in database: {[u.username for u in all_users]}")
-        
         if user is None:
+            # Same hashing cost as a wrong password, so timing does not reveal usernames
+            burn_password_check(form.password.data)
             logger.warning(f"User not found: {form.username.data}")
             flash('Invalid username or password', 'danger')
             return redirect(url_for('auth.login'))
@@ -34,6 +32,11 @@ def login():
             flash('Invalid username or password', 'danger')
             return redirect(url_for('auth.login'))
         
+        if user.password_needs_rehash():
+            # Hash settings changed since this password was set
+            user.set_password(form.password.data)
+            db.session.commit()
+        
         login_user(user, remember=form.remember_me.data)
         logger.info(f"Successful login for user: {user.username}")
         
@@ -1,10 +1,28 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request
+from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app, send_from_directory, abort
 from flask_login import login_required
-from models import Medicine, Customer, Employee, Prescription, Sale, PrescriptionItem
-from forms import MedicineForm, CustomerForm, EmployeeForm, PrescriptionForm, SaleForm
+from sqlalchemy.orm import selectinload
+from models import Medicine, Customer, Employee, Prescription, Sale, SaleItem, PrescriptionItem
+from forms import MedicineForm, MedicineImportForm, CustomerForm, EmployeeForm, PrescriptionForm, SaleForm, CheckoutForm
 from extensions import db, limiter
-from sqlalchemy import or_, desc
-from datetime import datetime
+from queries import (medicine_list_query, customer_list_query, employee_list_query, prescription_list_query,
+                     sale_list_query, MEDICINE_LIST_KEYS, CUSTOMER_LIST_KEYS, EMPLOYEE_LIST_KEYS,
+                     PRESCRIPTION_LIST_KEYS, SALE_LIST_KEYS)
+from pagination import keyset_paginate, approximate_count
+from search import medicine_search_query
+from counters import dashboard_counts
+from catalog import medicine_categories
+from inventory import decrement_stock, increment_stock, increment_stock_many, run_with_lock_retry, InsufficientStock
+from sales import create_itemised_sale, sale_quantities
+from rollups import apply_sale
+from expiry import expiry_summary, expiry_query, EXPIRY_BUCKETS, EXPIRY_LIST_KEYS, EXPIRY_PAGE_SIZE
+from catalog_import import import_medicines, import_format, open_upload
+from jobs import enqueue, imports_dir
+from http_cache import render_conditional, rows_version
+from reorder import reorder_queue_query, reorder_count, REORDER_LIST_KEYS, REORDER_PAGE_SIZE, DASHBOARD_REORDER_ITEMS
+from datetime import date, datetime
+import os
+import re
+from uuid import uuid4
 # Import your other dependencies
 
 main = Blueprint('main', __name__)
@@ -12,55 +30,75 @@ main = Blueprint('main', __name__)
 @main.route('/')
 @login_required
 def index():
-    medicine_count = Medicine.query.count()
-    customer_count = Customer.query.count()
-    employee_count = Employee.query.count()
-    prescription_count = Prescription.query.count()
-    sale_count = Sale.query.count()
+    counts = dashboard_counts()
+    reorder = keyset_paginate(reorder_queue_query(), REORDER_LIST_KEYS, per_page=DASHBOARD_REORDER_ITEMS)
     
     return render_template('index.html',
-                         medicine_count=medicine_count,
-                         customer_count=customer_count,
-                         employee_count=employee_count,
-                         prescription_count=prescription_count,
-                         sale_count=sale_count)
+                         medicine_count=counts['medicine'],
+                         customer_count=counts['customer'],
+                         employee_count=counts['employee'],
+                         prescription_count=counts['prescription'],
+                         sale_count=counts['sale'],
+                         reorder_items=reorder.items,
+                         reorder_count=reorder_count() if reorder.has_next else len(reorder.items))
 
 @main.route('/medicines')
 @login_required
 @limiter.limit("60 per minute")  # Adjust rate as needed
 def medicines():
-    page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor')
     search = request.args.get('search', '')
     category = request.args.get('category', '')
     
-    query = Medicine.query
-    
-    if search:
-        query = query.filter(
-            or_(
-                Medicine.name.ilike(f'%{search}%'),
-                Medicine.manufacturer.ilike(f'%{search}%'),
-                Medicine.category.ilike(f'%{search}%')
-            )
-        )
-    if category:
-        query = query.filter(Medicine.category == category)
+    ranked = medicine_search_query(search, category) if search else None
+    if ranked is not None:
+        query, keys = ranked
+    else:
+        query, keys = medicine_list_query(search, category), MEDICINE_LIST_KEYS
     
     # Get unique categories for filter dropdown
-    categories = db.session.query(Medicine.category).distinct().all()
+    categories = medicine_categories()
     
-    medicines = query.order_by(Medicine.name).paginate(
-        page=page,
-        per_page=10,
-        error_out=False
-    )
+    medicines = keyset_paginate(query, keys, cursor, per_page=10)
+    medicines.total = approximate_count(('medicine', search, category), query,
+                                        model=None if search or category else Medicine)
     
-    return render_template('medicines.html',
+    return render_conditional((rows_version(medicines.items), medicines.total, categories),
+                         'medicines.html',
                          medicines=medicines,
                          search=search,
                          category=category,
                          categories=categories)
 
+@main.route('/medicines/reorder')
+@login_required
+def reorder_queue():
+    cursor = request.args.get('cursor')
+    medicines = keyset_paginate(reorder_queue_query(), REORDER_LIST_KEYS, cursor, per_page=REORDER_PAGE_SIZE)
+    medicines.total = reorder_count()
+    return render_conditional((rows_version(medicines.items), medicines.total),
+                              'reorder_queue.html', medicines=medicines)
+
+@main.route('/medicines/expiry')
+@login_required
+def expiry_report():
+    cursor = request.args.get('cursor')
+    bucket = request.args.get('bucket', '30')
+    buckets = [name for name, _ in EXPIRY_BUCKETS]
+    if bucket not in buckets:
+        bucket = '30'
+
+    summary = expiry_summary()
+    medicines = keyset_paginate(expiry_query(bucket), EXPIRY_LIST_KEYS, cursor, per_page=EXPIRY_PAGE_SIZE)
+    medicines.total = summary[bucket]
+    # Buckets move at midnight even when no row changes
+    return render_conditional((rows_version(medicines.items), summary, date.today()),
+                         'expiry_report.html',
+                         medicines=medicines,
+                         summary=summary,
+                         bucket=bucket,
+                         buckets=buckets)
+
 @main.route('/medicines/new', methods=['GET', 'POST'])
 @login_required
 def new_medicine():
@@ -94,6 +132,49 @@ def new_medicine():
     
     return render_template('medicine_form.html', form=form, title='New Medicine')
 
+@main.route('/medicines/import', methods=['GET', 'POST'])
+@login_required
+def import_medicines_upload():
+    form = MedicineImportForm()
+    result = errors_name = job = None
+    if form.validate_on_submit():
+        upload = form.file.data
+        os.makedirs(imports_dir(), exist_ok=True)
+        fmt = import_format(upload.filename)
+        if current_app.config['JOB_IMPORTS']:
+            # Saved as-is and imported by a job worker; the page links to its status
+            upload_name = f'{uuid4().hex}.upload.{fmt}'
+            upload.save(os.path.join(imports_dir(), upload_name))
+            job, _ = enqueue('medicines.import', {'upload': upload_name, 'filename': upload.filename})
+            current_app.logger.info(f'Medicine import {upload.filename} queued as job {job.id}')
+            flash(f'Import queued as job {job.id}.', 'info')
+        else:
+            errors_name = f'{uuid4().hex}.csv'
+            errors_path = os.path.join(imports_dir(), errors_name)
+            # The upload is read row by row, never loaded whole
+            with open(errors_path, 'w', encoding='utf-8', newline='') as errors:
+                result = import_medicines(open_upload(upload), fmt, errors=errors)
+            current_app.logger.info(f'Medicine import {upload.filename}: {result}')
+            if result['failed']:
+                flash(f"{result['failed']} row(s) were rejected.", 'warning')
+            else:
+                os.remove(errors_path)
+                errors_name = None
+            flash(f"Imported {result['inserted']} new and {result['updated']} updated medicine(s).", 'success')
+    return render_template('medicine_import.html', form=form, result=result, errors_name=errors_name, job=job)
+
+@main.route('/medicines/import/errors/<name>')
+@login_required
+def import_errors(name):
+    if not re.fullmatch(r'[0-9a-f]{32}\.csv', name):
+        abort(404)
+    response = send_from_directory(imports_dir(), name, as_attachment=True,
+                                   download_name='rejected-rows.csv')
+    # Customer-facing data: never kept in a browser or proxy cache
+    response.cache_control.no_cache = None
+    response.cache_control.no_store = True
+    return response
+
 @main.route('/medicines/<int:id>/edit', methods=['GET', 'POST'])
 @login_required
 def edit_medicine(id):
@@ -129,21 +210,14 @@ def delete_medicine(id):
 @main.route('/customers')
 @login_required
 def customers():
-    page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor')
     search = request.args.get('search', '')
     
-    query = Customer.query
-    if search:
-        query = query.filter(
-            or_(
-                Customer.name.ilike(f'%{search}%'),
-                Customer.email.ilike(f'%{search}%'),
-                Customer.phone.ilike(f'%{search}%')
-            )
-        )
-    
-    customers = query.order_by(Customer.name).paginate(page=page, per_page=10, error_out=False)
-    return render_template('customers.html', customers=customers, search=search)
+    query = customer_list_query(search)
+    customers = keyset_paginate(query, CUSTOMER_LIST_KEYS, cursor, per_page=10)
+    customers.total = approximate_count(('customer', search), query, model=None if search else Customer)
+    return render_conditional((rows_version(customers.items), customers.total),
+                              'customers.html', customers=customers, search=search)
 
 @main.route('/customers/new', methods=['GET', 'POST'])
 @login_required
@@ -202,21 +276,14 @@ def delete_customer(id):
 @main.route('/employees')
 @login_required
 def employees():
-    page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor')
     search = request.args.get('search', '')
     
-    query = Employee.query
-    if search:
-        query = query.filter(
-            or_(
-                Employee.name.ilike(f'%{search}%'),
-                Employee.email.ilike(f'%{search}%'),
-                Employee.position.ilike(f'%{search}%')
-            )
-        )
-    
-    employees = query.order_by(Employee.name).paginate(page=page, per_page=10, error_out=False)
-    return render_template('employees.html', employees=employees, search=search)
+    query = employee_list_query(search)
+    employees = keyset_paginate(query, EMPLOYEE_LIST_KEYS, cursor, per_page=10)
+    employees.total = approximate_count(('employee', search), query, model=None if search else Employee)
+    return render_conditional((rows_version(employees.items), employees.total),
+                              'employees.html', employees=employees, search=search)
 
 @main.route('/employees/new', methods=['GET', 'POST'])
 @login_required
@@ -276,29 +343,22 @@ def delete_employee(id):
 @main.route('/prescriptions')
 @login_required
 def prescriptions():
-    page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor')
     search = request.args.get('search', '')
     
-    query = Prescription.query
-    if search:
-        query = query.join(Customer).filter(
-            or_(
-                Customer.name.ilike(f'%{search}%'),
-                Prescription.doctor_name.ilike(f'%{search}%')
-            )
-        )
-    
-    prescriptions = query.order_by(desc(Prescription.prescription_date)).paginate(
-        page=page, per_page=10, error_out=False
-    )
-    return render_template('prescriptions.html', prescriptions=prescriptions, search=search)
+    query = prescription_list_query(search)
+    prescriptions = keyset_paginate(query, PRESCRIPTION_LIST_KEYS, cursor, per_page=10)
+    prescriptions.total = approximate_count(('prescription', search), query,
+                                            model=None if search else Prescription)
+    items = prescriptions.items
+    return render_conditional((rows_version(items), rows_version(p.customer for p in items),
+                               [p.item_count for p in items], prescriptions.total),
+                              'prescriptions.html', prescriptions=prescriptions, search=search)
 
 @main.route('/prescriptions/new', methods=['GET', 'POST'])
 @login_required
 def new_prescription():
     form = PrescriptionForm()
-    # Populate customer choices
-    form.customer_id.choices = [(c.id, c.name) for c in Customer.query.order_by(Customer.name).all()]
     
     if form.validate_on_submit():
         prescription = Prescription(
@@ -323,7 +383,6 @@ def new_prescription():
 def edit_prescription(id):
     prescription = Prescription.query.get_or_404(id)
     form = PrescriptionForm(obj=prescription)
-    form.customer_id.choices = [(c.id, c.name) for c in Customer.query.order_by(Customer.name).all()]
     
     if form.validate_on_submit():
         form.populate_obj(prescription)
@@ -355,114 +414,134 @@ def delete_prescription(id):
 @login_required
 def view_prescription(id):
     prescription = Prescription.query.get_or_404(id)
-    return render_template('prescription_view.html', prescription=prescription)
+    items = prescription.items
+    return render_conditional(rows_version([prescription, prescription.customer, *items,
+                                            *(item.medicine for item in items)]),
+                              'prescription_view.html', prescription=prescription)
 
 @main.route('/sales')
 @login_required
 def sales():
-    page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor')
     search = request.args.get('search', '')
     
-    query = Sale.query
-    if search:
-        query = query.join(Customer).filter(
-            or_(
-                Customer.name.ilike(f'%{search}%'),
-                Sale.invoice_number.ilike(f'%{search}%')
-            )
-        )
-    
-    sales = query.order_by(desc(Sale.sale_date)).paginate(
-        page=page, per_page=10, error_out=False
-    )
-    return render_template('sales.html', sales=sales, search=search)
+    query = sale_list_query(search)
+    sales = keyset_paginate(query, SALE_LIST_KEYS, cursor, per_page=10)
+    sales.total = approximate_count(('sale', search), query, model=None if search else Sale)
+    items = sales.items
+    return render_conditional((rows_version(items),
+                               rows_version(row for sale in items
+                                            for row in (sale.customer, sale.medicine, sale.employee)),
+                               [sale.item_count for sale in items], sales.total),
+                              'sales.html', sales=sales, search=search)
 
 @main.route('/sales/new', methods=['GET', 'POST'])
 @login_required
 def new_sale():
     form = SaleForm()
-    
-    # Populate form choices
-    form.customer_id.choices = [(c.id, c.name) for c in Customer.query.order_by(Customer.name).all()]
-    form.medicine_id.choices = [(m.id, f"{m.name} - Stock: {m.stock_quantity}") 
-                              for m in Medicine.query.filter(Medicine.stock_quantity > 0).order_by(Medicine.name).all()]
-    form.employee_id.choices = [(e.id, e.name) for e in Employee.query.order_by(Employee.name).all()]
 
     if form.validate_on_submit():
-        try:
-            # Get the medicine to check stock and price
-            medicine = Medicine.query.get_or_404(form.medicine_id.data)
-            
-            # Validate stock availability
-            if medicine.stock_quantity < form.quantity.data:
-                flash(f'Not enough stock. Only {medicine.stock_quantity} units available.', 'danger')
-                return render_template('sale_form.html', form=form, title='New Sale')
-
-            # Create new sale
+        # Medicine was already loaded when the form validated its id
+        medicine = form.medicine_id.get_object()
+        quantity = form.quantity.data
+
+        def record_sale():
             sale = Sale(
                 customer_id=form.customer_id.data,
-                medicine_id=form.medicine_id.data,
+                medicine_id=medicine.id,
                 employee_id=form.employee_id.data,
-                quantity=form.quantity.data,
+                quantity=quantity,
                 unit_price=medicine.price,
-                total_amount=medicine.price * form.quantity.data,
+                total_amount=medicine.price * quantity,
                 sale_date=form.sale_date.data or datetime.now().date()
             )
-
-            # Update medicine stock
-            medicine.stock_quantity -= form.quantity.data
-
-            # Save changes
             db.session.add(sale)
-            db.session.commit()
+            db.session.flush()
+            # Conditional UPDATE: fails instead of overselling under concurrency
+            decrement_stock(medicine.id, quantity, sale_id=sale.id)
+            apply_sale(sale.id)
+            return sale
 
+        try:
+            run_with_lock_retry(record_sale)
             flash('Sale created successfully!', 'success')
             return redirect(url_for('main.sales'))
-
+        except InsufficientStock as e:
+            flash(str(e), 'danger')
         except Exception as e:
-            db.session.rollback()
             flash(f'Error creating sale: {str(e)}', 'danger')
-            app.logger.error(f'Error creating sale: {str(e)}')
+            current_app.logger.error(f'Error creating sale: {str(e)}')
 
     return render_template('sale_form.html', form=form, title='New Sale')
 
+@main.route('/sales/checkout', methods=['GET', 'POST'])
+@login_required
+def checkout():
+    form = CheckoutForm()
+
+    if form.validate_on_submit():
+        lines = [(line.medicine_id.data, line.quantity.data) for line in form.lines]
+
+        def record_checkout():
+            return create_itemised_sale(
+                form.customer_id.data,
+                form.employee_id.data,
+                lines,
+                sale_date=form.sale_date.data
+            )
+
+        try:
+            sale = run_with_lock_retry(record_checkout)
+            flash('Sale created successfully!', 'success')
+            return redirect(url_for('main.view_sale', id=sale.id))
+        except (InsufficientStock, ValueError) as e:
+            flash(str(e), 'danger')
+        except Exception as e:
+            flash(f'Error creating sale: {str(e)}', 'danger')
+            current_app.logger.error(f'Error creating sale: {str(e)}')
+
+    # Names for the lines already in the cart, e.g. after a failed submit
+    ids = [line.medicine_id.data for line in form.lines if line.medicine_id.data]
+    medicines = {m.id: m for m in Medicine.query.filter(Medicine.id.in_(ids))} if ids else {}
+    return render_template('checkout.html', form=form, medicines=medicines)
+
 @main.route('/sales/<int:id>/edit', methods=['GET', 'POST'])
 @login_required
 def edit_sale(id):
     sale = Sale.query.get_or_404(id)
+    if sale.is_itemised:
+        flash('Checkout sales cannot be edited. Delete the sale and check out again.', 'warning')
+        return redirect(url_for('main.view_sale', id=id))
     form = SaleForm(obj=sale)
     
-    form.customer_id.choices = [(c.id, c.name) for c in Customer.query.order_by(Customer.name).all()]
-    form.medicine_id.choices = [(m.id, f"{m.name} (Stock: {m.stock_quantity})") 
-                              for m in Medicine.query.order_by(Medicine.name).all()]
-    
     if form.validate_on_submit():
-        # Restore original stock
-        original_medicine = Medicine.query.get(sale.medicine_id)
-        original_medicine.stock_quantity += sale.quantity
-        
-        # Update with new values
-        new_medicine = Medicine.query.get(form.medicine_id.data)
-        if new_medicine.stock_quantity < form.quantity.data:
-            flash('Not enough stock available.', 'danger')
-            return render_template('sale_form.html', form=form, title='Edit Sale')
-        
-        sale.customer_id = form.customer_id.data
-        sale.medicine_id = form.medicine_id.data
-        sale.quantity = form.quantity.data
-        sale.sale_date = form.sale_date.data
-        sale.unit_price = new_medicine.price
-        sale.total_amount = new_medicine.price * form.quantity.data
-        
-        # Update new medicine stock
-        new_medicine.stock_quantity -= form.quantity.data
-        
+        new_medicine = form.medicine_id.get_object()
+
+        def update_sale():
+            current = db.session.get(Sale, id)
+            # Take the old version out of the rollups before changing it
+            apply_sale(id, sign=-1)
+            # Put the original quantity back, then take the new one out
+            increment_stock(current.medicine_id, current.quantity, sale_id=id)
+            decrement_stock(new_medicine.id, form.quantity.data, sale_id=id)
+
+            current.customer_id = form.customer_id.data
+            current.employee_id = form.employee_id.data
+            current.medicine_id = new_medicine.id
+            current.quantity = form.quantity.data
+            current.sale_date = form.sale_date.data
+            current.unit_price = new_medicine.price
+            current.total_amount = new_medicine.price * form.quantity.data
+            db.session.flush()
+            apply_sale(id)
+
         try:
-            db.session.commit()
+            run_with_lock_retry(update_sale)
             flash('Sale updated successfully!', 'success')
             return redirect(url_for('main.sales'))
+        except InsufficientStock as e:
+            flash(str(e), 'danger')
         except Exception as e:
-            db.session.rollback()
             flash('An error occurred while updating the sale.', 'danger')
     
     return render_template('sale_form.html', form=form, title='Edit Sale')
@@ -470,18 +549,19 @@ def edit_sale(id):
 @main.route('/sales/<int:id>/delete', methods=['POST'])
 @login_required
 def delete_sale(id):
-    sale = Sale.query.get_or_404(id)
-    
-    # Restore stock quantity
-    medicine = Medicine.query.get(sale.medicine_id)
-    medicine.stock_quantity += sale.quantity
+    Sale.query.get_or_404(id)
+
+    def remove_sale():
+        sale = db.session.get(Sale, id)
+        # Restore stock for every line in one UPDATE
+        increment_stock_many(sale_quantities(sale), sale_id=id)
+        apply_sale(id, sign=-1)
+        db.session.delete(sale)
     
     try:
-        db.session.delete(sale)
-        db.session.commit()
+        run_with_lock_retry(remove_sale)
         flash('Sale deleted successfully!', 'success')
     except Exception as e:
-        db.session.rollback()
         flash('An error occurred while deleting the sale.', 'danger')
     
     return redirect(url_for('main.sales'))
@@ -489,7 +569,11 @@ def delete_sale(id):
 @main.route('/sales/<int:id>/view')
 @login_required
 def view_sale(id):
-    sale = Sale.query.get_or_404(id)
-    return render_template('sale_view.html', sale=sale)
+    sale = Sale.query.options(
+        selectinload(Sale.items).joinedload(SaleItem.medicine)
+    ).get_or_404(id)
+    return render_conditional(rows_version([sale, sale.customer, sale.medicine, *sale.items,
+                                            *(item.medicine for item in sale.items)]),
+                              'sale_view.html', sale=sale)
 
 # Your other routes... 
\ No newline at end of file
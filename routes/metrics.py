@@ -0,0 +1,14 @@
+import hmac
+from flask import Blueprint, Response, abort, current_app, request
+from metrics import CONTENT_TYPE, exposition
+
+metrics = Blueprint('metrics', __name__)
+
+@metrics.route('/metrics')
+def export():
+    if not current_app.config['METRICS']:
+        abort(404)
+    token = current_app.config['METRICS_TOKEN']
+    if token and not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        abort(401)
+    return Response(exposition(), mimetype=CONTENT_TYPE)
@@ -0,0 +1,72 @@
+from datetime import date, timedelta
+from flask import Blueprint, Response, abort, render_template, request, stream_with_context
+from flask_login import login_required
+from rollups import PERIODS, DIMENSIONS, revenue_trend, top_sellers
+from exports import EXPORTS, EXPORT_FORMATS, export_stream, export_filename
+
+reports = Blueprint('reports', __name__, url_prefix='/reports')
+
+TOP_LIMIT_MAX = 50
+
+EXPORT_MIMETYPES = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+}
+
+def _default_start(end, period):
+    if period == 'day':
+        return end - timedelta(days=29)
+    if period == 'month':
+        year, month = divmod(end.year * 12 + end.month - 1 - 11, 12)
+        return date(year, month + 1, 1)
+    return date(end.year - 4, 1, 1)
+
+@reports.route('/')
+@login_required
+def index():
+    period = request.args.get('period', 'day')
+    if period not in PERIODS:
+        period = 'day'
+    dimension = request.args.get('by', 'medicine')
+    if dimension not in DIMENSIONS:
+        dimension = 'medicine'
+    limit = min(max(request.args.get('limit', 10, type=int), 1), TOP_LIMIT_MAX)
+
+    end = request.args.get('end', type=date.fromisoformat) or date.today()
+    start = request.args.get('start', type=date.fromisoformat) or _default_start(end, period)
+    if start > end:
+        start, end = end, start
+
+    trend = revenue_trend(start, end, period)
+    top = top_sellers(dimension, start, end, limit)
+    return render_template('reports.html',
+                           trend=trend,
+                           top=top,
+                           period=period,
+                           dimension=dimension,
+                           limit=limit,
+                           start=start,
+                           end=end,
+                           periods=PERIODS,
+                           dimensions=list(DIMENSIONS),
+                           total_revenue=sum(row.revenue or 0 for row in trend),
+                           peak_revenue=max((row.revenue or 0 for row in trend), default=0))
+
+@reports.route('/export/<dataset>')
+@login_required
+def export(dataset):
+    if dataset not in EXPORTS:
+        abort(404)
+    fmt = request.args.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        fmt = 'csv'
+    gzip = request.args.get('gzip', type=int) == 1
+    start = request.args.get('start', type=date.fromisoformat)
+    end = request.args.get('end', type=date.fromisoformat)
+
+    # Rows are fetched and written one batch at a time while the response streams
+    body = stream_with_context(export_stream(dataset, fmt, start, end, gzip))
+    filename = export_filename(dataset, fmt, start, end, gzip)
+    return Response(body,
+                    mimetype='application/gzip' if gzip else EXPORT_MIMETYPES[fmt],
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
@@ -0,0 +1,82 @@
+from collections import Counter
+from datetime import date, datetime
+from sqlalchemy import case, func, literal
+from extensions import db
+from models import Medicine, Sale, SaleItem
+from inventory import decrement_stock_many
+from rollups import apply_sale
+
+CHECKOUT_MAX_LINES = 100
+
+def basket_quantities(lines):
+    """Merge (medicine_id, quantity) pairs into ``{medicine_id: total quantity}``"""
+    quantities = Counter()
+    for medicine_id, quantity in lines:
+        if quantity <= 0:
+            raise ValueError("Quantity must be positive")
+        quantities[medicine_id] += quantity
+    return dict(quantities)
+
+def sale_quantities(sale):
+    """Units each medicine lost to ``sale``, for single-medicine and itemised sales alike"""
+    if not sale.is_itemised:
+        return {sale.medicine_id: sale.quantity}
+    return basket_quantities((item.medicine_id, item.quantity) for item in sale.items)
+
+def refresh_sale_total(sale_id):
+    """Recompute an itemised sale's total from its lines in SQL"""
+    items = SaleItem.__table__
+    total = db.select(func.coalesce(func.sum(items.c.quantity * items.c.price), 0)) \
+        .where(items.c.sale_id == sale_id) \
+        .scalar_subquery()
+    table = Sale.__table__
+    db.session.execute(
+        table.update()
+        .where(table.c.id == sale_id)
+        .values(total_amount=total, updated_at=datetime.utcnow())
+    )
+
+def create_itemised_sale(customer_id, employee_id, lines, sale_date=None):
+    """Record a basket as one Sale with a SaleItem per medicine.
+
+    Meant to run inside run_with_lock_retry. The statement count does not
+    depend on the basket size: the sale INSERT, one stock UPDATE and one
+    ledger INSERT covering all lines, one INSERT ... SELECT that prices the
+    lines from the medicine table, one UPDATE for the total, and the
+    rollup updates in rollups.apply_sale.
+    """
+    quantities = basket_quantities(lines)
+    if not quantities:
+        raise ValueError("A sale needs at least one item.")
+    if len(quantities) > CHECKOUT_MAX_LINES:
+        raise ValueError(f"A sale can have at most {CHECKOUT_MAX_LINES} items.")
+
+    sale = Sale(
+        customer_id=customer_id,
+        employee_id=employee_id,
+        quantity=sum(quantities.values()),
+        total_amount=0,
+        sale_date=sale_date or date.today()
+    )
+    db.session.add(sale)
+    db.session.flush()
+
+    decrement_stock_many(quantities, sale_id=sale.id)
+
+    medicine = Medicine.__table__
+    db.session.execute(
+        SaleItem.__table__.insert().from_select(
+            ['sale_id', 'medicine_id', 'quantity', 'price', 'created_at'],
+            db.select(
+                literal(sale.id),
+                medicine.c.id,
+                case(quantities, value=medicine.c.id),
+                medicine.c.price,
+                literal(datetime.utcnow())
+            ).where(medicine.c.id.in_(list(quantities)))
+        )
+    )
+    refresh_sale_total(sale.id)
+    apply_sale(sale.id)
+    db.session.expire(sale, ['total_amount', 'updated_at', 'items'])
+    return sale
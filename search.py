@@ -0,0 +1,174 @@
+import re
+from time import monotonic
+import click
+from flask.cli import AppGroup
+from sqlalchemy import DDL, Float, Integer, bindparam, event, inspect, text
+from sqlalchemy.orm import with_expression
+from extensions import db
+from models import Medicine
+
+FTS_TABLE = 'medicine_fts'
+FTS_COLUMNS = ('name', 'manufacturer', 'category', 'description')
+
+# bm25 column weights, in FTS_COLUMNS order
+FTS_WEIGHTS = (10.0, 5.0, 3.0, 1.0)
+
+FTS_DDL = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+    f"USING fts5({', '.join(FTS_COLUMNS)}, tokenize='unicode61 remove_diacritics 2')"
+)
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# Seconds a worker trusts "no index" before looking again, so an index
+# built by `flask search rebuild` in another process is picked up
+FTS_RECHECK_INTERVAL = 60
+
+# Database URL -> (index exists, monotonic time of the check)
+_fts_ready = {}
+
+search_cli = AppGroup('search', help='Medicine full-text search index.')
+
+def fts5_supported(connection):
+    if connection.dialect.name != 'sqlite':
+        return False
+    try:
+        connection.exec_driver_sql("CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(x)")
+        connection.exec_driver_sql("DROP TABLE temp.fts5_probe")
+        return True
+    except Exception:
+        return False
+
+def fts_enabled(connection):
+    """True when the medicine_fts table exists on this database.
+
+    Answers are remembered per database, a negative one for
+    FTS_RECHECK_INTERVAL seconds, so writes on a database without the
+    index do not each pay a sqlite_master lookup. create_fts_table
+    forgets the answer in the process that builds the index.
+    """
+    if connection.dialect.name != 'sqlite':
+        return False
+    key = str(connection.engine.url)
+    cached = _fts_ready.get(key)
+    if cached is not None and (cached[0] or monotonic() - cached[1] < FTS_RECHECK_INTERVAL):
+        return cached[0]
+    exists = connection.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+        {'name': FTS_TABLE}
+    ).scalar() is not None
+    _fts_ready[key] = (exists, monotonic())
+    return exists
+
+def create_fts_table(connection):
+    connection.exec_driver_sql(FTS_DDL)
+    _fts_ready.pop(str(connection.engine.url), None)
+
+def rebuild_fts_index(connection):
+    """Drop and repopulate the index from the medicine table. Returns row count."""
+    connection.exec_driver_sql(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+    create_fts_table(connection)
+    connection.exec_driver_sql(
+        f"INSERT INTO {FTS_TABLE}(rowid, {', '.join(FTS_COLUMNS)}) "
+        f"SELECT id, name, manufacturer, category, coalesce(description, '') FROM medicine"
+    )
+    return connection.execute(text(f"SELECT count(*) FROM {FTS_TABLE}")).scalar()
+
+def reindex_medicines(connection, ids):
+    """Refresh the index rows of many medicines at once, for bulk writes that bypass the ORM"""
+    if not ids or not fts_enabled(connection):
+        return
+    connection.execute(text(f"DELETE FROM {FTS_TABLE} WHERE rowid IN :ids")
+                       .bindparams(bindparam('ids', expanding=True)), {'ids': list(ids)})
+    connection.execute(
+        text(f"INSERT INTO {FTS_TABLE}(rowid, {', '.join(FTS_COLUMNS)}) "
+             f"SELECT id, name, manufacturer, category, coalesce(description, '') "
+             f"FROM medicine WHERE id IN :ids")
+        .bindparams(bindparam('ids', expanding=True)),
+        {'ids': list(ids)}
+    )
+
+def _index_medicine(connection, target):
+    connection.execute(
+        text(f"INSERT INTO {FTS_TABLE}(rowid, {', '.join(FTS_COLUMNS)}) "
+             f"VALUES (:id, :name, :manufacturer, :category, :description)"),
+        {
+            'id': target.id,
+            'name': target.name,
+            'manufacturer': target.manufacturer,
+            'category': target.category,
+            'description': target.description or '',
+        }
+    )
+
+def _unindex_medicine(connection, medicine_id):
+    connection.execute(text(f"DELETE FROM {FTS_TABLE} WHERE rowid = :id"), {'id': medicine_id})
+
+@event.listens_for(Medicine, 'after_insert')
+def index_new_medicine(mapper, connection, target):
+    if fts_enabled(connection):
+        _index_medicine(connection, target)
+
+@event.listens_for(Medicine, 'after_update')
+def reindex_medicine(mapper, connection, target):
+    state = inspect(target)
+    if not any(state.attrs[column].history.has_changes() for column in FTS_COLUMNS):
+        return
+    if fts_enabled(connection):
+        _unindex_medicine(connection, target.id)
+        _index_medicine(connection, target)
+
+@event.listens_for(Medicine, 'after_delete')
+def unindex_medicine(mapper, connection, target):
+    if fts_enabled(connection):
+        _unindex_medicine(connection, target.id)
+
+def _create_on_new_database(ddl, target, bind, **kw):
+    return fts5_supported(bind)
+
+# Fresh databases get the index alongside the medicine table from create_all()
+event.listen(
+    Medicine.__table__,
+    'after_create',
+    DDL(FTS_DDL).execute_if(callable_=_create_on_new_database)
+)
+
+def fts_match_expression(search):
+    """Turn free text into an FTS5 query matching every word as a prefix."""
+    tokens = _TOKEN_RE.findall(search)
+    if not tokens:
+        return None
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+def medicine_search_query(search, category=''):
+    """bm25-ranked medicine query and its keyset sort keys.
+
+    Returns None when the database has no FTS5 index or the search text has
+    no indexable words, in which case callers use the ilike query instead.
+    """
+    match = fts_match_expression(search)
+    if match is None or not fts_enabled(db.session.connection()):
+        return None
+
+    weights = ', '.join(str(w) for w in FTS_WEIGHTS)
+    ranked = text(
+        f"SELECT rowid AS medicine_id, bm25({FTS_TABLE}, {weights}) AS search_rank "
+        f"FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :match"
+    ).bindparams(match=match).columns(medicine_id=Integer, search_rank=Float).subquery('ranked')
+
+    query = Medicine.query \
+        .join(ranked, ranked.c.medicine_id == Medicine.id) \
+        .options(with_expression(Medicine.search_rank, ranked.c.search_rank))
+    if category:
+        query = query.filter(Medicine.category == category)
+    keys = ((ranked.c.search_rank, False), (Medicine.id, False))
+    return query.order_by(ranked.c.search_rank, Medicine.id), keys
+
+@search_cli.command('rebuild')
+def rebuild_command():
+    """Rebuild the medicine full-text index from the medicine table."""
+    with db.engine.begin() as connection:
+        if not fts5_supported(connection):
+            raise click.ClickException('This database does not support FTS5.')
+        count = rebuild_fts_index(connection)
+    click.echo(f'Indexed {count} medicines.')
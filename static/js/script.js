@@ -21,6 +21,12 @@ document.addEventListener('DOMContentLoaded', function() {
     
     // Setup date inputs
     setupDateInputs();
+    
+    // Setup typeahead lookups
+    setupLookupInputs();
+    
+    // Setup checkout cart
+    setupCheckoutCart();
 });
 
 function initializeBootstrapComponents() {
@@ -163,10 +169,10 @@ function setupMedicineSearch() {
             debounceTimeout = setTimeout(function() {
                 var searchTerm = searchInput.value;
                 if (searchTerm.length >= 2) {
-                    fetch(`/api/medicines/search?term=${encodeURIComponent(searchTerm)}`)
+                    fetch(`/api/medicines/search?q=${encodeURIComponent(searchTerm)}`)
                         .then(response => response.json())
                         .then(data => {
-                            updateSearchSuggestions(data);
+                            updateSearchSuggestions(data.results);
                         })
                         .catch(error => console.error('Error:', error));
                 }
@@ -186,6 +192,108 @@ function setupDateInputs() {
     });
 }
 
+function setupLookupInputs() {
+    // Search box + hidden id pairs rendered by forms.LookupField
+    var lookupInputs = document.querySelectorAll('input[data-lookup-url]');
+    lookupInputs.forEach(function(input) {
+        var hidden = document.getElementById(input.dataset.lookupTarget);
+        var container = document.createElement('div');
+        container.className = 'search-suggestions d-none';
+        input.parentNode.appendChild(container);
+
+        var debounceTimeout;
+        var requestId = 0;
+
+        function fetchResults(cursor) {
+            var url = new URL(input.dataset.lookupUrl, window.location.origin);
+            url.searchParams.set('q', input.value.trim());
+            if (cursor) {
+                url.searchParams.set('cursor', cursor);
+            }
+            var currentRequest = ++requestId;
+            fetch(url, { headers: { 'Accept': 'application/json' } })
+                .then(response => response.json())
+                .then(data => {
+                    // Ignore responses that arrive after a newer keystroke
+                    if (currentRequest === requestId) {
+                        renderLookupResults(container, data, !cursor, selectResult, fetchResults);
+                    }
+                })
+                .catch(error => console.error('Error:', error));
+        }
+
+        function selectResult(item) {
+            hidden.value = item.id;
+            input.value = item.text;
+            container.classList.add('d-none');
+            hidden.dispatchEvent(new Event('change'));
+        }
+
+        input.addEventListener('input', function() {
+            hidden.value = '';
+            clearTimeout(debounceTimeout);
+            debounceTimeout = setTimeout(function() {
+                fetchResults(null);
+            }, 250);
+        });
+        input.addEventListener('focus', function() {
+            if (!hidden.value) {
+                fetchResults(null);
+            }
+        });
+        document.addEventListener('click', function(e) {
+            if (e.target !== input && !container.contains(e.target)) {
+                container.classList.add('d-none');
+            }
+        });
+    });
+}
+
+function renderLookupResults(container, data, replace, onSelect, onMore) {
+    if (replace) {
+        container.innerHTML = '';
+    }
+    var moreLink = container.querySelector('.lookup-more');
+    if (moreLink) {
+        moreLink.remove();
+    }
+
+    data.results.forEach(function(item) {
+        var div = document.createElement('div');
+        div.className = 'suggestion-item';
+        div.textContent = item.text;
+        if (item.stock !== undefined) {
+            var badge = document.createElement('span');
+            badge.className = 'badge float-end ' + (item.stock > 0 ? 'bg-secondary' : 'bg-danger');
+            badge.textContent = 'Stock: ' + item.stock;
+            div.appendChild(badge);
+        }
+        div.addEventListener('click', function() {
+            onSelect(item);
+        });
+        container.appendChild(div);
+    });
+
+    if (data.next) {
+        var more = document.createElement('div');
+        more.className = 'suggestion-item lookup-more text-primary';
+        more.textContent = 'Load more...';
+        more.addEventListener('click', function(e) {
+            e.stopPropagation();
+            onMore(data.next);
+        });
+        container.appendChild(more);
+    }
+
+    if (!container.children.length) {
+        var empty = document.createElement('div');
+        empty.className = 'suggestion-item text-muted';
+        empty.textContent = 'No matches';
+        container.appendChild(empty);
+    }
+    container.classList.remove('d-none');
+}
+
 // Utility function to format currency
 function formatCurrency(amount) {
     return new Intl.NumberFormat('en-US', {
@@ -245,12 +353,85 @@ function updateSearchSuggestions(data) {
         data.forEach(function(item) {
             var div = document.createElement('div');
             div.className = 'suggestion-item';
-            div.textContent = item.name;
+            div.textContent = item.text;
             div.addEventListener('click', function() {
-                document.querySelector('.search-medicine').value = item.name;
+                document.querySelector('.search-medicine').value = item.text;
                 suggestionContainer.innerHTML = '';
             });
             suggestionContainer.appendChild(div);
         });
     }
-}
\ No newline at end of file
+}
+
+function setupCheckoutCart() {
+    // Rows in the checkout form post as lines-N-medicine_id / lines-N-quantity
+    var form = document.getElementById('checkout-form');
+    if (!form) {
+        return;
+    }
+    var pick = document.getElementById('cart_pick');
+    var pickInput = document.getElementById('cart_pick_lookup');
+    var tbody = document.getElementById('cart-lines');
+
+    function renumber() {
+        tbody.querySelectorAll('tr.cart-line').forEach(function(row, index) {
+            row.querySelectorAll('input[data-field]').forEach(function(input) {
+                input.name = 'lines-' + index + '-' + input.dataset.field;
+            });
+        });
+    }
+
+    function addLine(medicineId, text) {
+        var existing = tbody.querySelector('input[data-field="medicine_id"][value="' + medicineId + '"]');
+        if (existing) {
+            var quantity = existing.closest('tr').querySelector('input[data-field="quantity"]');
+            quantity.value = parseInt(quantity.value || '0', 10) + 1;
+            return;
+        }
+        var row = document.createElement('tr');
+        row.className = 'cart-line';
+
+        var nameCell = document.createElement('td');
+        var idInput = document.createElement('input');
+        idInput.type = 'hidden';
+        idInput.dataset.field = 'medicine_id';
+        idInput.value = medicineId;
+        idInput.setAttribute('value', medicineId);
+        nameCell.appendChild(idInput);
+        nameCell.appendChild(document.createTextNode(text));
+
+        var quantityCell = document.createElement('td');
+        var quantityInput = document.createElement('input');
+        quantityInput.type = 'number';
+        quantityInput.min = '1';
+        quantityInput.value = '1';
+        quantityInput.className = 'form-control form-control-sm';
+        quantityInput.dataset.field = 'quantity';
+        quantityCell.appendChild(quantityInput);
+
+        var removeCell = document.createElement('td');
+        removeCell.innerHTML = '<button type="button" class="btn btn-sm btn-outline-danger cart-remove"><i class="fas fa-times"></i></button>';
+
+        row.appendChild(nameCell);
+        row.appendChild(quantityCell);
+        row.appendChild(removeCell);
+        tbody.appendChild(row);
+        renumber();
+    }
+
+    pick.addEventListener('change', function() {
+        if (pick.value) {
+            addLine(pick.value, pickInput.value);
+            pick.value = '';
+            pickInput.value = '';
+        }
+    });
+    tbody.addEventListener('click', function(e) {
+        var button = e.target.closest('.cart-remove');
+        if (button) {
+            button.closest('tr').remove();
+            renumber();
+        }
+    });
+    form.addEventListener('submit', renumber);
+}
@@ -0,0 +1,52 @@
+import os
+from jinja2 import FileSystemBytecodeCache
+from catalog import namespace_version
+from http_cache import templates_version
+
+def row_key(row):
+    """'<id>:<last change>' of a row for a fragment key, '' for None.
+
+    Rows without updated_at (sale lines never change) use created_at,
+    as in http_cache.rows_version.
+    """
+    if row is None:
+        return ''
+    return f'{row.id}:{getattr(row, "updated_at", None) or row.created_at}'
+
+def fragment(name):
+    """Fragment name tied to the current templates, so a deploy never serves old markup"""
+    return f'{name}:{templates_version()}'
+
+def install_template_cache(app):
+    """Compiled templates persist in TEMPLATE_BYTECODE_DIR when it exists.
+
+    Jinja keys each entry on the template's source checksum, so an edited
+    template is compiled again and stale entries are never used. Fragments
+    are cached with Flask-Caching's ``{% cache timeout, name, *vary_on %}``
+    tag, named with ``fragment()``. Its vary_on values must be strings:
+    ``row_key`` gives one for a row and ``catalog_version`` one for a
+    catalog namespace.
+    """
+    app.add_template_filter(row_key)
+    app.add_template_global(fragment)
+    app.add_template_global(namespace_version, 'catalog_version')
+    app.jinja_env.bytecode_cache = bytecode_cache(app)
+    return app.jinja_env.bytecode_cache is not None
+
+def bytecode_cache(app):
+    """FileSystemBytecodeCache over TEMPLATE_BYTECODE_DIR, or None if it does not exist"""
+    directory = app.config['TEMPLATE_BYTECODE_DIR']
+    if not directory or not os.path.isdir(directory):
+        return None
+    return FileSystemBytecodeCache(directory)
+
+def precompile_templates(app):
+    """Load every template into the environment, so no request pays for compiling one.
+
+    Under gunicorn --preload this runs once in the master and the workers
+    inherit the compiled templates. Returns the number of templates.
+    """
+    names = app.jinja_env.list_templates(extensions=['html'])
+    for name in names:
+        app.jinja_env.get_template(name)
+    return len(names)
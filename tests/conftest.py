@@ -0,0 +1,65 @@
+import itertools
+import os
+import sys
+from datetime import date, timedelta
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from bootstrap import create_schema, seed_admin
+from config import Config
+from datagen import generate
+from extensions import db
+from models import Employee, Medicine
+
+@pytest.fixture(scope='session')
+def app(tmp_path_factory):
+    class TestConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path_factory.mktemp('db') / 'test.db'}"
+        TESTING = True
+        DEBUG = False
+        WTF_CSRF_ENABLED = False
+        SESSION_COOKIE_SECURE = False
+        CACHE_TYPE = 'SimpleCache'
+        COMPRESSION = False
+        TEMPLATE_BYTECODE_DIR = None
+    app = create_app(TestConfig)
+    with app.app_context():
+        create_schema()
+        seed_admin('admin', 'admin@example.com', 'admin123')
+        # Enough rows to fill more than a page of every list
+        generate(500)
+        db.session.add_all(Employee(name=f'Test Employee {i}', email=f'test{i}@example.com',
+                                    phone='1234567890', position='Pharmacist', hire_date=date(2020, 1, 1))
+                           for i in range(20))
+        db.session.commit()
+        db.session.remove()
+    return app
+
+@pytest.fixture
+def client(app):
+    client = app.test_client()
+    response = client.post('/auth/login', data={'username': 'admin', 'password': 'admin123'})
+    assert response.status_code == 302, 'login failed'
+    return client
+
+@pytest.fixture
+def app_context(app):
+    with app.app_context():
+        yield
+        db.session.remove()
+
+_medicine_numbers = itertools.count(1)
+
+@pytest.fixture
+def make_medicine(app_context):
+    """Factory for committed medicines that no other test touches"""
+    def make(stock_quantity=10, price=2.5, category='Test', reorder_level=5):
+        medicine = Medicine(name=f'Test Medicine {next(_medicine_numbers)}', manufacturer='Test Labs',
+                            category=category, price=price, stock_quantity=stock_quantity,
+                            reorder_level=reorder_level, expiry_date=date.today() + timedelta(days=365))
+        db.session.add(medicine)
+        db.session.commit()
+        return medicine
+    return make
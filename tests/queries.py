@@ -0,0 +1,68 @@
+from contextlib import contextmanager
+from flask import url_for
+from sqlalchemy import event
+from accounts import forget_users
+from extensions import cache, db
+from search import _fts_ready
+
+class QueryCounter:
+    def __init__(self):
+        self.statements = []
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def __repr__(self):
+        return f"<QueryCounter {self.count} statements>"
+
+@contextmanager
+def count_queries(engine=None):
+    """Record every SQL statement executed on the engine inside the block."""
+    engine = engine or db.engine
+    counter = QueryCounter()
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        counter.statements.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        yield counter
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+
+@contextmanager
+def assert_max_queries(limit, engine=None):
+    with count_queries(engine) as counter:
+        yield counter
+    if counter.count > limit:
+        listing = '\n'.join(counter.statements)
+        raise AssertionError(f"Expected at most {limit} queries, got {counter.count}:\n{listing}")
+
+def assert_list_route_queries(client, endpoint, limit, cold=False, **params):
+    """Request a list route with a logged-in test client and check its query budget.
+
+    By default a first request fills the count and fragment caches and is
+    not counted. With ``cold`` the Flask-Caching backend and the search
+    index check are cleared instead, as in a worker that just started, and
+    the first request is counted. Either way the logged-in user is dropped
+    from the per-worker user cache, as when USER_CACHE_TTL runs out, so the
+    budget includes the user lookup. The budget is independent of page
+    size, so callers should seed enough rows to fill a page before calling
+    this.
+    """
+    # Requests run outside this app context, so they do not share its g
+    with client.application.test_request_context():
+        url = url_for(endpoint, **params)
+        engine = db.engine
+        if cold:
+            cache.clear()
+            _fts_ready.clear()
+    if not cold:
+        client.get(url)
+    with client.session_transaction() as session:
+        forget_users(int(session['_user_id']))
+    with assert_max_queries(limit, engine) as counter:
+        response = client.get(url)
+    assert response.status_code == 200, f"{url} returned {response.status_code}"
+    return counter
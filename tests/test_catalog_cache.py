@@ -0,0 +1,44 @@
+from catalog import STOCK_NAMESPACE, namespace_version
+from extensions import db
+from inventory import decrement_stock, run_with_lock_retry
+
+def versions():
+    return namespace_version('medicine'), namespace_version(STOCK_NAMESPACE)
+
+def test_sale_bumps_only_the_stock_version(make_medicine):
+    medicine = make_medicine(10)
+    medicine_version, stock_version = versions()
+
+    run_with_lock_retry(lambda: decrement_stock(medicine.id, 1))
+
+    assert versions() == (medicine_version, str(int(stock_version) + 1))
+
+def test_stock_edit_through_the_orm_bumps_only_the_stock_version(make_medicine):
+    medicine = make_medicine(10)
+    medicine_version, stock_version = versions()
+
+    medicine.stock_quantity = 3
+    db.session.commit()
+
+    assert versions() == (medicine_version, str(int(stock_version) + 1))
+
+def test_catalog_edit_bumps_the_medicine_version(make_medicine):
+    medicine = make_medicine(10)
+    medicine_version, stock_version = versions()
+
+    medicine.category = 'Recategorised'
+    db.session.commit()
+
+    assert versions() == (str(int(medicine_version) + 1), stock_version)
+
+def test_medicine_lookup_follows_stock(app, client, make_medicine):
+    medicine = make_medicine(10)
+    medicine_id, name = medicine.id, medicine.name
+
+    def lookup_stock():
+        results = client.get('/api/medicines/search', query_string={'q': name}).get_json()['results']
+        return [result['stock'] for result in results if result['id'] == medicine_id]
+
+    assert lookup_stock() == [10]
+    run_with_lock_retry(lambda: decrement_stock(medicine_id, 4))
+    assert lookup_stock() == [6]
@@ -0,0 +1,87 @@
+from datetime import date
+import pytest
+from extensions import db
+from inventory import InsufficientStock, run_with_lock_retry
+from models import Customer, Employee, Medicine, Sale, SaleItem, StockMovement
+from sales import CHECKOUT_MAX_LINES, create_itemised_sale
+
+@pytest.fixture
+def buyer(app_context):
+    return db.session.query(Customer.id).first()[0], db.session.query(Employee.id).first()[0]
+
+def checkout(buyer, lines):
+    return run_with_lock_retry(lambda: create_itemised_sale(*buyer, lines)).id
+
+def stock_of(medicine):
+    db.session.expire_all()
+    return db.session.get(Medicine, medicine.id).stock_quantity
+
+def test_lines_priced_from_the_catalog(make_medicine, buyer):
+    first, second = make_medicine(10, price=2.5), make_medicine(10, price=4.0)
+    sale_id = checkout(buyer, [(first.id, 2), (second.id, 3)])
+
+    sale = db.session.get(Sale, sale_id)
+    assert sale.is_itemised and sale.quantity == 5
+    assert sale.total_amount == pytest.approx(2 * 2.5 + 3 * 4.0)
+    assert sorted((item.medicine_id, item.quantity, float(item.price)) for item in sale.items) == \
+        [(first.id, 2, 2.5), (second.id, 3, 4.0)]
+    assert [stock_of(first), stock_of(second)] == [8, 7]
+
+def test_short_line_rolls_back_the_whole_sale(make_medicine, buyer):
+    plenty, short = make_medicine(10), make_medicine(1)
+    sales = db.session.query(Sale).count()
+    with pytest.raises(InsufficientStock) as error:
+        checkout(buyer, [(plenty.id, 2), (short.id, 2)])
+    assert error.value.medicine_id == short.id
+    assert db.session.query(Sale).count() == sales
+    assert [stock_of(plenty), stock_of(short)] == [10, 1]
+    assert db.session.query(StockMovement).filter(
+        StockMovement.medicine_id.in_([plenty.id, short.id]), StockMovement.kind == 'sale').count() == 0
+
+def test_duplicate_lines_are_merged(make_medicine, buyer):
+    medicine = make_medicine(10, price=3.0)
+    sale_id = checkout(buyer, [(medicine.id, 2), (medicine.id, 3)])
+
+    items = db.session.query(SaleItem).filter(SaleItem.sale_id == sale_id).all()
+    assert [(item.medicine_id, item.quantity) for item in items] == [(medicine.id, 5)]
+    assert db.session.get(Sale, sale_id).total_amount == pytest.approx(15.0)
+    assert stock_of(medicine) == 5
+
+def test_duplicate_lines_checked_against_their_total(make_medicine, buyer):
+    # Each line fits on its own, together they do not
+    medicine = make_medicine(4)
+    with pytest.raises(InsufficientStock):
+        checkout(buyer, [(medicine.id, 3), (medicine.id, 2)])
+    assert stock_of(medicine) == 4
+
+def test_line_cap(app_context, buyer):
+    # Counted before any stock is looked at, so the ids need not exist
+    sales = db.session.query(Sale).count()
+    with pytest.raises(ValueError, match=str(CHECKOUT_MAX_LINES)):
+        checkout(buyer, [(medicine_id, 1) for medicine_id in range(1, CHECKOUT_MAX_LINES + 2)])
+    assert db.session.query(Sale).count() == sales
+
+def test_ledger_rows_written(make_medicine, buyer):
+    first, second = make_medicine(10), make_medicine(10)
+    sale_id = checkout(buyer, [(first.id, 1), (second.id, 4)])
+
+    movements = db.session.query(StockMovement.medicine_id, StockMovement.kind, StockMovement.quantity) \
+        .filter(StockMovement.sale_id == sale_id).order_by(StockMovement.medicine_id).all()
+    assert movements == [(first.id, 'sale', -1), (second.id, 'sale', -4)]
+
+def test_checkout_route_reports_the_short_line(client, make_medicine, buyer):
+    plenty, short = make_medicine(10), make_medicine(0)
+    sales = db.session.query(Sale).count()
+    response = client.post('/sales/checkout', data={
+        'customer_id': buyer[0],
+        'employee_id': buyer[1],
+        'sale_date': date.today().isoformat(),
+        'lines-0-medicine_id': plenty.id,
+        'lines-0-quantity': 1,
+        'lines-1-medicine_id': short.id,
+        'lines-1-quantity': 1,
+    })
+    assert response.status_code == 200
+    assert b'Not enough stock. Only 0 units available.' in response.data
+    assert db.session.query(Sale).count() == sales
+    assert stock_of(plenty) == 10
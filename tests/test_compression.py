@@ -0,0 +1,99 @@
+import gzip
+import pytest
+from werkzeug.test import Client
+from werkzeug.wrappers import Response
+from compression import CompressionMiddleware, brotli
+
+BODY = b'<tr><td>Paracetamol</td><td>Tablets</td></tr>\n' * 50
+
+def app_returning(body=BODY, content_type='text/html; charset=utf-8', status=200, etag=None,
+                  streamed=False, **headers):
+    def app(environ, start_response):
+        response = Response(iter([body[i:i + 100] for i in range(0, len(body), 100)]) if streamed else body,
+                            status=status, content_type=content_type, headers=headers)
+        if etag:
+            response.headers['ETag'] = etag
+        return response(environ, start_response)
+    return app
+
+def fetch(app, accept_encoding='gzip', min_size=500, **kwargs):
+    client = Client(CompressionMiddleware(app, min_size=min_size))
+    return client.get('/', headers={'Accept-Encoding': accept_encoding} if accept_encoding else {}, **kwargs)
+
+def test_gzip_output():
+    response = fetch(app_returning())
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.headers['Vary'] == 'Accept-Encoding'
+    assert int(response.headers['Content-Length']) == len(response.data) < len(BODY)
+    assert gzip.decompress(response.data) == BODY
+
+def test_streamed_output_is_compressed_as_it_goes():
+    response = fetch(app_returning(streamed=True))
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Content-Length' not in response.headers
+    assert gzip.decompress(response.data) == BODY
+
+def test_body_below_min_size_is_sent_as_is():
+    small = BODY[:400]
+    for streamed in (False, True):
+        response = fetch(app_returning(small, streamed=streamed))
+        assert 'Content-Encoding' not in response.headers
+        assert response.headers['Content-Length'] == str(len(small))
+        assert response.data == small
+
+def test_min_size_is_configurable():
+    response = fetch(app_returning(BODY[:400]), min_size=100)
+    assert gzip.decompress(response.data) == BODY[:400]
+
+def test_strong_etag_becomes_weak():
+    response = fetch(app_returning(etag='"abc"'))
+    assert response.headers['ETag'] == 'W/"abc"'
+
+def test_weak_etag_kept():
+    response = fetch(app_returning(etag='W/"abc"'))
+    assert response.headers['ETag'] == 'W/"abc"'
+
+def test_uncompressed_response_keeps_a_strong_etag():
+    response = fetch(app_returning(etag='"abc"'), accept_encoding=None)
+    assert response.headers['ETag'] == '"abc"'
+    assert response.headers['Vary'] == 'Accept-Encoding'
+    assert response.data == BODY
+
+@pytest.mark.parametrize('app, accept_encoding', [
+    (app_returning(content_type='image/png'), 'gzip'),
+    (app_returning(status=304), 'gzip'),
+    (app_returning(**{'Cache-Control': 'no-transform'}), 'gzip'),
+    (app_returning(), 'gzip;q=0, identity'),
+])
+def test_left_alone(app, accept_encoding):
+    response = fetch(app, accept_encoding)
+    assert 'Content-Encoding' not in response.headers
+
+@pytest.mark.skipif(brotli is None, reason='brotli is not installed')
+def test_brotli_preferred_when_available():
+    response = fetch(app_returning(), accept_encoding='gzip, br')
+    assert response.headers['Content-Encoding'] == 'br'
+    assert brotli.decompress(response.data) == BODY
+
+def app_writing(body=BODY, content_length=True):
+    # An old-style WSGI app that sends its body through write()
+    def app(environ, start_response):
+        headers = [('Content-Type', 'text/plain')]
+        if content_length:
+            headers.append(('Content-Length', str(len(body))))
+        write = start_response('200 OK', headers)
+        write(body[:len(body) // 2])
+        write(body[len(body) // 2:])
+        return [b'']
+    return app
+
+@pytest.mark.parametrize('content_length', [True, False])
+def test_body_sent_through_write(content_length):
+    response = fetch(app_writing(content_length=content_length))
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(response.data) == BODY
+
+def test_small_body_sent_through_write_passes_through():
+    response = fetch(app_writing(BODY[:100]))
+    assert 'Content-Encoding' not in response.headers
+    assert response.data == BODY[:100]
@@ -0,0 +1,58 @@
+import re
+from extensions import db
+from models import Medicine
+
+def get(client, url, etag=None):
+    headers = {'If-None-Match': etag} if etag else {}
+    return client.get(url, headers=headers)
+
+def test_unchanged_list_is_not_modified(client):
+    first = get(client, '/medicines')
+    assert first.status_code == 200
+    etag = first.headers['ETag']
+    assert etag.startswith('W/')
+    assert first.cache_control.private and first.cache_control.no_cache
+
+    again = get(client, '/medicines', etag)
+    assert again.status_code == 304
+    assert again.data == b''
+    assert again.headers['ETag'] == etag
+
+def test_change_to_a_listed_row_gives_a_new_etag(app, client):
+    first = get(client, '/medicines')
+    etag = first.headers['ETag']
+    medicine_id = int(re.search(r'/medicines/(\d+)/', first.get_data(as_text=True)).group(1))
+    with app.app_context():
+        medicine = db.session.get(Medicine, medicine_id)
+        medicine.price = round(medicine.price + 1, 2)
+        db.session.commit()
+        db.session.remove()
+
+    changed = get(client, '/medicines', etag)
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != etag
+
+def test_etag_depends_on_the_url(client):
+    etag = get(client, '/medicines').headers['ETag']
+    assert get(client, '/medicines?category=Test', etag).status_code == 200
+
+def test_pending_flashes_bypass_the_etag(client):
+    etag = get(client, '/medicines').headers['ETag']
+    with client.session_transaction() as session:
+        session['_flashes'] = [('success', 'Flashed once')]
+
+    shown = get(client, '/medicines', etag)
+    assert shown.status_code == 200
+    assert b'Flashed once' in shown.data
+    assert 'ETag' not in shown.headers
+    # Showing the message cleared it, so the page is cacheable again
+    assert get(client, '/medicines', etag).status_code == 304
+
+def test_static_urls_are_fingerprinted(client):
+    page = get(client, '/medicines').get_data(as_text=True)
+    url = re.search(r'/static/css/style\.css\?v=[0-9a-f]+', page).group(0)
+
+    current = client.get(url)
+    assert current.cache_control.immutable and current.cache_control.max_age == 31536000
+    stale = client.get('/static/css/style.css?v=000000000000')
+    assert not stale.cache_control.immutable
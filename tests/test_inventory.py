@@ -0,0 +1,119 @@
+import threading
+import pytest
+from sqlalchemy import func
+from sqlalchemy.exc import OperationalError
+from extensions import db
+from inventory import InsufficientStock, decrement_stock, decrement_stock_many, run_with_lock_retry
+from models import Medicine, StockMovement
+
+def stock_of(*medicines):
+    db.session.expire_all()
+    return [db.session.get(Medicine, medicine.id).stock_quantity for medicine in medicines]
+
+def movements_of(medicine):
+    return db.session.query(func.coalesce(func.sum(StockMovement.quantity), 0)) \
+        .filter(StockMovement.medicine_id == medicine.id, StockMovement.kind == 'sale').scalar()
+
+def test_decrement_takes_every_line(make_medicine):
+    first, second = make_medicine(10), make_medicine(4)
+    run_with_lock_retry(lambda: decrement_stock_many({first.id: 3, second.id: 4}))
+    assert stock_of(first, second) == [7, 0]
+    assert [movements_of(first), movements_of(second)] == [-3, -4]
+    assert db.session.get(Medicine, second.id).needs_reorder
+
+def test_oversell_is_rejected(make_medicine):
+    medicine = make_medicine(2)
+    with pytest.raises(InsufficientStock) as error:
+        run_with_lock_retry(lambda: decrement_stock(medicine.id, 3))
+    assert (error.value.medicine_id, error.value.requested, error.value.available) == (medicine.id, 3, 2)
+    assert stock_of(medicine) == [2]
+    assert movements_of(medicine) == 0
+
+def test_short_line_reported_and_basket_left_alone(make_medicine):
+    # The short line is neither first nor the one with the most stock
+    plenty, short, enough = make_medicine(50), make_medicine(1), make_medicine(3)
+    with pytest.raises(InsufficientStock) as error:
+        decrement_stock_many({plenty.id: 1, short.id: 2, enough.id: 3})
+    assert (error.value.medicine_id, error.value.available) == (short.id, 1)
+    # Nothing was written, even before the caller rolls back
+    assert stock_of(plenty, short, enough) == [50, 1, 3]
+    db.session.rollback()
+
+def test_line_left_with_less_than_it_took_is_not_reported(make_medicine):
+    # 5 - 3 = 2 is below the amount taken, which must not count as short
+    taken, short = make_medicine(5), make_medicine(0)
+    with pytest.raises(InsufficientStock) as error:
+        decrement_stock_many({taken.id: 3, short.id: 1})
+    assert error.value.medicine_id == short.id
+    db.session.rollback()
+
+def test_missing_medicine(make_medicine):
+    medicine = make_medicine(5)
+    with pytest.raises(InsufficientStock) as error:
+        decrement_stock_many({medicine.id: 1, 10 ** 9: 1})
+    assert (error.value.medicine_id, error.value.available) == (10 ** 9, None)
+    db.session.rollback()
+    assert stock_of(medicine) == [5]
+
+def test_concurrent_decrements_never_oversell(app, make_medicine):
+    medicine = make_medicine(20)
+    medicine_id = medicine.id
+    sold = []
+    rejected = []
+
+    def worker():
+        with app.app_context():
+            for _ in range(5):
+                try:
+                    run_with_lock_retry(lambda: decrement_stock(medicine_id, 1), base_delay=0.01)
+                    sold.append(1)
+                except InsufficientStock:
+                    rejected.append(1)
+            db.session.remove()
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert (len(sold), len(rejected)) == (20, 20)
+    assert stock_of(medicine) == [0]
+    assert movements_of(medicine) == -20
+
+def locked():
+    return OperationalError('UPDATE medicine ...', {}, Exception('database is locked'))
+
+def test_lock_retry_runs_the_operation_again(app_context):
+    calls = []
+
+    def operation():
+        calls.append(1)
+        if len(calls) < 3:
+            raise locked()
+        return 'done'
+
+    assert run_with_lock_retry(operation, base_delay=0) == 'done'
+    assert len(calls) == 3
+
+def test_lock_retry_gives_up_after_the_last_attempt(app_context):
+    calls = []
+
+    def operation():
+        calls.append(1)
+        raise locked()
+
+    with pytest.raises(OperationalError):
+        run_with_lock_retry(operation, attempts=4, base_delay=0)
+    assert len(calls) == 4
+
+def test_lock_retry_does_not_retry_other_errors(app_context):
+    calls = []
+
+    def operation():
+        calls.append(1)
+        raise OperationalError('SELECT ...', {}, Exception('no such table: medicine'))
+
+    with pytest.raises(OperationalError):
+        run_with_lock_retry(operation, base_delay=0)
+    assert len(calls) == 1
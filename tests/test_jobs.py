@@ -0,0 +1,120 @@
+from datetime import datetime, timedelta
+import pytest
+from extensions import db
+from jobs import JobError, claim_jobs, enqueue, job_type, requeue_stale, run_job
+from models import Job
+
+@job_type('test.echo', concurrency=5)
+def _echo(job):
+    return {'params': job.params, 'attempt': job.attempt}
+
+@job_type('test.flaky', max_attempts=3)
+def _flaky(job):
+    # Fails until the attempt named in its params
+    if job.attempt < job.params['succeed_on']:
+        raise RuntimeError(f'attempt {job.attempt} failed')
+    return {'attempt': job.attempt}
+
+@job_type('test.broken')
+def _broken(job):
+    raise JobError('cannot be retried')
+
+@pytest.fixture
+def queue(app_context):
+    Job.query.delete()
+    db.session.commit()
+
+def job(job_id):
+    db.session.expire_all()
+    return db.session.get(Job, job_id)
+
+def make_due(job_id):
+    Job.query.filter_by(id=job_id).update({'run_after': datetime.utcnow() - timedelta(seconds=1)})
+    db.session.commit()
+
+def test_idempotency_key_returns_the_first_job(queue):
+    first, created = enqueue('test.echo', {'n': 1}, idempotency_key='nightly-2099-01-01')
+    again, created_again = enqueue('test.echo', {'n': 2}, idempotency_key='nightly-2099-01-01')
+    other, created_other = enqueue('test.echo', {'n': 3}, idempotency_key='nightly-2099-01-02')
+
+    assert (created, created_again, created_other) == (True, False, True)
+    assert again.id == first.id and other.id != first.id
+    assert Job.query.count() == 2
+
+def test_idempotency_key_holds_after_the_job_finished(queue):
+    first, _ = enqueue('test.echo', idempotency_key='once')
+    assert claim_jobs(1, 'worker-1') == [first.id]
+    assert run_job(first.id) == 'succeeded'
+
+    again, created = enqueue('test.echo', idempotency_key='once')
+    assert (again.id, created, again.status) == (first.id, False, 'succeeded')
+
+def test_unknown_kind_is_refused(queue):
+    with pytest.raises(ValueError):
+        enqueue('test.missing')
+
+def test_claim_marks_jobs_running(queue):
+    ids = [enqueue('test.echo')[0].id for _ in range(3)]
+    claimed = claim_jobs(2, 'worker-1')
+
+    assert claimed == ids[:2]
+    assert [(job(i).status, job(i).worker, job(i).attempts) for i in claimed] == [('running', 'worker-1', 1)] * 2
+    # Claimed jobs are not handed out twice
+    assert claim_jobs(5, 'worker-2') == ids[2:]
+    assert claim_jobs(5, 'worker-3') == []
+
+def test_claim_respects_concurrency(queue):
+    first, second = enqueue('test.flaky', {'succeed_on': 1})[0], enqueue('test.flaky', {'succeed_on': 1})[0]
+    assert claim_jobs(5, 'worker-1') == [first.id]
+    assert claim_jobs(5, 'worker-2') == []
+
+    assert run_job(first.id) == 'succeeded'
+    assert claim_jobs(5, 'worker-2') == [second.id]
+
+def test_failed_attempt_is_retried_after_a_delay(queue):
+    queued, _ = enqueue('test.flaky', {'succeed_on': 2})
+    claim_jobs(1, 'worker-1')
+    assert run_job(queued.id) == 'queued'
+
+    failed = job(queued.id)
+    assert (failed.attempts, failed.worker) == (1, None)
+    assert failed.error == 'RuntimeError: attempt 1 failed'
+    assert failed.run_after > datetime.utcnow()
+    # Not due until the retry delay has passed
+    assert claim_jobs(1, 'worker-1') == []
+
+    make_due(queued.id)
+    assert claim_jobs(1, 'worker-1') == [queued.id]
+    assert run_job(queued.id) == 'succeeded'
+    done = job(queued.id)
+    assert (done.attempts, done.error, done.result) == (2, None, '{"attempt": 2}')
+
+def test_job_fails_once_out_of_attempts(queue):
+    queued, _ = enqueue('test.flaky', {'succeed_on': 10})
+    outcomes = []
+    for _ in range(3):
+        make_due(queued.id)
+        assert claim_jobs(1, 'worker-1') == [queued.id]
+        outcomes.append(run_job(queued.id))
+    assert outcomes == ['queued', 'queued', 'failed']
+    assert (job(queued.id).attempts, job(queued.id).finished_at is not None) == (3, True)
+    make_due(queued.id)
+    assert claim_jobs(1, 'worker-1') == []
+
+def test_job_error_is_not_retried(queue):
+    queued, _ = enqueue('test.broken')
+    claim_jobs(1, 'worker-1')
+    assert run_job(queued.id) == 'failed'
+    assert (job(queued.id).attempts, job(queued.id).error) == (1, 'JobError: cannot be retried')
+
+def test_stale_job_goes_back_to_the_queue(queue):
+    queued, _ = enqueue('test.echo')
+    claim_jobs(1, 'worker-1')
+    assert requeue_stale(60) == []
+
+    Job.query.filter_by(id=queued.id).update({'heartbeat_at': datetime.utcnow() - timedelta(minutes=5)})
+    db.session.commit()
+    assert requeue_stale(60) == [queued.id]
+    assert (job(queued.id).status, job(queued.id).error) == ('queued', 'Worker stopped responding')
+    # A job that was given back cannot be finished by its old worker
+    assert run_job(queued.id) is None
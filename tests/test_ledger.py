@@ -0,0 +1,67 @@
+from datetime import datetime, timedelta
+from extensions import db
+from inventory import decrement_stock, increment_stock, run_with_lock_retry
+from ledger import compact_movements, ledger_drift, stock_at
+from models import Medicine, StockMovement
+
+def backdate(medicine, start, step):
+    """Spread a medicine's movements out in time, oldest first; returns their (time, quantity)"""
+    movements = db.session.query(StockMovement) \
+        .filter(StockMovement.medicine_id == medicine.id).order_by(StockMovement.id).all()
+    for i, movement in enumerate(movements):
+        movement.created_at = start + i * step
+    db.session.commit()
+    return [(movement.created_at, movement.quantity) for movement in movements]
+
+def replay(timeline, when):
+    return sum(quantity for created_at, quantity in timeline if created_at <= when)
+
+def sample_times(timeline):
+    # Each movement, just before it and just after it
+    for created_at, _ in timeline:
+        yield from (created_at - timedelta(minutes=1), created_at, created_at + timedelta(minutes=1))
+
+def record_history(medicine):
+    for change in (-3, 5, -4, -1, 7, -2):
+        if change < 0:
+            run_with_lock_retry(lambda: decrement_stock(medicine.id, -change))
+        else:
+            run_with_lock_retry(lambda: increment_stock(medicine.id, change))
+
+def test_stock_at_matches_a_replay_of_the_ledger(make_medicine):
+    medicine = make_medicine(10)
+    record_history(medicine)
+    timeline = backdate(medicine, datetime.utcnow() - timedelta(days=20), timedelta(days=1))
+
+    for when in sample_times(timeline):
+        assert stock_at(medicine.id, when) == replay(timeline, when), when
+
+def test_stock_at_after_compaction(make_medicine):
+    medicine = make_medicine(10)
+    record_history(medicine)
+    start = datetime.utcnow() - timedelta(days=400)
+    timeline = backdate(medicine, start, timedelta(days=1))
+    cutoff = start + timedelta(days=3, hours=12)
+
+    snapshots, deleted = compact_movements(cutoff)
+    assert snapshots >= 1 and deleted >= 4
+    folded_until = timeline[3][0]
+
+    for when in sample_times(timeline):
+        expected = replay(timeline, when) if when >= folded_until else None
+        assert stock_at(medicine.id, when) == expected, when
+    assert stock_at(medicine.id, datetime.utcnow()) == db.session.get(Medicine, medicine.id).stock_quantity
+    assert medicine.id not in [row[0] for row in ledger_drift()]
+
+def test_deleted_medicine_keeps_its_ledger(make_medicine):
+    medicine = make_medicine(6)
+    medicine_id = medicine.id
+    run_with_lock_retry(lambda: decrement_stock(medicine_id, 2))
+    before = datetime.utcnow()
+
+    db.session.delete(medicine)
+    db.session.commit()
+
+    assert stock_at(medicine_id, before) == 4
+    assert stock_at(medicine_id, datetime.utcnow()) == 0
+    assert stock_at(10 ** 9, datetime.utcnow()) is None
@@ -0,0 +1,48 @@
+import re
+import pytest
+from tests.queries import assert_list_route_queries
+
+# Maximum number of SQL statements each list route may issue for one page,
+# including the user lookup done by Flask-Login, once the list total is in
+# the count cache (see pagination.approximate_count). The medicine list also
+# reads the catalog versions for its cached category filter.
+LIST_QUERY_BUDGETS = {
+    'main.medicines': 3,
+    'main.customers': 2,
+    'main.employees': 2,
+    'main.prescriptions': 2,
+    'main.sales': 2,
+}
+
+# The same with empty caches. Each list also works out its total: the
+# planner estimate (two statements) or a COUNT(*) for a filtered list. The
+# medicine list also loads its categories, and a search first checks for
+# the full-text index.
+COLD_LIST_QUERY_BUDGETS = {
+    'main.medicines': 6,
+    'main.customers': 4,
+    'main.employees': 4,
+    'main.prescriptions': 4,
+    'main.sales': 4,
+}
+
+def budget(endpoint, cold):
+    return (COLD_LIST_QUERY_BUDGETS if cold else LIST_QUERY_BUDGETS)[endpoint]
+
+@pytest.mark.parametrize('cold', [False, True], ids=['warm', 'cold'])
+@pytest.mark.parametrize('endpoint', sorted(LIST_QUERY_BUDGETS))
+def test_list_route_query_budget(client, endpoint, cold):
+    assert_list_route_queries(client, endpoint, budget(endpoint, cold), cold=cold)
+
+@pytest.mark.parametrize('cold', [False, True], ids=['warm', 'cold'])
+@pytest.mark.parametrize('endpoint', sorted(LIST_QUERY_BUDGETS))
+def test_search_query_budget(client, endpoint, cold):
+    assert_list_route_queries(client, endpoint, budget(endpoint, cold), cold=cold, search='a')
+
+@pytest.mark.parametrize('cold', [False, True], ids=['warm', 'cold'])
+@pytest.mark.parametrize('endpoint', sorted(LIST_QUERY_BUDGETS))
+def test_next_page_query_budget(client, endpoint, cold):
+    first_page = client.get(f"/{endpoint.split('.')[1]}").get_data(as_text=True)
+    cursor = re.search(r'cursor=([\w-]+)', first_page)
+    assert cursor, 'the first page links to no next page'
+    assert_list_route_queries(client, endpoint, budget(endpoint, cold), cold=cold, cursor=cursor.group(1))
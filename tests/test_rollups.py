@@ -0,0 +1,100 @@
+from datetime import date
+import pytest
+from extensions import db
+from inventory import run_with_lock_retry
+from models import Customer, Employee, Sale, SalesDailyCategory, SalesDailyEmployee, SalesDailyMedicine
+from rollups import DIMENSIONS, apply_sale, backfill
+from sales import create_itemised_sale
+
+ROLLUPS = (SalesDailyMedicine, SalesDailyEmployee, SalesDailyCategory)
+
+@pytest.fixture
+def buyer(app_context):
+    return db.session.query(Customer.id).first()[0], db.session.query(Employee.id).first()[0]
+
+def rollup_rows(day=None):
+    rows = {}
+    for model, key in DIMENSIONS.values():
+        query = db.session.query(model)
+        if day is not None:
+            query = query.filter(model.day == day)
+        for row in query:
+            rows[(model.__tablename__, row.day, getattr(row, key))] = \
+                (row.sale_count, row.units, round(row.revenue, 2))
+    return rows
+
+def reverse(sale_id):
+    run_with_lock_retry(lambda: apply_sale(sale_id, sign=-1))
+
+def delete_sale(client, sale_id):
+    # The route takes the sale out of the rollups before deleting it
+    assert client.post(f'/sales/{sale_id}/delete').status_code == 302
+    db.session.expire_all()
+    assert db.session.get(Sale, sale_id) is None
+
+def test_sale_is_rolled_up_on_every_dimension(make_medicine, buyer):
+    day = date(2099, 1, 1)
+    medicine = make_medicine(10, price=2.0, category='Rollup A')
+    sale_id = run_with_lock_retry(lambda: create_itemised_sale(*buyer, [(medicine.id, 3)], sale_date=day)).id
+
+    assert rollup_rows(day) == {
+        ('sales_daily_medicine', day, medicine.id): (1, 3, 6.0),
+        ('sales_daily_employee', day, buyer[1]): (1, 3, 6.0),
+        ('sales_daily_category', day, 'Rollup A'): (1, 3, 6.0),
+    }
+    assert db.session.get(Sale, sale_id).items[0].category == 'Rollup A'
+
+def test_deleting_a_sale_undoes_it_and_deletes_emptied_rows(client, make_medicine, buyer):
+    day = date(2099, 1, 2)
+    first, second = make_medicine(10, price=2.0, category='Rollup B'), make_medicine(10, price=5.0)
+    kept = run_with_lock_retry(lambda: create_itemised_sale(*buyer, [(first.id, 1)], sale_date=day)).id
+    before = rollup_rows(day)
+
+    sale_id = run_with_lock_retry(
+        lambda: create_itemised_sale(*buyer, [(first.id, 2), (second.id, 1)], sale_date=day)).id
+    assert rollup_rows(day)[('sales_daily_medicine', day, first.id)] == (2, 3, 6.0)
+    assert rollup_rows(day)[('sales_daily_employee', day, buyer[1])] == (2, 4, 11.0)
+
+    delete_sale(client, sale_id)
+    # Rows the sale created were emptied to sale_count 0 and deleted
+    assert rollup_rows(day) == before
+    assert ('sales_daily_medicine', day, second.id) not in rollup_rows(day)
+
+    delete_sale(client, kept)
+    assert rollup_rows(day) == {}
+
+def test_reversal_uses_the_category_the_sale_was_rolled_up_under(client, make_medicine, buyer):
+    day = date(2099, 1, 3)
+    medicine = make_medicine(10, price=1.0, category='Rollup C')
+    sale_id = run_with_lock_retry(lambda: create_itemised_sale(*buyer, [(medicine.id, 2)], sale_date=day)).id
+
+    medicine.category = 'Rollup D'
+    db.session.commit()
+    delete_sale(client, sale_id)
+
+    assert rollup_rows(day) == {}
+
+def test_apply_and_reverse_are_symmetric(client, make_medicine, buyer):
+    day = date(2099, 1, 4)
+    medicine = make_medicine(10, price=3.0, category='Rollup E')
+    sale_id = run_with_lock_retry(lambda: create_itemised_sale(*buyer, [(medicine.id, 1)], sale_date=day)).id
+
+    run_with_lock_retry(lambda: apply_sale(sale_id))
+    assert rollup_rows(day)[('sales_daily_category', day, 'Rollup E')] == (2, 2, 6.0)
+    reverse(sale_id)
+    assert rollup_rows(day)[('sales_daily_category', day, 'Rollup E')] == (1, 1, 3.0)
+    delete_sale(client, sale_id)
+    assert rollup_rows(day) == {}
+
+def test_backfill_agrees_with_incremental_updates(make_medicine, buyer):
+    day = date(2099, 1, 5)
+    medicine = make_medicine(10, price=4.0, category='Rollup F')
+    run_with_lock_retry(lambda: create_itemised_sale(*buyer, [(medicine.id, 2)], sale_date=day))
+    medicine.category = 'Rollup G'
+    db.session.commit()
+    incremental = rollup_rows()
+
+    backfill(chunk_size=100)
+
+    assert rollup_rows() == incremental
+    assert ('sales_daily_category', day, 'Rollup F') in incremental
@@ -1,4 +1,13 @@
-from app import app
+from app import create_app
+from template_cache import precompile_templates
+
+# Importing this module builds the app without touching the database,
+# so gunicorn can load it once in the master with --preload
+app = create_app()
+
+# Compile every template now, in the master under --preload, instead of on
+# the first request for each template in every worker
+precompile_templates(app)
 
 if __name__ == "__main__":
     app.run() 
\ No newline at end of file